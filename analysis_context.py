@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+检测上下文模块
+一次解码、一次生成检测图（规则模板的画布尺寸，默认 300x200），供检测、去水印和修复策略共用
+"""
+
+import numpy as np
+from analysis_decode import (
+    ANALYSIS_RECHECK_SLACK, ANALYSIS_RECHECK_TOLERANCE, make_analysis_proxy, open_image, will_reduce
+)
+from compliance_engine import analyze_pixels, near_threshold
+from content_bounds import alpha_bounds
+from image_fixer import remove_watermark
+from metrics import stage
+from rule_profiles import get_profile
+
+
+class AnalysisContext:
+    """
+    单张图片的检测上下文
+
+    属性:
+        image: 解码后的原图（原始尺寸）
+        meta: 原图信息（format / mode / width / height）
+        profile: 规则模板（RuleProfile）
+        proxy: 画布尺寸的 RGBA 检测图（首次访问时生成）
+        alpha: 检测图的 alpha 通道数组
+    """
+
+    def __init__(self, image_data, profile=None):
+        # 像素数超过上限时在解码前抛出 ImageTooLarge
+        img = open_image(image_data)
+        self.meta = {
+            'format': img.format,
+            'mode': img.mode,
+            'width': img.size[0],
+            'height': img.size[1],
+        }
+        with stage('decode'):
+            img.load()
+        self.image = img
+        self.profile = profile or get_profile()
+        self._proxy = None
+        self._analysis = None
+
+    @property
+    def original_size(self):
+        return self.meta['width'], self.meta['height']
+
+    @property
+    def proxy(self):
+        if self._proxy is None:
+            with stage('resize'):
+                self._proxy = make_analysis_proxy(self.image, self.profile.canvas)
+        return self._proxy
+
+    @property
+    def alpha(self):
+        return np.asarray(self.proxy.getchannel('A'))
+
+    def analysis(self):
+        """
+        检测图的规范分析结果（首次调用时计算）
+        检测图由预缩小的原图生成且结果接近判定阈值时，改用原图直接缩放的检测图，结论与完整解码一致
+
+        Returns:
+            dict: 见 compliance_engine.analyze_pixels
+        """
+        if self._analysis is None:
+            pixels = np.asarray(self.proxy)
+            if will_reduce(self.image, self.profile.canvas) and near_threshold(
+                    pixels, self.profile, ANALYSIS_RECHECK_TOLERANCE, ANALYSIS_RECHECK_SLACK):
+                with stage('resize'):
+                    self._proxy = make_analysis_proxy(self.image, self.profile.canvas, margin=0)
+                pixels = np.asarray(self._proxy)
+            with stage('analysis'):
+                self._analysis = analyze_pixels(pixels, self.profile)
+        return self._analysis
+
+    def content_bounds(self):
+        """有内容像素（默认 alpha > 10）的边界框，没有内容时返回 None"""
+        return alpha_bounds(self.alpha, self.profile.visible_alpha)
+
+    def car_bounds(self):
+        """排除水印后不透明像素（默认 alpha > 200）的车图边界框，没有内容时返回 None"""
+        alpha = self.alpha
+        return alpha_bounds(alpha, self.profile.opaque_alpha, exclude=self.profile.car_watermark_mask(alpha))
+
+    def remove_watermark(self):
+        """
+        去除原图上的水印，检测图在下次访问时由去除后的原图重新生成
+
+        只在检测到水印时调用（很少见），多一次缩放换取与"原图去除后再缩放"完全一致的修复结果。
+        """
+        with stage('watermark'):
+            self.image = remove_watermark(self.image, profile=self.profile)
+        self._proxy = None
+        self._analysis = None
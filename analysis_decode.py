@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+检测用快速解码模块
+大图先降分辨率解码（JPEG DCT 缩放 / Image.reduce 整数倍缩小），再 LANCZOS 缩放到 300x200
+
+精度说明（对比完整解码 + 直接 LANCZOS 缩放）：
+    中间图像至少保留目标尺寸的 ANALYSIS_REDUCE_MARGIN 倍（默认 2 倍，即 600x400）。
+    差异只出现在内容边缘的抗锯齿像素上：alpha > 10 / alpha > 200 的边界框
+    与完整解码相差不超过 1 像素；越界像素数、水印像素数随边缘像素变化，通常相差几个百分点
+    （合成图片上最多约 7%，像素数只有二十个左右时可能相差 5 个），越界样本坐标也可能不同。
+    结果接近判定阈值时（compliance_engine.near_threshold：边界框差 1 像素或水印像素数差
+    ANALYSIS_RECHECK_TOLERANCE 比例就可能改变结论）由调用方改用完整解码复核，结论与完整解码一致。
+    尺寸不超过 margin 倍目标尺寸的图片、P/1/I 等模式的图片不做预缩小，结果与原路径完全一致。
+    ANALYSIS_REDUCE_MARGIN=0 时关闭快速路径。
+
+像素数上限（MAX_IMAGE_PIXELS，默认 5000 万）：打开图片时只读取文件头，超过上限的图片在解码前拒绝，
+避免构造的 PNG / TIFF 等解压后占满内存；Pillow 自身的解压炸弹上限同步设置为该值。
+MAX_IMAGE_PIXELS=0 时只使用 Pillow 默认的上限。
+"""
+
+import os
+from io import BytesIO
+from PIL import Image
+
+ANALYSIS_SIZE = (300, 200)
+ANALYSIS_REDUCE_MARGIN = int(os.environ.get('ANALYSIS_REDUCE_MARGIN', '2'))
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', str(50_000_000)))
+# 水印像素数与阈值相差不超过该比例时视为接近阈值，需要完整解码复核
+ANALYSIS_RECHECK_TOLERANCE = float(os.environ.get('ANALYSIS_RECHECK_TOLERANCE', '0.25'))
+# 边界框的误差范围（像素）
+ANALYSIS_RECHECK_SLACK = 1
+
+if MAX_IMAGE_PIXELS:
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Image.reduce 按通道平均，调色板等模式不能直接平均
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+
+class ImageTooLarge(ValueError):
+    """图片像素数超过 MAX_IMAGE_PIXELS（根据文件头判断，未解码）"""
+
+
+def open_image(image_data, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    打开图片（只读取文件头，不解码像素），像素数超过上限时拒绝
+
+    Args:
+        image_data: 图片字节
+        max_pixels: 像素数上限，0 表示不检查
+
+    Returns:
+        PIL Image对象（尚未解码）
+
+    Raises:
+        ImageTooLarge: 像素数超过上限
+    """
+    try:
+        img = Image.open(BytesIO(image_data))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(f'图片像素过多，超过上限 {Image.MAX_IMAGE_PIXELS} 像素') from e
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        img.close()
+        raise ImageTooLarge(f'图片像素过多（{width}x{height}），超过上限 {max_pixels} 像素')
+    return img
+
+
+def reduce_factor(size, target=ANALYSIS_SIZE, margin=ANALYSIS_REDUCE_MARGIN):
+    """
+    计算预缩小的整数倍数（缩小后仍不小于 margin 倍目标尺寸）
+
+    Returns:
+        int: 缩小倍数，1 表示不缩小
+    """
+    if margin <= 0:
+        return 1
+    width, height = size
+    return max(1, min(width // (target[0] * margin), height // (target[1] * margin)))
+
+
+def will_reduce(img, target=ANALYSIS_SIZE, margin=ANALYSIS_REDUCE_MARGIN):
+    """已解码的图片是否会被 reduce_for_analysis 预缩小"""
+    return reduce_factor(img.size, target, margin) >= 2 and img.mode in REDUCIBLE_MODES
+
+
+def reduce_for_analysis(img, target=ANALYSIS_SIZE, margin=ANALYSIS_REDUCE_MARGIN):
+    """
+    对已解码的大图做整数倍预缩小
+
+    Args:
+        img: PIL Image对象
+        target: 最终检测尺寸
+        margin: 中间图像至少保留的目标尺寸倍数
+
+    Returns:
+        PIL Image对象（可能是原对象）
+    """
+    if will_reduce(img, target, margin):
+        return img.reduce(reduce_factor(img.size, target, margin))
+    return img
+
+
+def open_for_analysis(image_data, target=ANALYSIS_SIZE, margin=ANALYSIS_REDUCE_MARGIN):
+    """
+    打开图片用于检测：JPEG 按最接近的 DCT 缩放比例解码，其他格式解码后整数倍预缩小
+
+    Args:
+        image_data: 图片字节
+        target: 最终检测尺寸
+        margin: 中间图像至少保留的目标尺寸倍数
+
+    Returns:
+        tuple: (img, meta)，meta 包含原图的 format / mode / width / height，
+               以及是否降分辨率解码 reduced
+
+    Raises:
+        ImageTooLarge: 像素数超过 MAX_IMAGE_PIXELS
+    """
+    img = open_image(image_data)
+    meta = {
+        'format': img.format,
+        'mode': img.mode,
+        'width': img.size[0],
+        'height': img.size[1],
+    }
+
+    if img.size != target and margin > 0:
+        if img.format == 'JPEG':
+            img.draft(None, (target[0] * margin, target[1] * margin))
+        img = reduce_for_analysis(img, target, margin)
+
+    meta['reduced'] = img.size != (meta['width'], meta['height'])
+    return img, meta
+
+
+def make_analysis_proxy(img, target=ANALYSIS_SIZE, margin=ANALYSIS_REDUCE_MARGIN):
+    """
+    由原图生成 300x200 的 RGBA 检测图（先整数倍预缩小，再 LANCZOS 缩放）
+
+    Args:
+        img: PIL Image对象（原始尺寸）
+
+    Returns:
+        PIL Image对象（RGBA，目标尺寸）
+    """
+    proxy = reduce_for_analysis(img, target, margin).resize(target, Image.Resampling.LANCZOS)
+    if proxy.mode != 'RGBA':
+        proxy = proxy.convert('RGBA')
+    return proxy
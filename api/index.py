@@ -3,16 +3,20 @@
 图片规范检测工具 - Vercel Serverless 版本
 """
 
-from flask import Flask, render_template, request, jsonify
-from PIL import Image, ImageDraw
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, stream_with_context
+from PIL import Image
 import os
 import sys
+import json
+import time
+import threading
 import base64
 from io import BytesIO
 import traceback
-import pandas as pd
+import numpy as np
 import requests
 from urllib.parse import urlparse
+from concurrent.futures import Future
 
 # Add parent directory to path to import image_fixer
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -25,96 +29,321 @@ from image_fixer import (
     sanitize_filename,
     get_fix_description
 )
+import cpu_pool
+import metrics
+from analysis_context import AnalysisContext
+from analysis_decode import (
+    ANALYSIS_RECHECK_SLACK, ANALYSIS_RECHECK_TOLERANCE, ANALYSIS_REDUCE_MARGIN, open_for_analysis, open_image
+)
+from batch_dedup import iter_deduplicated, new_savings
+from compliance_engine import OUT_OF_BOUNDS, TOO_SMALL, WATERMARK, analyze_pixels, near_threshold, quick_verdict
+from downloader import fetch, iter_downloads
+from fetch_cache import CACHE_ERRORS, content_digest, get_fetch_cache
+from fetch_scheduler import host_stats
+from image_probe import FAILED, ProbeRejected, iter_probed_downloads, iter_probes
+from job_queue import CANCELLED, JobWorker, get_job_queue
+from manifest_reader import ManifestError, open_manifest
+from metrics import stage
+from preview import apply_overlay, border_overlay, encode_preview, encode_preview_bytes, preview_settings, template_data_uri
+from resource_store import ResourceStore
+from rule_profiles import UnknownProfile, get_profile, list_profiles, safe_area_key
+from verdict_cache import VerdictCache, content_key, rules_fingerprint
+from zip_stream import iter_zip, unique_name
 
 app = Flask(__name__, template_folder='../templates')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 最大 16MB
 
-# 安全区域配置
-SAFE_AREA = {
-    'left': 14,
-    'right': 285,
-    'top': 24,
-    'bottom': 175
-}
+# Serverless 实例内存小、空闲时会被冻结，Web 入口默认在请求线程内检测；设置 CPU_WORKERS 后启用 CPU 进程池
+if 'CPU_WORKERS' not in os.environ:
+    cpu_pool.configure(0)
+
+
+def compact_check_result(result):
+    """
+    检测结果写入磁盘缓存前去掉预览图（命中磁盘缓存时重新生成，见 submit_compliance_check）
+    """
+    info = {key: value for key, value in result['info'].items() if key != 'resized_image'}
+    return {**result, 'info': info}
+
 
+# 检测结果缓存（键 = 图片内容哈希 + 规则模板指纹 + 预览图编码参数）；磁盘层只保存检测结论
+verdict_cache = VerdictCache(compact=compact_check_result)
 
-def generate_template_image():
+# 临时资源存储（response_mode=resource）
+RESOURCE_URL_PREFIX = '/resource/'
+resource_store = ResourceStore()
+
+
+def generate_template_image(profile=None):
     """
-    生成模板图片：300x200，带红色边框标识安全区域
+    模板图片：画布尺寸（默认 300x200），带红色边框标识安全区域（按安全区域缓存）
     """
-    # 创建白色背景图片
-    img = Image.new('RGB', (300, 200), (255, 255, 255))
-    draw = ImageDraw.Draw(img)
+    profile = profile or get_profile()
+    return template_data_uri(safe_area_key(profile.safe_area), profile.canvas)
 
-    # 红色
-    red_color = (232, 115, 107)
 
-    # 绘制红色边框区域
-    # 上边框
-    draw.rectangle([0, 0, 299, SAFE_AREA['top']-1], fill=red_color)
-    # 下边框
-    draw.rectangle([0, SAFE_AREA['bottom']+1, 299, 199], fill=red_color)
-    # 左边框
-    draw.rectangle([0, SAFE_AREA['top'], SAFE_AREA['left']-1, SAFE_AREA['bottom']], fill=red_color)
-    # 右边框
-    draw.rectangle([SAFE_AREA['right']+1, SAFE_AREA['top'], 299, SAFE_AREA['bottom']], fill=red_color)
+def add_template_border(img, profile=None):
+    """
+    给预览图添加红色边框和绿色边界线（叠加层按安全区域缓存，只绘制一次）
+    """
+    profile = profile or get_profile()
+    return apply_overlay(img, border_overlay(safe_area_key(profile.safe_area), profile.canvas))
+
+
+def request_option(name):
+    """
+    读取请求参数：依次查找 query string、表单和 JSON 请求体
+    """
+    value = request.values.get(name)
+    if value is None and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            value = data.get(name)
+    return value
 
-    # 转换为 base64
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
 
-    return f"data:image/png;base64,{img_str}"
+def flag_option(name):
+    """
+    读取开关型请求参数（1 / true / yes 为开启）
+    """
+    return str(request_option(name) or '').lower() in ('1', 'true', 'yes')
 
 
-def add_template_border(img):
+def request_profile():
     """
-    给预览图添加红色边框和绿色边界线
+    读取请求中的规则模板（profile 参数，默认 default）
+
+    Raises:
+        UnknownProfile: 模板不存在或参数不是字符串（返回 400）
     """
-    preview_img = img.copy().convert('RGBA')
+    name = request_option('profile')
+    if name is not None and not isinstance(name, str):
+        raise UnknownProfile(f'规则模板参数应为模板名字符串: {json.dumps(name, ensure_ascii=False)}')
+    return get_profile(name)
 
-    # 创建红色边框叠加层
-    overlay = Image.new('RGBA', (300, 200), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(overlay)
 
-    # 绘制红色边框区域（半透明红色）
-    red_color = (232, 115, 107, 120)
+@app.errorhandler(UnknownProfile)
+def _unknown_profile(e):
+    return jsonify({'error': str(e)}), 400
+
+
+def preview_options():
+    """
+    读取请求中的预览图编码参数：preview_format（png/webp/jpeg）和 preview_quality
 
-    # 上边框
-    draw.rectangle([0, 0, 299, SAFE_AREA['top']-1], fill=red_color)
-    # 下边框
-    draw.rectangle([0, SAFE_AREA['bottom']+1, 299, 199], fill=red_color)
-    # 左边框
-    draw.rectangle([0, SAFE_AREA['top'], SAFE_AREA['left']-1, SAFE_AREA['bottom']], fill=red_color)
-    # 右边框
-    draw.rectangle([SAFE_AREA['right']+1, SAFE_AREA['top'], 299, SAFE_AREA['bottom']], fill=red_color)
+    Returns:
+        tuple: (preview_format, preview_quality)，未指定时为 None
+    """
+    return request_option('preview_format'), request_option('preview_quality')
 
-    # 绘制安全区域的绿色边界线
-    green_color = (0, 255, 0, 180)
-    # 上边界
-    draw.line([SAFE_AREA['left'], SAFE_AREA['top'], SAFE_AREA['right'], SAFE_AREA['top']],
-              fill=green_color, width=2)
-    # 下边界
-    draw.line([SAFE_AREA['left'], SAFE_AREA['bottom'], SAFE_AREA['right'], SAFE_AREA['bottom']],
-              fill=green_color, width=2)
-    # 左边界
-    draw.line([SAFE_AREA['left'], SAFE_AREA['top'], SAFE_AREA['left'], SAFE_AREA['bottom']],
-              fill=green_color, width=2)
-    # 右边界
-    draw.line([SAFE_AREA['right'], SAFE_AREA['top'], SAFE_AREA['right'], SAFE_AREA['bottom']],
-              fill=green_color, width=2)
 
-    # 叠加红色边框到预览图
-    preview_img = Image.alpha_composite(preview_img, overlay)
+def resource_mode():
+    """
+    是否使用资源模式（response_mode=resource）：图片以 /resource/<id> 链接返回，而不是 base64 data URI
+    """
+    return str(request_option('response_mode') or '').lower() == 'resource'
 
-    return preview_img
 
+def image_payload(data, mimetype, filename=None, as_resource=False):
+    """
+    将图片字节转换为响应中的图片字段
 
-def check_image_compliance(image_data):
+    Returns:
+        str: 资源模式下为 /resource/<id> 链接，否则为 data URI
     """
-    检查图片是否符合规范
-    自动将图片缩放到 300x200 后检测边界
-    返回: dict 包含检测结果和详细信息
+    if as_resource:
+        return RESOURCE_URL_PREFIX + resource_store.put(data, mimetype, filename)
+    with stage('base64'):
+        return f"data:{mimetype};base64,{base64.b64encode(data).decode()}"
+
+
+def with_timing(payload, image_size):
+    """
+    请求参数 timing=1 时，在响应中附加本次请求的耗时明细
+
+    Args:
+        payload: 响应内容（dict，原地修改）
+        image_size: 原图尺寸 (width, height)，未知时为 None
+
+    Returns:
+        payload，timing 字段包含 stages（各阶段耗时，毫秒）、elapsed_ms（到生成响应为止的请求耗时）和 image（原图尺寸）
+    """
+    trace = g.get('stage_trace')
+    if trace is None or not flag_option('timing'):
+        return payload
+    width, height = image_size or (None, None)
+    payload['timing'] = {
+        'stages': metrics.stage_breakdown(trace.stages, trace.spans),
+        'elapsed_ms': round((time.perf_counter() - g.request_started) * 1000, 1),
+        'image': {'width': width, 'height': height}
+    }
+    return payload
+
+
+def route_label():
+    """当前请求的路由规则（用作指标标签），未匹配到路由时为 unmatched"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def record_outcome(route, strategy='', compliant=None, error=None):
+    """
+    统计一张图片的处理结果（见 /metrics）
+
+    Args:
+        route: 路由规则（route_label()；后台任务为 /jobs）
+        strategy: 修复策略，检测时为空
+        compliant: 检测结论（修复时为原图的检测结论）
+        error: 失败类型 download / probe_rejected / process，成功时为 None
+    """
+    metrics.IMAGES_PROCESSED.inc(route=route, strategy=strategy)
+    if error is not None:
+        metrics.ERRORS.inc(route=route, strategy=strategy, kind=error)
+    elif compliant is not None:
+        metrics.VERDICTS.inc(route=route, strategy=strategy, verdict='compliant' if compliant else 'non_compliant')
+
+
+def check_error_kind(check_result):
+    """检测结果对应的失败类型：图片无法处理时为 process，否则为 None"""
+    return 'process' if 'exception' in check_result['info'] else None
+
+
+def checked_size(check_result):
+    """检测结果中的原图尺寸 (width, height)，图片无法解码时为 None"""
+    info = check_result['info']
+    if 'original_width' not in info:
+        return None
+    return info['original_width'], info['original_height']
+
+
+def externalize_data_uri(data_uri):
+    """
+    将 data URI 转存为临时资源，返回 /resource/<id> 链接
+    """
+    header, encoded = data_uri.split(',', 1)
+    mimetype = header[len('data:'):].split(';', 1)[0]
+    return image_payload(base64.b64decode(encoded), mimetype, as_resource=True)
+
+
+def check_image_compliance(image_data, preview_format=None, preview_quality=None, profile=None, verdict_only=False):
+    """
+    检查图片是否符合规范（带缓存）
+    图片字节和检测规则未变化时直接返回缓存的检测结果
+    profile: 规则模板（RuleProfile），默认 default
+    verdict_only: 只判定是否合规，返回精简结果（见 _check_image_compliance）
+    """
+    return submit_compliance_check(image_data, preview_format, preview_quality, profile, verdict_only).result()
+
+
+def submit_compliance_check(image_data, preview_format=None, preview_quality=None, profile=None, verdict_only=False):
+    """
+    提交检测任务（带缓存）：缓存命中时直接返回已完成的 Future，否则交给 CPU 进程池检测
+    磁盘缓存中不保存预览图，命中时在 CPU 进程池中重新生成预览图
+
+    Returns:
+        Future: 结果同 check_image_compliance；写入缓存后才会完成
+    """
+    profile = profile or get_profile()
+    if verdict_only:
+        # 快速判定不生成预览图，与预览图编码参数无关
+        settings = (None, None)
+        key = content_key(image_data, rules_fingerprint(profile.fingerprint, 'verdict_only'))
+    else:
+        settings = preview_settings(preview_format, preview_quality)
+        key = content_key(image_data, rules_fingerprint(profile.fingerprint, settings))
+
+    result = verdict_cache.get(key)
+    if result is not None:
+        if verdict_only or 'resized_image' in result['info']:
+            return cpu_pool.done_future(result)
+        return _attach_preview(result, image_data, settings, profile)
+
+    checked = Future()
+
+    def store(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            checked.set_exception(e)
+            return
+        if 'exception' not in result['info']:
+            verdict_cache.put(key, result)
+        checked.set_result(result)
+
+    # 子进程中按模板名取得模板（不传递预先计算的掩码）
+    cpu_pool.submit(_check_image_compliance, image_data, *settings, profile.name, verdict_only).add_done_callback(store)
+    return checked
+
+
+def _attach_preview(result, image_data, settings, profile):
+    """
+    为磁盘缓存命中的检测结果重新生成预览图；生成失败时返回不带预览图的结果
+
+    Returns:
+        Future: 完整的检测结果
+    """
+    checked = Future()
+
+    def attach(future):
+        try:
+            result['info']['resized_image'] = future.result()
+        except Exception:
+            pass
+        checked.set_result(result)
+
+    cpu_pool.submit(_render_preview, image_data, *settings, profile.name).add_done_callback(attach)
+    return checked
+
+
+def _canvas_image(image_data, profile, margin=ANALYSIS_REDUCE_MARGIN):
+    """
+    解码并缩放到规则模板的画布尺寸（RGBA）
+    margin: 降分辨率解码的倍数（见 analysis_decode），0 为完整解码
+
+    Returns:
+        tuple: (检测图, 原图信息)
+    """
+    # 大图降分辨率解码（JPEG DCT 缩放 / 整数倍预缩小）
+    with stage('decode'):
+        img, meta = open_for_analysis(image_data, profile.canvas, margin)
+        img.load()
+
+    with stage('resize'):
+        # 自动缩放到画布尺寸
+        if img.size != profile.canvas:
+            img = img.resize(profile.canvas, Image.Resampling.LANCZOS)
+
+        # 转换为 RGBA 模式进行像素检测
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+    return img, meta
+
+
+def _checked_canvas_image(image_data, profile):
+    """
+    检测用的画布图片：降分辨率解码的结果接近判定阈值时改用完整解码，
+    保证结论与完整解码一致（像素数量在阈值附近以外仍可能相差几个百分点）
+
+    Returns:
+        tuple: (检测图, 原图信息)
+    """
+    img, meta = _canvas_image(image_data, profile)
+    if meta['reduced'] and near_threshold(np.asarray(img), profile, ANALYSIS_RECHECK_TOLERANCE, ANALYSIS_RECHECK_SLACK):
+        img, meta = _canvas_image(image_data, profile, margin=0)
+    return img, meta
+
+
+def _render_preview(image_data, preview_format=None, preview_quality=None, profile_name=None):
+    """
+    生成检测预览图（带模板边框）的 data URI，与 _check_image_compliance 中的预览图一致
+    """
+    profile = get_profile(profile_name)
+    img, _meta = _checked_canvas_image(image_data, profile)
+    return encode_preview(add_template_border(img, profile), preview_format, preview_quality)
+
+
+def _new_check_result(meta, profile):
+    """
+    根据原图信息创建检测结果（尺寸信息和缩放提示）
     """
     result = {
         'compliant': True,
@@ -123,161 +352,127 @@ def check_image_compliance(image_data):
         'info': {}
     }
 
-    try:
-        img = Image.open(BytesIO(image_data))
-
-        # 保存原始图片信息
-        original_width, original_height = img.size
-        result['info']['format'] = img.format
-        result['info']['mode'] = img.mode
-        result['info']['original_width'] = original_width
-        result['info']['original_height'] = original_height
-
-        # 检查原始尺寸是否符合
-        if original_width != 300 or original_height != 200:
-            result['warnings'].append(f"原始图片尺寸为 {original_width}x{original_height}，已自动缩放到 300x200 进行检测")
-
-            # 自动缩放到 300x200
-            img = img.resize((300, 200), Image.Resampling.LANCZOS)
-            result['info']['resized'] = True
-        else:
-            result['info']['resized'] = False
+    # 保存原始图片信息
+    original_width, original_height = meta['width'], meta['height']
+    result['info']['format'] = meta['format']
+    result['info']['mode'] = meta['mode']
+    result['info']['original_width'] = original_width
+    result['info']['original_height'] = original_height
+
+    # 检查原始尺寸是否符合
+    canvas_width, canvas_height = profile.canvas
+    if (original_width, original_height) != profile.canvas:
+        result['warnings'].append(f"原始图片尺寸为 {original_width}x{original_height}，已自动缩放到 {canvas_width}x{canvas_height} 进行检测")
+        result['info']['resized'] = True
+    else:
+        result['info']['resized'] = False
+
+    # 检测尺寸（缩放后）
+    result['info']['width'] = canvas_width
+    result['info']['height'] = canvas_height
 
-        # 检测尺寸（缩放后）
-        width, height = img.size
-        result['info']['width'] = width
-        result['info']['height'] = height
+    return result
+
+
+def _apply_analysis(result, analysis, profile):
+    """
+    将向量化分析结果（越界、边界框、水印）写入检测结果
+    """
+    # 像素位置检查（分两层：容差内警告，容差外不通过）
+    error_count = analysis['error_count']
+    warning_count = analysis['warning_count']
+
+    if error_count:
+        result['compliant'] = False
+        result['errors'].append(f"发现 {error_count} 个像素超出安全区域（超过容差范围）")
+        result['info']['out_of_bounds_count'] = error_count
+        result['info']['out_of_bounds_samples'] = analysis['error_samples']
+
+    if warning_count and not error_count:
+        result['warnings'].append(f"有 {warning_count} 个像素轻微超出安全区域（在容差范围内，不影响通过）")
+        result['info']['out_of_bounds_warning_count'] = warning_count
+
+    # 检查图片是否过小（内容未撑满安全区域）
+    if analysis['too_small']:
+        min_x, min_y, max_x, max_y = analysis['bounds']
+        content_width = max_x - min_x + 1
+        content_height = max_y - min_y + 1
+        safe_width, safe_height = profile.safe_size
+        result['compliant'] = False
+        result['errors'].append(f"图片过小，没有撑满安全区域（车图尺寸: {content_width}x{content_height}，安全区: {safe_width}x{safe_height}）")
+        result['info']['too_small'] = True
+
+    # 检查安全区域内是否有水印（白色半透明像素）
+    watermark_count = analysis['watermark_count']
+    if watermark_count > profile.watermark_min_pixels:
+        result['compliant'] = False
+        result['errors'].append(f"安全区域有水印（检测到 {watermark_count} 个水印像素）")
+        result['info']['has_watermark'] = True
+        result['info']['watermark_pixel_count'] = watermark_count
+
+
+# 快速判定的不合规原因 -> 错误信息（不含像素数量）
+VERDICT_ERRORS = {
+    OUT_OF_BOUNDS: '有像素超出安全区域（超过容差范围）',
+    WATERMARK: '安全区域有水印',
+    TOO_SMALL: '图片过小，没有撑满安全区域',
+}
 
-        # 转换为 RGBA 模式进行像素检测
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
 
-        # 像素位置检查（分两层：容差内警告，容差外不通过）
-        tolerance = 2  # 绿线外允许 2 像素容差
-        warning_pixels = []  # 超出绿线但在容差内
-        error_pixels = []    # 超出容差范围
-
-        for y in range(height):
-            for x in range(width):
-                pixel = img.getpixel((x, y))
-                alpha = pixel[3] if len(pixel) == 4 else 255
-
-                if alpha > 10:
-                    outside_safe = (x < SAFE_AREA['left'] or x > SAFE_AREA['right'] or
-                                    y < SAFE_AREA['top'] or y > SAFE_AREA['bottom'])
-                    outside_tolerance = (x < SAFE_AREA['left'] - tolerance or x > SAFE_AREA['right'] + tolerance or
-                                         y < SAFE_AREA['top'] - tolerance or y > SAFE_AREA['bottom'] + tolerance)
-
-                    if outside_tolerance:
-                        error_pixels.append((x, y))
-                    elif outside_safe:
-                        warning_pixels.append((x, y))
-
-        if error_pixels:
-            result['compliant'] = False
-            result['errors'].append(f"发现 {len(error_pixels)} 个像素超出安全区域（超过容差范围）")
-            result['info']['out_of_bounds_count'] = len(error_pixels)
-            result['info']['out_of_bounds_samples'] = error_pixels[:10]
-
-        if warning_pixels and not error_pixels:
-            result['warnings'].append(f"有 {len(warning_pixels)} 个像素轻微超出安全区域（在容差范围内，不影响通过）")
-            result['info']['out_of_bounds_warning_count'] = len(warning_pixels)
-
-        # 检查图片是否过小（内容未撑满安全区域）
-        # 找到所有不透明像素的边界框
-        min_x, min_y, max_x, max_y = width, height, 0, 0
-        has_content = False
-        for y in range(height):
-            for x in range(width):
-                pixel = img.getpixel((x, y))
-                alpha = pixel[3] if len(pixel) == 4 else 255
-                # 只考虑不透明像素（alpha > 200）
-                if alpha > 200:
-                    has_content = True
-                    min_x = min(min_x, x)
-                    min_y = min(min_y, y)
-                    max_x = max(max_x, x)
-                    max_y = max(max_y, y)
-
-        if has_content:
-            inward_tolerance = 5  # 绿线内允许 5 像素容差
-
-            # 逐边检查：车图边缘是否撑到安全线附近（容差 2px）
-            left_ok = min_x <= SAFE_AREA['left'] + inward_tolerance
-            right_ok = max_x >= SAFE_AREA['right'] - inward_tolerance
-            top_ok = min_y <= SAFE_AREA['top'] + inward_tolerance
-            bottom_ok = max_y >= SAFE_AREA['bottom'] - inward_tolerance
-
-            # 水平或垂直至少一个方向有一边撑到位即可
-            h_ok = left_ok or right_ok
-            v_ok = top_ok or bottom_ok
-
-            if not (h_ok or v_ok):
-                content_width = max_x - min_x + 1
-                content_height = max_y - min_y + 1
-                safe_width = SAFE_AREA['right'] - SAFE_AREA['left']
-                safe_height = SAFE_AREA['bottom'] - SAFE_AREA['top']
+def check_context_compliance(ctx):
+    """
+    基于检测上下文检查原图是否符合规范（不生成预览图）
+    修复流程使用：与后续去水印、修复策略共用同一次解码和检测图
+    """
+    result = _new_check_result(ctx.meta, ctx.profile)
+    _apply_analysis(result, ctx.analysis(), ctx.profile)
+    return result
+
+
+def _check_image_compliance(image_data, preview_format=None, preview_quality=None, profile_name=None,
+                            verdict_only=False):
+    """
+    检查图片是否符合规范
+    自动将图片缩放到规则模板的画布尺寸（默认 300x200）后检测边界
+    preview_format / preview_quality: 预览图编码格式和质量（见 preview.encode_preview）
+    profile_name: 规则模板名，默认 default
+    verdict_only: 只判定是否合规（见 compliance_engine.quick_verdict）：结论与完整检测一致，
+                  但 errors 只包含最先发现的原因（不含像素数量），不返回越界样本和预览图，info 中 verdict_only 为 True
+    大图降分辨率解码（见 analysis_decode）：越界像素数、水印像素数与完整解码相比可能相差几个百分点，
+    越界样本坐标也可能不同；结果接近判定阈值时改用完整解码复核，结论与完整解码一致
+    返回: dict 包含检测结果和详细信息
+    """
+    profile = get_profile(profile_name)
+    result = {
+        'compliant': True,
+        'errors': [],
+        'warnings': [],
+        'info': {}
+    }
+
+    try:
+        img, meta = _checked_canvas_image(image_data, profile)
+        result = _new_check_result(meta, profile)
+
+        if verdict_only:
+            with stage('analysis'):
+                reason = quick_verdict(np.asarray(img), profile)
+            result['info']['verdict_only'] = True
+            if reason is not None:
                 result['compliant'] = False
-                result['errors'].append(f"图片过小，没有撑满安全区域（车图尺寸: {content_width}x{content_height}，安全区: {safe_width}x{safe_height}）")
-                result['info']['too_small'] = True
-
-        # 检查安全区域内是否有水印（白色半透明像素）
-        import numpy as np
-        px = np.array(img)
-        wm_region = px[int(height * 0.50):, int(width * 0.65):]
-        wm_alpha = wm_region[:, :, 3]
-        wm_brightness = np.mean(wm_region[:, :, :3], axis=2)
-        wm_mask = (wm_alpha > 0) & (wm_alpha < 200) & (wm_brightness > 250)
-        watermark_count = int(np.sum(wm_mask))
-
-        if watermark_count > 20:
-            result['compliant'] = False
-            result['errors'].append(f"安全区域有水印（检测到 {watermark_count} 个水印像素）")
-            result['info']['has_watermark'] = True
-            result['info']['watermark_pixel_count'] = watermark_count
+                result['errors'].append(VERDICT_ERRORS[reason])
+                result['info']['reason'] = reason
+                if reason == WATERMARK:
+                    result['info']['has_watermark'] = True
+            return result
+
+        # 一次向量化分析：越界、边界框、水印
+        with stage('analysis'):
+            _apply_analysis(result, analyze_pixels(np.asarray(img), profile), profile)
 
         # 生成带红色边框的预览图（叠加模板边框）
-        preview_img = img.copy().convert('RGBA')
-
-        # 创建红色边框叠加层
-        overlay = Image.new('RGBA', (300, 200), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
-
-        # 绘制红色边框区域（半透明红色）
-        red_color = (232, 115, 107, 120)  # 半透明红色
-
-        # 上边框
-        draw.rectangle([0, 0, 299, SAFE_AREA['top']-1], fill=red_color)
-        # 下边框
-        draw.rectangle([0, SAFE_AREA['bottom']+1, 299, 199], fill=red_color)
-        # 左边框
-        draw.rectangle([0, SAFE_AREA['top'], SAFE_AREA['left']-1, SAFE_AREA['bottom']], fill=red_color)
-        # 右边框
-        draw.rectangle([SAFE_AREA['right']+1, SAFE_AREA['top'], 299, SAFE_AREA['bottom']], fill=red_color)
-
-        # 绘制安全区域的绿色边界线
-        green_color = (0, 255, 0, 180)  # 半透明绿色
-        # 上边界
-        draw.line([SAFE_AREA['left'], SAFE_AREA['top'], SAFE_AREA['right'], SAFE_AREA['top']],
-                  fill=green_color, width=2)
-        # 下边界
-        draw.line([SAFE_AREA['left'], SAFE_AREA['bottom'], SAFE_AREA['right'], SAFE_AREA['bottom']],
-                  fill=green_color, width=2)
-        # 左边界
-        draw.line([SAFE_AREA['left'], SAFE_AREA['top'], SAFE_AREA['left'], SAFE_AREA['bottom']],
-                  fill=green_color, width=2)
-        # 右边界
-        draw.line([SAFE_AREA['right'], SAFE_AREA['top'], SAFE_AREA['right'], SAFE_AREA['bottom']],
-                  fill=green_color, width=2)
-
-        # 叠加红色边框到预览图
-        preview_img = Image.alpha_composite(preview_img, overlay)
-
-        # 保存预览图
-        buffered = BytesIO()
-        preview_img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        result['info']['resized_image'] = f"data:image/png;base64,{img_str}"
+        preview_img = add_template_border(img, profile)
+        result['info']['resized_image'] = encode_preview(preview_img, preview_format, preview_quality)
 
     except Exception as e:
         result['compliant'] = False
@@ -290,18 +485,21 @@ def check_image_compliance(image_data):
 @app.route('/')
 def index():
     """主页"""
-    return render_template('index.html', safe_area=SAFE_AREA)
+    return render_template('index.html', safe_area=request_profile().safe_area)
 
 
 @app.route('/template')
 def get_template():
-    """获取模板图片"""
+    """获取模板图片（可选参数 profile：规则模板）"""
+    profile = request_profile()
     try:
-        template_image = generate_template_image()
+        template_image = generate_template_image(profile)
         return jsonify({
             'success': True,
             'image': template_image,
-            'safe_area': SAFE_AREA
+            'profile': profile.name,
+            'canvas': list(profile.canvas),
+            'safe_area': profile.safe_area
         })
     except Exception as e:
         return jsonify({
@@ -310,11 +508,278 @@ def get_template():
         }), 500
 
 
+@app.route('/resource/<resource_id>')
+def get_resource(resource_id):
+    """
+    下载临时资源（response_mode=resource 时响应中返回的图片链接）
+    可选参数 download=1：以附件形式下载
+    """
+    item = resource_store.get(resource_id)
+    if item is None:
+        return jsonify({'error': '资源不存在或已过期'}), 404
+
+    response = send_file(
+        BytesIO(item['data']),
+        mimetype=item['mimetype'],
+        as_attachment=request.args.get('download') == '1' and bool(item['filename']),
+        download_name=item['filename'],
+        max_age=resource_store.ttl
+    )
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
+@app.route('/profiles')
+def profiles():
+    """可用的规则模板及其规则参数（画布尺寸、安全区域、容差、水印阈值）"""
+    return jsonify({
+        'success': True,
+        'default': get_profile().name,
+        'profiles': [
+            {'name': profile.name, 'description': profile.description, **profile.config()}
+            for profile in list_profiles()
+        ]
+    })
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus 文本格式的运行指标：各阶段耗时直方图、请求耗时、处理的图片数、下载字节数、检测结论和错误数
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.before_request
+def _start_request_timer():
+    # 收集本次请求各阶段耗时（CPU 进程池任务的阶段耗时随结果带回并累加）
+    g.request_started = time.perf_counter()
+    g.stage_trace = metrics.StageTrace()
+    g.stage_trace_token = metrics.activate(g.stage_trace)
+
+
+@app.after_request
+def _observe_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    metrics.REQUEST_SECONDS.observe(elapsed, route=route_label())
+
+    # 流式响应此时还没有开始处理，不返回 Server-Timing
+    trace = g.get('stage_trace')
+    if trace is not None and trace.stages and not response.is_streamed:
+        response.headers['Server-Timing'] = metrics.server_timing(trace.stages, elapsed, trace.spans)
+    return response
+
+
+@app.teardown_request
+def _stop_stage_trace(_error=None):
+    token = g.pop('stage_trace_token', None)
+    if token is not None:
+        metrics.deactivate(token)
+
+
+@app.route('/cache_stats')
+def cache_stats():
+    """获取检测结果缓存的命中统计和各图片主机的下载并发状态"""
+    return jsonify({
+        'success': True,
+        'verdict_cache': verdict_cache.snapshot(),
+        'fetch_hosts': host_stats()
+    })
+
+
+# 修复策略
+FIX_STRATEGIES = {
+    'smart_crop': smart_crop_to_safe_area,
+    'add_padding': add_padding_to_safe_area,
+    'smart_fit': smart_fit_to_safe_area
+}
+
+
+def run_fix_pipeline(ctx, strategy, original_check=None):
+    """
+    修复流程：检测原图 → 去除水印（如果检测到水印）→ 应用修复策略
+
+    Args:
+        ctx: AnalysisContext 检测上下文
+        strategy: FIX_STRATEGIES 中的策略名称
+        original_check: 可选，缓存的原图检测结果（见 submit_fix_job），传入时不再检测原图
+
+    Returns:
+        tuple: (original_check, has_watermark, fixed_img)
+    """
+    # 检测原图是否已经符合规范
+    if original_check is None:
+        original_check = check_context_compliance(ctx)
+
+    # 第一步：去除水印（如果检测到水印）
+    has_watermark = original_check['info'].get('has_watermark', False)
+    if has_watermark:
+        ctx.remove_watermark()
+
+    # 第二步：应用修复策略
+    fixed_img = FIX_STRATEGIES[strategy](ctx.image, proxy=ctx.proxy, profile=ctx.profile)
+
+    return original_check, has_watermark, fixed_img
+
+
+def _bordered_preview(img, preview_format=None, preview_quality=None, profile=None):
+    """
+    生成画布尺寸（默认 300x200）带模板边框的预览图并编码
+
+    Returns:
+        tuple: (bytes, mimetype)
+    """
+    profile = profile or get_profile()
+    with stage('resize'):
+        preview_img = img.resize(profile.canvas, Image.Resampling.LANCZOS)
+        if preview_img.mode != 'RGBA':
+            preview_img = preview_img.convert('RGBA')
+    preview_img = add_template_border(preview_img, profile)
+    with stage('encode'):
+        return encode_preview_bytes(preview_img, preview_format, preview_quality)
+
+
+def _fix_image_job(image_data, strategy, preview_format=None, preview_quality=None, with_preview=True,
+                   profile_name=None, original_check=None):
+    """
+    修复任务（在 CPU 进程池中执行）：解码 → 检测 → 去水印 → 修复 → PNG 编码 → 预览图编码
+    original_check: 可选，缓存的原图检测结果，传入时跳过检测
+
+    Returns:
+        dict: original_compliant, has_watermark, original_size, fixed_png,
+              preview（(bytes, mimetype)，with_preview=False 时为 None），
+              original_check（原图检测结果，不含预览图）
+    """
+    # 只解码一次，检测、去水印、修复共用同一个检测上下文
+    ctx = AnalysisContext(image_data, get_profile(profile_name))
+
+    # 检测原图 → 去除水印（如果检测到水印）→ 应用修复策略
+    original_check, has_watermark, fixed_img = run_fix_pipeline(ctx, strategy, original_check)
+
+    # 将修复后的图片转换为PNG格式（原始尺寸）
+    fixed_buffer = BytesIO()
+    with stage('encode'):
+        fixed_img.save(fixed_buffer, format='PNG')
+
+    return {
+        'original_compliant': original_check['compliant'],
+        'original_check': original_check,
+        'has_watermark': has_watermark,
+        'original_size': list(ctx.original_size),
+        'fixed_png': fixed_buffer.getvalue(),
+        'preview': _bordered_preview(fixed_img, preview_format, preview_quality, ctx.profile) if with_preview else None
+    }
+
+
+def submit_fix_job(image_data, strategy, preview_format=None, preview_quality=None, with_preview=True,
+                   profile=None):
+    """
+    提交修复任务（带检测结果缓存）：原图的检测结果已缓存时修复任务跳过检测，
+    否则修复完成后把原图的检测结论写入缓存（与默认预览图参数的检测共用缓存键）
+
+    Returns:
+        Future: 结果见 _fix_image_job
+    """
+    profile = profile or get_profile()
+    key = content_key(image_data, rules_fingerprint(profile.fingerprint, preview_settings(None, None)))
+    cached = verdict_cache.get(key)
+    if cached is not None:
+        # 预览图与修复无关，不传给子进程
+        cached = compact_check_result(cached)
+
+    future = cpu_pool.submit(_fix_image_job, image_data, strategy, preview_format, preview_quality, with_preview,
+                             profile.name, cached)
+    if cached is None:
+        def store(done):
+            if done.exception() is None:
+                verdict_cache.put(key, done.result()['original_check'])
+        future.add_done_callback(store)
+    return future
+
+
+def _fix_response(job, strategy, download_filename, as_resource):
+    """
+    由修复任务结果构建 /fix_image、/fix_from_url 的响应
+    """
+    # 构建修复说明
+    changes = []
+    if job['has_watermark']:
+        changes.append('已去除水印')
+    changes.append('已调整内容到安全区域内')
+
+    return jsonify(with_timing({
+        'success': True,
+        'original_compliant': job['original_compliant'],
+        'fixed_image': image_payload(job['fixed_png'], 'image/png', download_filename, as_resource),
+        'preview_image': image_payload(*job['preview'], as_resource=as_resource),
+        'download_filename': download_filename,
+        'fix_info': {
+            'strategy': get_fix_description(strategy),
+            'original_size': job['original_size'],
+            'changes_made': '；'.join(changes)
+        }
+    }, job['original_size']))
+
+
+def _remove_watermark_job(image_data, preview_format=None, preview_quality=None, profile_name=None):
+    """
+    去水印任务（在 CPU 进程池中执行）
+
+    Returns:
+        dict: original_size, cleaned_png, preview（(bytes, mimetype)）
+    """
+    profile = get_profile(profile_name)
+    img = open_image(image_data)
+    original_size = list(img.size)
+    with stage('decode'):
+        img.load()
+
+    with stage('watermark'):
+        cleaned_img = remove_watermark(img, profile=profile)
+
+    cleaned_buffer = BytesIO()
+    with stage('encode'):
+        cleaned_img.save(cleaned_buffer, format='PNG')
+
+    return {
+        'original_size': original_size,
+        'cleaned_png': cleaned_buffer.getvalue(),
+        'preview': _bordered_preview(cleaned_img, preview_format, preview_quality, profile)
+    }
+
+
+def _remove_watermark_response(job, download_filename, as_resource):
+    return jsonify(with_timing({
+        'success': True,
+        'cleaned_image': image_payload(job['cleaned_png'], 'image/png', download_filename, as_resource),
+        'preview_image': image_payload(*job['preview'], as_resource=as_resource),
+        'download_filename': download_filename,
+        'original_size': job['original_size']
+    }, job['original_size']))
+
+
+def _iter_fix_jobs(urls, workers, strategy, profile=None):
+    """
+    批量修复：重复的 URL / 内容只修复一次，下载完成的图片立即提交到 CPU 进程池（不生成预览图），按清单顺序产出
+
+    Yields:
+        tuple: (idx, url, future, changed)，future 的结果见 _fix_image_job，下载失败时为下载异常
+    """
+    def start(image_data):
+        return submit_fix_job(image_data, strategy, with_preview=False, profile=profile)
+
+    return iter_deduplicated(urls, lambda unique_urls: iter_downloads(unique_urls, workers), start)
+
+
 @app.route('/fix_image', methods=['POST'])
 def fix_image():
     """
     单张图片修复
-    请求: file (图片文件), strategy (修复策略)
+    请求: file (图片文件), strategy (修复策略), profile (规则模板，可选)
     响应: {success, fixed_image, preview_image, fix_info, download_filename}
     """
     if 'file' not in request.files:
@@ -325,79 +790,25 @@ def fix_image():
         return jsonify({'error': '没有选择文件'}), 400
 
     strategy = request.form.get('strategy', 'smart_crop')
+    if strategy not in FIX_STRATEGIES:
+        return jsonify({'error': f'不支持的修复策略: {strategy}'}), 400
+    profile = request_profile()
 
     try:
-        # 读取原图
+        # 修复（解码、检测、去水印、修复、编码在 CPU 进程池中执行）
         image_data = file.read()
-        img = Image.open(BytesIO(image_data))
-
-        original_width, original_height = img.size
-
-        # 检测原图是否已经符合规范
-        original_check = check_image_compliance(image_data)
-
-        # 第一步：去除水印（如果检测到水印）
-        has_watermark = original_check['info'].get('has_watermark', False)
-        if has_watermark:
-            img = remove_watermark(img)
-
-        # 第二步：应用修复策略
-        if strategy == 'smart_crop':
-            fixed_img = smart_crop_to_safe_area(img)
-        elif strategy == 'add_padding':
-            fixed_img = add_padding_to_safe_area(img)
-        elif strategy == 'smart_fit':
-            fixed_img = smart_fit_to_safe_area(img)
-        else:
-            return jsonify({'error': f'不支持的修复策略: {strategy}'}), 400
-
-        # 将修复后的图片转换为PNG格式（原始尺寸）
-        fixed_buffer = BytesIO()
-        fixed_img.save(fixed_buffer, format='PNG')
-        fixed_buffer.seek(0)
-
-        # 生成base64编码的修复后图片（用于下载）
-        fixed_img_str = base64.b64encode(fixed_buffer.getvalue()).decode()
-        fixed_image_data = f"data:image/png;base64,{fixed_img_str}"
-
-        # 生成预览图（300x200，带红色边框）
-        preview_img = fixed_img.resize((300, 200), Image.Resampling.LANCZOS)
-        if preview_img.mode != 'RGBA':
-            preview_img = preview_img.convert('RGBA')
-
-        preview_with_border = add_template_border(preview_img)
-
-        preview_buffer = BytesIO()
-        preview_with_border.save(preview_buffer, format='PNG')
-        preview_img_str = base64.b64encode(preview_buffer.getvalue()).decode()
-        preview_image_data = f"data:image/png;base64,{preview_img_str}"
+        job = submit_fix_job(image_data, strategy, *preview_options(), profile=profile).result()
+        record_outcome(route_label(), strategy, compliant=job['original_compliant'])
 
         # 生成文件名
         original_filename = file.filename or 'image'
         name_without_ext = original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename
         download_filename = f"{sanitize_filename(name_without_ext)}_fixed.png"
 
-        # 构建修复说明
-        changes = []
-        if has_watermark:
-            changes.append('已去除水印')
-        changes.append('已调整内容到安全区域内')
-
-        # 返回结果
-        return jsonify({
-            'success': True,
-            'original_compliant': original_check['compliant'],
-            'fixed_image': fixed_image_data,
-            'preview_image': preview_image_data,
-            'download_filename': download_filename,
-            'fix_info': {
-                'strategy': get_fix_description(strategy),
-                'original_size': [original_width, original_height],
-                'changes_made': '；'.join(changes)
-            }
-        })
+        return _fix_response(job, strategy, download_filename, resource_mode())
 
     except Exception as e:
+        record_outcome(route_label(), strategy, error='process')
         return jsonify({
             'success': False,
             'error': f'修复失败: {str(e)}',
@@ -419,85 +830,32 @@ def fix_from_url():
 
     url = data['url']
     strategy = data.get('strategy', 'smart_crop')
+    if strategy not in FIX_STRATEGIES:
+        return jsonify({'error': f'不支持的修复策略: {strategy}'}), 400
+    profile = request_profile()
 
     try:
         # 下载图片
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        image_data = response.content
-
-        img = Image.open(BytesIO(image_data))
-        original_width, original_height = img.size
-
-        # 检测原图是否已经符合规范
-        original_check = check_image_compliance(image_data)
-
-        # 第一步：去除水印（如果检测到水印）
-        has_watermark = original_check['info'].get('has_watermark', False)
-        if has_watermark:
-            img = remove_watermark(img)
-
-        # 第二步：应用修复策略
-        if strategy == 'smart_crop':
-            fixed_img = smart_crop_to_safe_area(img)
-        elif strategy == 'add_padding':
-            fixed_img = add_padding_to_safe_area(img)
-        elif strategy == 'smart_fit':
-            fixed_img = smart_fit_to_safe_area(img)
-        else:
-            return jsonify({'error': f'不支持的修复策略: {strategy}'}), 400
+        image_data = fetch(url)
 
-        # 将修复后的图片转换为PNG格式（原始尺寸）
-        fixed_buffer = BytesIO()
-        fixed_img.save(fixed_buffer, format='PNG')
-        fixed_buffer.seek(0)
-
-        # 生成base64编码的修复后图片（用于下载）
-        fixed_img_str = base64.b64encode(fixed_buffer.getvalue()).decode()
-        fixed_image_data = f"data:image/png;base64,{fixed_img_str}"
-
-        # 生成预览图（300x200，带红色边框）
-        preview_img = fixed_img.resize((300, 200), Image.Resampling.LANCZOS)
-        if preview_img.mode != 'RGBA':
-            preview_img = preview_img.convert('RGBA')
-
-        preview_with_border = add_template_border(preview_img)
-
-        preview_buffer = BytesIO()
-        preview_with_border.save(preview_buffer, format='PNG')
-        preview_img_str = base64.b64encode(preview_buffer.getvalue()).decode()
-        preview_image_data = f"data:image/png;base64,{preview_img_str}"
+        # 修复（解码、检测、去水印、修复、编码在 CPU 进程池中执行）
+        job = submit_fix_job(image_data, strategy, *preview_options(), profile=profile).result()
+        record_outcome(route_label(), strategy, compliant=job['original_compliant'])
 
         # 从URL提取文件名
         filename = extract_filename_from_url(url)
         download_filename = f"{filename}.png"
 
-        # 构建修复说明
-        changes = []
-        if has_watermark:
-            changes.append('已去除水印')
-        changes.append('已调整内容到安全区域内')
-
-        # 返回结果
-        return jsonify({
-            'success': True,
-            'original_compliant': original_check['compliant'],
-            'fixed_image': fixed_image_data,
-            'preview_image': preview_image_data,
-            'download_filename': download_filename,
-            'fix_info': {
-                'strategy': get_fix_description(strategy),
-                'original_size': [original_width, original_height],
-                'changes_made': '；'.join(changes)
-            }
-        })
+        return _fix_response(job, strategy, download_filename, resource_mode())
 
     except requests.exceptions.RequestException as e:
+        record_outcome(route_label(), strategy, error='download')
         return jsonify({
             'success': False,
             'error': f'下载图片失败: {str(e)}'
         }), 500
     except Exception as e:
+        record_outcome(route_label(), strategy, error='process')
         return jsonify({
             'success': False,
             'error': f'修复失败: {str(e)}',
@@ -505,6 +863,108 @@ def fix_from_url():
         }), 500
 
 
+def _zip_items(value, strategy):
+    """
+    解析 /fix_zip 的图片列表：URL 字符串，或 {url, strategy, fixed_image}
+
+    Returns:
+        list: [{url, strategy, resource_id}]，格式不正确时返回 None
+    """
+    if not isinstance(value, list) or not value:
+        return None
+    items = []
+    for item in value:
+        if not isinstance(item, dict):
+            item = {'url': item}
+        if not item.get('url'):
+            return None
+        fixed_image = str(item.get('fixed_image') or '')
+        items.append({
+            'url': str(item['url']),
+            'strategy': item.get('strategy') or strategy,
+            # 已修复的图片（资源模式的 /resource/<id> 链接）直接打包，不再下载和修复
+            'resource_id': fixed_image[len(RESOURCE_URL_PREFIX):] if fixed_image.startswith(RESOURCE_URL_PREFIX) else None,
+        })
+    return items
+
+
+@app.route('/fix_zip', methods=['POST'])
+def fix_zip():
+    """
+    批量修复并流式打包下载
+    请求: {urls: [...], strategy} 或表单字段 urls（JSON 数组或每行一个URL）、strategy；
+         urls 的元素也可以是 {url, strategy, fixed_image}：fixed_image 为页面中已修复图片的
+         /resource/<id> 链接时直接打包该图片，链接失效或没有时按该条的 strategy 重新修复
+    响应: application/zip，每修复完一张立即写入一个条目；失败的URL记录在 failed.txt 中
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    if isinstance(data, dict):
+        urls = data.get('urls')
+        strategy = data.get('strategy', 'smart_fit')
+    else:
+        raw_urls = request.form.get('urls', '')
+        try:
+            urls = json.loads(raw_urls)
+        except ValueError:
+            urls = [line.strip() for line in raw_urls.splitlines() if line.strip()]
+        strategy = request.form.get('strategy', 'smart_fit')
+
+    items = _zip_items(urls, strategy)
+    if items is None:
+        return jsonify({'error': '缺少URL参数'}), 400
+    unsupported = next((item['strategy'] for item in items if item['strategy'] not in FIX_STRATEGIES), None)
+    if unsupported is not None:
+        return jsonify({'error': f'不支持的修复策略: {unsupported}'}), 400
+
+    workers = request_option('workers')
+    profile = request_profile()
+    route = route_label()
+
+    def entries():
+        used_names = {}
+        failed = []
+        # 已修复的图片直接写入压缩包，其余按策略分组重新修复
+        refix = {}
+        for item in items:
+            stored = resource_store.get(item['resource_id']) if item['resource_id'] else None
+            if stored is None:
+                refix.setdefault(item['strategy'], []).append(item['url'])
+                continue
+            # 资源的文件名由服务端生成（修复时的 download_filename）
+            filename = stored['filename'] or f"{extract_filename_from_url(item['url'])}.png"
+            yield unique_name(filename, used_names), stored['data']
+
+        # 下载完成的图片立即提交到 CPU 进程池，按清单顺序写入压缩包
+        for item_strategy, item_urls in refix.items():
+            for _idx, url, job, _changed in _iter_fix_jobs(item_urls, workers, item_strategy, profile):
+                try:
+                    fix = job.result()
+                except requests.exceptions.RequestException as e:
+                    record_outcome(route, item_strategy, error='download')
+                    failed.append(f'{url}\t下载图片失败: {str(e)}')
+                    continue
+                except Exception as e:
+                    record_outcome(route, item_strategy, error='process')
+                    failed.append(f'{url}\t修复失败: {str(e)}')
+                    continue
+                record_outcome(route, item_strategy, compliant=fix['original_compliant'])
+
+                filename = unique_name(f"{extract_filename_from_url(url)}.png", used_names)
+                yield filename, fix['fixed_png']
+
+        if failed:
+            yield 'failed.txt', ('\n'.join(failed) + '\n').encode('utf-8')
+
+    return Response(
+        iter_zip(entries()),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename=fixed_images_{time.strftime("%Y%m%d_%H%M%S")}.zip',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @app.route('/upload', methods=['POST'])
 def upload():
     """处理图片上传和检测"""
@@ -516,19 +976,27 @@ def upload():
     if file.filename == '':
         return jsonify({'error': '没有选择文件'}), 400
 
+    profile = request_profile()
     if file:
         try:
             # 读取图片数据
             image_data = file.read()
 
             # 检测图片
-            result = check_image_compliance(image_data)
+            result = check_image_compliance(image_data, *preview_options(), profile)
+            record_outcome(route_label(), compliant=result['compliant'], error=check_error_kind(result))
 
-            # 添加上传的图片预览
-            img_str = base64.b64encode(image_data).decode()
-            result['info']['uploaded_image'] = f"data:image/png;base64,{img_str}"
+            if resource_mode():
+                # 资源模式：预览图以链接返回，不回传原图（客户端已持有）
+                if 'resized_image' in result['info']:
+                    result['info']['resized_image'] = externalize_data_uri(result['info']['resized_image'])
+            else:
+                # 添加上传的图片预览
+                with stage('base64'):
+                    img_str = base64.b64encode(image_data).decode()
+                result['info']['uploaded_image'] = f"data:image/png;base64,{img_str}"
 
-            return jsonify(result)
+            return jsonify(with_timing(result, checked_size(result)))
         except Exception as e:
             return jsonify({
                 'error': f'处理失败: {str(e)}',
@@ -538,6 +1006,51 @@ def upload():
     return jsonify({'error': '未知错误'}), 500
 
 
+@app.route('/check_url', methods=['POST'])
+def check_url():
+    """
+    服务端下载并检测图片（替代浏览器下载后再上传）
+    请求: {url} 或 {urls: [...]}（最多 CHECK_URL_MAX_URLS 个）
+    响应: 单个 URL 时同 /upload（不回传原图）；多个 URL 时 {success, results}
+    """
+    data = request.get_json(silent=True)
+
+    if not data or ('url' not in data and 'urls' not in data):
+        return jsonify({'error': '缺少URL参数'}), 400
+
+    if 'urls' in data:
+        urls = data['urls']
+        if not isinstance(urls, list) or not urls:
+            return jsonify({'error': 'urls 必须是非空列表'}), 400
+        if len(urls) > CHECK_URL_MAX_URLS:
+            return jsonify({'error': f'一次最多检测 {CHECK_URL_MAX_URLS} 个URL，批量请使用 /batch_upload'}), 400
+
+        results = list(_iter_batch_items(urls, len(urls), batch_options()))
+        return jsonify({
+            'success': True,
+            'results': results
+        })
+
+    url = str(data['url'])
+    profile = request_profile()
+
+    try:
+        image_data = fetch(url)
+    except requests.exceptions.RequestException as e:
+        record_outcome(route_label(), error='download')
+        return jsonify({
+            'success': False,
+            'error': f'下载图片失败: {str(e)}'
+        }), 500
+
+    result = check_image_compliance(image_data, *preview_options(), profile, verdict_only=flag_option('verdict_only'))
+    record_outcome(route_label(), compliant=result['compliant'], error=check_error_kind(result))
+    if resource_mode() and 'resized_image' in result['info']:
+        result['info']['resized_image'] = externalize_data_uri(result['info']['resized_image'])
+    result['url'] = url
+    return jsonify(with_timing(result, checked_size(result)))
+
+
 @app.route('/remove_watermark', methods=['POST'])
 def remove_watermark_route():
     """
@@ -552,42 +1065,21 @@ def remove_watermark_route():
     if file.filename == '':
         return jsonify({'error': '没有选择文件'}), 400
 
+    profile = request_profile()
+
     try:
         image_data = file.read()
-        img = Image.open(BytesIO(image_data))
-        original_width, original_height = img.size
-
-        cleaned_img = remove_watermark(img)
-
-        cleaned_buffer = BytesIO()
-        cleaned_img.save(cleaned_buffer, format='PNG')
-        cleaned_buffer.seek(0)
-        cleaned_img_str = base64.b64encode(cleaned_buffer.getvalue()).decode()
-        cleaned_image_data = f"data:image/png;base64,{cleaned_img_str}"
-
-        preview_img = cleaned_img.resize((300, 200), Image.Resampling.LANCZOS)
-        if preview_img.mode != 'RGBA':
-            preview_img = preview_img.convert('RGBA')
-        preview_with_border = add_template_border(preview_img)
-
-        preview_buffer = BytesIO()
-        preview_with_border.save(preview_buffer, format='PNG')
-        preview_img_str = base64.b64encode(preview_buffer.getvalue()).decode()
-        preview_image_data = f"data:image/png;base64,{preview_img_str}"
+        job = cpu_pool.run(_remove_watermark_job, image_data, *preview_options(), profile.name)
+        record_outcome(route_label())
 
         original_filename = file.filename or 'image'
         name_without_ext = original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename
         download_filename = f"{sanitize_filename(name_without_ext)}_no_watermark.png"
 
-        return jsonify({
-            'success': True,
-            'cleaned_image': cleaned_image_data,
-            'preview_image': preview_image_data,
-            'download_filename': download_filename,
-            'original_size': [original_width, original_height]
-        })
+        return _remove_watermark_response(job, download_filename, resource_mode())
 
     except Exception as e:
+        record_outcome(route_label(), error='process')
         return jsonify({
             'success': False,
             'error': f'去除水印失败: {str(e)}',
@@ -608,50 +1100,26 @@ def remove_watermark_url_route():
         return jsonify({'error': '缺少URL参数'}), 400
 
     url = data['url']
+    profile = request_profile()
 
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        image_data = response.content
-
-        img = Image.open(BytesIO(image_data))
-        original_width, original_height = img.size
-
-        cleaned_img = remove_watermark(img)
-
-        cleaned_buffer = BytesIO()
-        cleaned_img.save(cleaned_buffer, format='PNG')
-        cleaned_buffer.seek(0)
-        cleaned_img_str = base64.b64encode(cleaned_buffer.getvalue()).decode()
-        cleaned_image_data = f"data:image/png;base64,{cleaned_img_str}"
-
-        preview_img = cleaned_img.resize((300, 200), Image.Resampling.LANCZOS)
-        if preview_img.mode != 'RGBA':
-            preview_img = preview_img.convert('RGBA')
-        preview_with_border = add_template_border(preview_img)
-
-        preview_buffer = BytesIO()
-        preview_with_border.save(preview_buffer, format='PNG')
-        preview_img_str = base64.b64encode(preview_buffer.getvalue()).decode()
-        preview_image_data = f"data:image/png;base64,{preview_img_str}"
+        image_data = fetch(url)
+        job = cpu_pool.run(_remove_watermark_job, image_data, *preview_options(), profile.name)
+        record_outcome(route_label())
 
         filename = extract_filename_from_url(url)
         download_filename = f"{filename}_no_watermark.png"
 
-        return jsonify({
-            'success': True,
-            'cleaned_image': cleaned_image_data,
-            'preview_image': preview_image_data,
-            'download_filename': download_filename,
-            'original_size': [original_width, original_height]
-        })
+        return _remove_watermark_response(job, download_filename, resource_mode())
 
     except requests.exceptions.RequestException as e:
+        record_outcome(route_label(), error='download')
         return jsonify({
             'success': False,
             'error': f'下载图片失败: {str(e)}'
         }), 500
     except Exception as e:
+        record_outcome(route_label(), error='process')
         return jsonify({
             'success': False,
             'error': f'去除水印失败: {str(e)}',
@@ -659,9 +1127,250 @@ def remove_watermark_url_route():
         }), 500
 
 
+# /check_url 单次请求最多检测的 URL 数量
+CHECK_URL_MAX_URLS = 20
+
+# 流式输出格式：NDJSON（每行一条 JSON）或 Server-Sent Events
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream'
+}
+
+
+def batch_options():
+    """
+    读取批量检测的参数（规则模板、快速判定、预览图编码、资源模式）
+
+    Returns:
+        dict: profile（模板名）, verdict_only, preview_format, preview_quality, as_resource, route（指标标签）
+    """
+    preview_format, preview_quality = preview_options()
+    return {
+        'profile': request_profile().name,
+        'verdict_only': flag_option('verdict_only'),
+        'preview_format': preview_format,
+        'preview_quality': preview_quality,
+        'as_resource': resource_mode(),
+        'route': route_label()
+    }
+
+
+def _check_batch_item(idx, url, check, changed=None, as_resource=False, route=None):
+    """
+    汇总批量清单中一张图片的检测结果
+    check: submit_compliance_check 返回的 Future（下载失败时为带异常的 Future）
+    changed: 增量模式下传入内容是否有变化；未变化的图片直接使用下载缓存中的检测结论，不返回预览图
+    as_resource: 预览图以 /resource/<id> 链接返回
+    route: 指标标签，为 None 时不统计
+    """
+    error_kind = None
+
+    result_item = {
+        'index': idx,
+        'url': url,
+        'status': 'pending'
+    }
+
+    try:
+        # 检测图片
+        check_result = check.result()
+
+        result_item['status'] = 'success'
+        result_item['compliant'] = check_result['compliant']
+        error_kind = check_error_kind(check_result)
+        result_item['errors'] = check_result['errors']
+        result_item['warnings'] = check_result['warnings']
+        result_item['info'] = {
+            'width': check_result['info'].get('width'),
+            'height': check_result['info'].get('height'),
+            'original_width': check_result['info'].get('original_width'),
+            'original_height': check_result['info'].get('original_height'),
+            'resized': check_result['info'].get('resized'),
+        }
+        if check_result['info'].get('verdict_only'):
+            # 快速判定不统计越界像素数量，只给出最先发现的不合规原因
+            result_item['info']['verdict_only'] = True
+            if 'reason' in check_result['info']:
+                result_item['info']['reason'] = check_result['info']['reason']
+        else:
+            result_item['info']['out_of_bounds_count'] = check_result['info'].get('out_of_bounds_count', 0)
+
+        # 添加缩略图（缩小版本以节省带宽）
+        if 'resized_image' in check_result['info'] and changed is not False:
+            preview = check_result['info']['resized_image']
+            result_item['preview'] = externalize_data_uri(preview) if as_resource else preview
+
+        if changed is not None:
+            result_item['changed'] = changed
+
+    except requests.exceptions.RequestException as e:
+        result_item['status'] = 'failed'
+        result_item['error'] = f'下载图片失败: {str(e)}'
+        error_kind = 'download'
+    except ProbeRejected as e:
+        result_item['status'] = 'failed'
+        result_item['error'] = f'预检未通过: {str(e)}'
+        error_kind = 'probe_rejected'
+    except Exception as e:
+        result_item['status'] = 'failed'
+        result_item['error'] = f'检测失败: {str(e)}'
+        error_kind = 'process'
+
+    if route is not None:
+        record_outcome(route, compliant=result_item.get('compliant'), error=error_kind)
+
+    return result_item
+
+
+def _store_incremental_verdict(cache, content_hash, fingerprint, result):
+    """增量模式：检测成功后把检测结论（不含预览图）保存到下载缓存"""
+    if 'exception' in result['info']:
+        return
+    try:
+        cache.store_verdict(content_hash, fingerprint, compact_check_result(result))
+    except CACHE_ERRORS:
+        pass
+
+
+def _iter_batch_items(urls, workers, options, incremental=False, savings=None, probe=False, ordered=True):
+    """
+    按清单顺序生成批量检测结果
+    重复的 URL 只下载一次，内容相同的图片只检测一次（见 batch_dedup）；
+    下载完成的图片立即提交到 CPU 进程池，窗口内的图片并行检测
+    savings: 可选，累计去重节省的下载 / 检测次数
+    probe: 先读取文件头预检（见 image_probe），超过硬性限制的图片不再下载和检测
+    ordered: False 时按完成顺序产出（结果中的 index 为行号），慢主机不会挡住后面已完成的结果
+    incremental: 内容未变化的 URL 复用下载缓存中保存的检测结论（见 FetchCache.load_verdict），不提交检测
+    """
+    profile = get_profile(options.get('profile'))
+    verdict_only = options.get('verdict_only', False)
+    # 增量模式：检测结论随下载缓存保存，内容未变化的 URL 直接复用，不再提交检测
+    cache = get_fetch_cache() if incremental else None
+    fingerprint = rules_fingerprint(profile.fingerprint, 'verdict_only' if verdict_only else 'full')
+
+    def start(image_data):
+        check = submit_compliance_check(image_data, options['preview_format'], options['preview_quality'], profile,
+                                        verdict_only)
+        if cache is None:
+            return check
+        # 结论写入下载缓存后才产出这一行，紧接着再次增量检测时能复用
+        stored = Future()
+        content_hash = content_digest(image_data)
+
+        def store(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                stored.set_exception(e)
+                return
+            _store_incremental_verdict(cache, content_hash, fingerprint, result)
+            stored.set_result(result)
+
+        check.add_done_callback(store)
+        return stored
+
+    def reuse_unchanged(image_data):
+        try:
+            verdict = cache.load_verdict(content_digest(image_data), fingerprint)
+        except CACHE_ERRORS:
+            return None
+        return cpu_pool.done_future(verdict) if verdict is not None else None
+
+    def download(unique_urls):
+        if probe:
+            return iter_probed_downloads(unique_urls, lambda passed: iter_downloads(passed, workers, ordered),
+                                         workers, ordered)
+        return iter_downloads(unique_urls, workers, ordered)
+
+    items = iter_deduplicated(urls, download, start, savings, ordered=ordered,
+                              reuse_unchanged=reuse_unchanged if cache is not None else None)
+    for idx, url, check, changed in items:
+        yield _check_batch_item(idx, url, check, changed=changed if incremental else None,
+                                as_resource=options['as_resource'], route=options.get('route'))
+
+
+def _new_batch_summary(incremental=False):
+    summary = {
+        'total': 0,
+        'success': 0,
+        'failed': 0,
+        'compliant': 0,
+        'non_compliant': 0,
+        **new_savings()
+    }
+    if incremental:
+        summary['changed'] = 0
+        summary['unchanged'] = 0
+    return summary
+
+
+def _update_batch_summary(summary, result_item):
+    summary['total'] += 1
+    if result_item['status'] == 'success':
+        summary['success'] += 1
+        if result_item['compliant']:
+            summary['compliant'] += 1
+        else:
+            summary['non_compliant'] += 1
+    else:
+        summary['failed'] += 1
+
+    if 'changed' in result_item:
+        summary['changed' if result_item['changed'] else 'unchanged'] += 1
+
+
+def _format_stream_record(record, stream_mode):
+    data = app.json.dumps(record)
+    if stream_mode == 'sse':
+        return f"event: {record['type']}\ndata: {data}\n\n"
+    return data + '\n'
+
+
+def _stream_batch_results(urls, workers, image_column, stream_mode, options, incremental, probe=False,
+                          ordered=True):
+    """
+    流式返回批量检测结果
+
+    记录依次为：start（使用的列）→ 每张图片一条 result → summary（含总数）。
+    表格边读取边检测，已输出的结果不在服务端保留，内存占用与清单长度无关。
+    默认按表格顺序输出，某一行下载很慢时后面已完成的结果要等它完成；
+    ordered=False 时按完成顺序输出，客户端按 result 中的 index（行号）对应表格行。
+    """
+    def generate():
+        summary = _new_batch_summary(incremental)
+        yield _format_stream_record({'type': 'start', 'total': None, 'column_used': image_column,
+                                     'order': 'input' if ordered else 'completion'}, stream_mode)
+
+        for result_item in _iter_batch_items(urls, workers, options, incremental, summary, probe, ordered):
+            _update_batch_summary(summary, result_item)
+            result_item['type'] = 'result'
+            yield _format_stream_record(result_item, stream_mode)
+
+        yield _format_stream_record({
+            'type': 'summary',
+            'success': True,
+            'summary': summary,
+            'column_used': image_column
+        }, stream_mode)
+
+    # 保持请求上下文：上传的表格在流式输出期间继续逐行读取
+    return Response(
+        stream_with_context(generate()),
+        mimetype=STREAM_FORMATS[stream_mode],
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/batch_upload', methods=['POST'])
 def batch_upload():
-    """处理批量上传：读取表格并检测多张图片"""
+    """
+    处理批量上传：读取表格并检测多张图片
+    可选参数 stream=ndjson|sse：逐张流式返回结果，最后返回汇总
+    可选参数 order=completion（仅流式模式）：按完成顺序输出结果（带行号 index），慢主机不会挡住其他结果
+    可选参数 incremental=1：只重新检测内容有变化的 URL（条件请求 + 缓存，需设置 FETCH_CACHE_DIR，未设置时返回 400）
+    可选参数 probe=1：先读取文件头预检，不是图片、像素数或文件大小超过上限的 URL 不再下载检测
+    可选参数 verdict_only=1：只判定是否合规（不统计越界像素、不返回预览图），吞吐量基本只受下载和解码限制
+    """
     if 'file' not in request.files:
         return jsonify({'error': '没有上传文件'}), 400
 
@@ -670,116 +1379,146 @@ def batch_upload():
     if file.filename == '':
         return jsonify({'error': '没有选择文件'}), 400
 
+    options = batch_options()
+
+    # 增量模式：内容未变化（304 或内容哈希相同）的 URL 直接复用下载缓存中的检测结论，不再解码检测；
+    # 没有下载缓存时无法判断内容是否变化，每行都会报告 changed=True，直接拒绝
+    incremental = flag_option('incremental')
+    if incremental and get_fetch_cache() is None:
+        return jsonify({'error': '增量模式需要下载缓存，服务端未启用（FETCH_CACHE_DIR 为空）'}), 400
+
     try:
-        # 读取表格文件
-        filename = file.filename.lower()
+        # 逐行读取表格文件中的图片URL（读到第一行即开始下载检测）
+        try:
+            image_column, image_urls = open_manifest(file.stream, file.filename)
+        except ManifestError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 并发下载（连接池复用，重复 URL 只下载一次），结果按表格顺序返回
+        workers = request_option('workers')
 
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
+        # 预检模式：只读取文件头，超过硬性限制的 URL 直接标记为失败
+        probe = flag_option('probe')
+
+        # 流式模式：每检测完一张立即输出一行结果，最后输出汇总
+        stream_mode = str(request_option('stream') or '').lower()
+        if stream_mode in STREAM_FORMATS:
+            ordered = str(request_option('order') or 'input').lower() != 'completion'
+            return _stream_batch_results(image_urls, workers, image_column, stream_mode, options, incremental, probe,
+                                         ordered)
+
+        # 批量检测
+        results = []
+        summary = _new_batch_summary(incremental)
+
+        for result_item in _iter_batch_items(image_urls, workers, options, incremental, summary, probe):
+            _update_batch_summary(summary, result_item)
+            results.append(result_item)
+
+        # 返回批量检测结果
+        return jsonify({
+            'success': True,
+            'summary': summary,
+            'column_used': image_column,
+            'results': results
+        })
+
+    except Exception as e:
+        return jsonify({
+            'error': f'处理表格失败: {str(e)}',
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+# 预检结果中保留的文件头信息
+PROBE_INFO_FIELDS = ('format', 'mode', 'width', 'height', 'file_size', 'content_type', 'ranged', 'bytes_read')
+
+
+def _iter_probe_items(urls, workers, profile=None):
+    """
+    按清单顺序生成预检结果（status 为 ok / rejected / unknown / failed，见 image_probe）
+    """
+    for idx, item in enumerate(iter_probes((str(url) for url in urls), workers, profile), 1):
+        result_item = {
+            'index': idx,
+            'url': item['url'],
+            'status': item['status'],
+            'errors': item['errors'],
+            'warnings': item['warnings']
+        }
+        if item['status'] == FAILED:
+            result_item['error'] = f"访问图片失败: {str(item['error'])}"
         else:
-            return jsonify({'error': '不支持的文件格式，请上传 CSV 或 Excel 文件'}), 400
+            result_item['info'] = {field: item[field] for field in PROBE_INFO_FIELDS}
+        yield result_item
 
-        # 查找包含图片链接的列
-        image_column = None
-        possible_columns = ['url', 'image_url', 'img_url', 'link', 'image', 'img', '图片', '图片链接', '链接']
 
-        # 首先尝试精确匹配（不区分大小写）
-        for col in df.columns:
-            if col.lower() in [pc.lower() for pc in possible_columns]:
-                image_column = col
-                break
+def _new_probe_summary():
+    return {'total': 0, 'ok': 0, 'rejected': 0, 'unknown': 0, 'failed': 0, 'bytes_read': 0}
 
-        # 如果没找到，尝试模糊匹配
-        if image_column is None:
-            for col in df.columns:
-                col_lower = col.lower()
-                if any(keyword in col_lower for keyword in ['url', 'link', 'image', 'img', '图片', '链接']):
-                    image_column = col
-                    break
-
-        # 如果还是没找到，使用第一列
-        if image_column is None:
-            if len(df.columns) > 0:
-                image_column = df.columns[0]
-            else:
-                return jsonify({'error': '表格为空或没有找到图片链接列'}), 400
 
-        # 提取图片URL列表
-        image_urls = df[image_column].dropna().tolist()
+def _update_probe_summary(summary, result_item):
+    summary['total'] += 1
+    summary[result_item['status']] += 1
+    summary['bytes_read'] += result_item.get('info', {}).get('bytes_read', 0)
 
-        if not image_urls:
-            return jsonify({'error': f'在列 "{image_column}" 中没有找到有效的图片链接'}), 400
 
-        # 批量检测
-        results = []
-        total = len(image_urls)
-        success_count = 0
-        failed_count = 0
-        compliant_count = 0
-        non_compliant_count = 0
-
-        for idx, url in enumerate(image_urls, 1):
-            result_item = {
-                'index': idx,
-                'url': str(url),
-                'status': 'pending'
-            }
+@app.route('/batch_probe', methods=['POST'])
+def batch_probe():
+    """
+    批量预检：每张图片只下载开头几 KB（支持时使用 Range 请求），读取格式、模式、尺寸和文件大小，
+    不是图片、像素数或文件大小超过上限的 URL 标记为 rejected
+    可选参数 stream=ndjson|sse：逐张流式返回结果，最后返回汇总
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': '没有上传文件'}), 400
 
-            try:
-                # 下载图片
-                response = requests.get(str(url), timeout=10)
-                response.raise_for_status()
-
-                # 检测图片
-                image_data = response.content
-                check_result = check_image_compliance(image_data)
-
-                result_item['status'] = 'success'
-                result_item['compliant'] = check_result['compliant']
-                result_item['errors'] = check_result['errors']
-                result_item['warnings'] = check_result['warnings']
-                result_item['info'] = {
-                    'width': check_result['info'].get('width'),
-                    'height': check_result['info'].get('height'),
-                    'original_width': check_result['info'].get('original_width'),
-                    'original_height': check_result['info'].get('original_height'),
-                    'resized': check_result['info'].get('resized'),
-                    'out_of_bounds_count': check_result['info'].get('out_of_bounds_count', 0)
-                }
-
-                # 添加缩略图（缩小版本以节省带宽）
-                if 'resized_image' in check_result['info']:
-                    result_item['preview'] = check_result['info']['resized_image']
-
-                success_count += 1
-                if check_result['compliant']:
-                    compliant_count += 1
-                else:
-                    non_compliant_count += 1
-
-            except requests.exceptions.RequestException as e:
-                result_item['status'] = 'failed'
-                result_item['error'] = f'下载图片失败: {str(e)}'
-                failed_count += 1
-            except Exception as e:
-                result_item['status'] = 'failed'
-                result_item['error'] = f'检测失败: {str(e)}'
-                failed_count += 1
+    file = request.files['file']
 
+    if file.filename == '':
+        return jsonify({'error': '没有选择文件'}), 400
+
+    profile = request_profile()
+
+    try:
+        try:
+            image_column, image_urls = open_manifest(file.stream, file.filename)
+        except ManifestError as e:
+            return jsonify({'error': str(e)}), 400
+
+        workers = request_option('workers')
+
+        stream_mode = str(request_option('stream') or '').lower()
+        if stream_mode in STREAM_FORMATS:
+            def generate():
+                summary = _new_probe_summary()
+                yield _format_stream_record({'type': 'start', 'total': None, 'column_used': image_column}, stream_mode)
+                for result_item in _iter_probe_items(image_urls, workers, profile):
+                    _update_probe_summary(summary, result_item)
+                    result_item['type'] = 'result'
+                    yield _format_stream_record(result_item, stream_mode)
+                yield _format_stream_record({
+                    'type': 'summary',
+                    'success': True,
+                    'summary': summary,
+                    'column_used': image_column
+                }, stream_mode)
+
+            return Response(
+                stream_with_context(generate()),
+                mimetype=STREAM_FORMATS[stream_mode],
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        results = []
+        summary = _new_probe_summary()
+        for result_item in _iter_probe_items(image_urls, workers, profile):
+            _update_probe_summary(summary, result_item)
             results.append(result_item)
 
-        # 返回批量检测结果
         return jsonify({
             'success': True,
-            'summary': {
-                'total': total,
-                'success': success_count,
-                'failed': failed_count,
-                'compliant': compliant_count,
-                'non_compliant': non_compliant_count
-            },
+            'summary': summary,
             'column_used': image_column,
             'results': results
         })
@@ -791,5 +1530,277 @@ def batch_upload():
         }), 500
 
 
+# ==================== 后台批量任务 ====================
+
+# Web 进程内的任务线程数；默认 0，任务由 job_worker.py 独立进程处理（队列需设置 JOB_QUEUE_DIR）
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '0'))
+JOB_RESULTS_PAGE_MAX = 1000
+
+_job_workers = []
+_job_workers_lock = threading.Lock()
+
+
+def _check_job_items(job, items):
+    """
+    检测任务：与 /batch_upload 相同的下载和检测流程，结果中不保存预览图
+    """
+    urls = [url for _idx, url, _filename in items]
+    options = {'preview_format': None, 'preview_quality': None, 'as_resource': False, 'route': '/jobs',
+               'profile': job['options'].get('profile'), 'verdict_only': job['options'].get('verdict_only', False)}
+    batch_items = _iter_batch_items(urls, job['options'].get('workers'), options, probe=job['options'].get('probe', False))
+    for (idx, _url, _filename), result_item in zip(items, batch_items):
+        result_item['index'] = idx
+        result_item.pop('preview', None)
+        yield result_item
+
+
+def _fix_job_items(job, items):
+    """
+    修复任务：修复后的图片保存到任务目录，结果中记录文件名
+    """
+    strategy = job['options'].get('strategy', 'smart_fit')
+    profile = get_profile(job['options'].get('profile'))
+    files_dir = get_job_queue().files_dir(job['job_id'])
+    os.makedirs(files_dir, exist_ok=True)
+
+    urls = [url for _idx, url, _filename in items]
+    for (idx, _url, filename), (_row, url, fixed, _changed) in zip(items, _iter_fix_jobs(urls, job['options'].get('workers'), strategy, profile)):
+        result_item = {
+            'index': idx,
+            'url': url,
+            'status': 'pending'
+        }
+        try:
+            fix = fixed.result()
+            path = os.path.join(files_dir, filename)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(fix['fixed_png'])
+            os.replace(path + '.tmp', path)
+
+            result_item['status'] = 'success'
+            result_item['compliant'] = fix['original_compliant']
+            result_item['has_watermark'] = fix['has_watermark']
+            result_item['filename'] = filename
+            record_outcome('/jobs', strategy, compliant=fix['original_compliant'])
+        except requests.exceptions.RequestException as e:
+            result_item['status'] = 'failed'
+            result_item['error'] = f'下载图片失败: {str(e)}'
+            record_outcome('/jobs', strategy, error='download')
+        except Exception as e:
+            result_item['status'] = 'failed'
+            result_item['error'] = f'修复失败: {str(e)}'
+            record_outcome('/jobs', strategy, error='process')
+        yield result_item
+
+
+JOB_HANDLERS = {
+    'check': _check_job_items,
+    'fix': _fix_job_items
+}
+
+
+def start_job_workers(count=JOB_WORKERS):
+    """
+    启动后台任务线程（每个进程只启动一次）；会接管心跳超时的任务，从检查点继续
+
+    Returns:
+        list: JobWorker 线程
+    """
+    queue = get_job_queue()
+    if queue is None or count <= 0:
+        return []
+    with _job_workers_lock:
+        if not _job_workers:
+            for _ in range(count):
+                worker = JobWorker(queue, JOB_HANDLERS)
+                worker.start()
+                _job_workers.append(worker)
+    return list(_job_workers)
+
+
+@app.before_request
+def _ensure_job_workers():
+    # 设置 JOB_WORKERS 后，进程重启时在第一个请求到来时接管未完成的任务
+    if JOB_WORKERS > 0 and not _job_workers:
+        start_job_workers()
+
+
+def _job_not_found():
+    return jsonify({'error': '任务不存在'}), 404
+
+
+def _fixed_name_factory():
+    """
+    修复任务的输出文件名：name_for(url) 返回由 URL 得到的 PNG 文件名，同一任务内重名时自动编号
+    """
+    used_names = {}
+
+    def name_for(url):
+        return unique_name(f"{extract_filename_from_url(url)}.png", used_names)
+    return name_for
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    提交后台批量任务
+    请求: file（CSV / Excel 表格）或 JSON {urls: [...]}；
+          kind=check|fix（默认 check），strategy（修复策略），workers（下载并发数），
+          probe=1（检测任务先预检文件头，见 /batch_upload），verdict_only=1（检测任务只判定是否合规），
+          profile（规则模板，默认 default）
+    响应: 202 {success, job_id, status_url, total, column_used}
+    JOB_WORKERS=0（默认）时任务保持排队，由 job_worker.py 进程处理
+    """
+    queue = get_job_queue()
+    if queue is None:
+        return jsonify({'error': '后台任务队列未启用（JOB_QUEUE_DIR 为空）'}), 503
+
+    kind = str(request_option('kind') or 'check').lower()
+    if kind not in JOB_HANDLERS:
+        return jsonify({'error': f'不支持的任务类型: {kind}'}), 400
+
+    strategy = str(request_option('strategy') or 'smart_fit')
+    if kind == 'fix' and strategy not in FIX_STRATEGIES:
+        return jsonify({'error': f'不支持的修复策略: {strategy}'}), 400
+
+    profile = request_profile()
+
+    try:
+        if 'file' in request.files and request.files['file'].filename:
+            file = request.files['file']
+            try:
+                image_column, urls = open_manifest(file.stream, file.filename)
+            except ManifestError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            data = request.get_json(silent=True)
+            urls = data.get('urls') if isinstance(data, dict) else None
+            if not isinstance(urls, list) or not urls:
+                return jsonify({'error': '缺少表格文件或URL列表'}), 400
+            urls, image_column = [str(url) for url in urls], None
+
+        options = {'workers': request_option('workers'), 'profile': profile.name}
+        if kind == 'check':
+            options['probe'] = flag_option('probe')
+            options['verdict_only'] = flag_option('verdict_only')
+        if kind == 'fix':
+            options['strategy'] = strategy
+        name_for = _fixed_name_factory() if kind == 'fix' else None
+
+        job_id, total = queue.submit(kind, urls, options, image_column, name_for)
+        start_job_workers()
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}',
+            'total': total,
+            'column_used': image_column
+        }), 202
+
+    except Exception as e:
+        return jsonify({
+            'error': f'创建任务失败: {str(e)}',
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """
+    查询任务状态和进度
+    响应: {success, job_id, kind, status, progress: {processed, total, percent}, summary, ...}
+    """
+    queue = get_job_queue()
+    job = queue.get(job_id) if queue is not None else None
+    if job is None:
+        return _job_not_found()
+    return jsonify({'success': True, **job})
+
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """
+    分页读取任务结果（按表格顺序，只包含已处理的条目）
+    参数: offset（默认 0）、limit（默认 100，最多 JOB_RESULTS_PAGE_MAX）
+    """
+    queue = get_job_queue()
+    job = queue.get(job_id) if queue is not None else None
+    if job is None:
+        return _job_not_found()
+
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = max(1, min(JOB_RESULTS_PAGE_MAX, int(request.args.get('limit', 100))))
+    except ValueError:
+        return jsonify({'error': 'offset / limit 必须是整数'}), 400
+
+    results = queue.results(job_id, offset, limit)
+    return jsonify({
+        'success': True,
+        'status': job['status'],
+        'offset': offset,
+        'results': results,
+        'next_offset': offset + len(results) if len(results) == limit else None
+    })
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消排队中或运行中的任务（已处理的结果保留）"""
+    queue = get_job_queue()
+    job = queue.get(job_id) if queue is not None else None
+    if job is None:
+        return _job_not_found()
+    if not queue.cancel(job_id):
+        return jsonify({'error': f"任务已结束（{job['status']}），无法取消"}), 409
+    return jsonify({'success': True, 'job_id': job_id, 'status': CANCELLED})
+
+
+@app.route('/jobs/<job_id>/download')
+def download_job_files(job_id):
+    """
+    下载修复任务的结果（流式 ZIP，包含已修复的图片；失败的URL记录在 failed.txt 中）
+    """
+    queue = get_job_queue()
+    job = queue.get(job_id) if queue is not None else None
+    if job is None:
+        return _job_not_found()
+    if job['kind'] != 'fix':
+        return jsonify({'error': '只有修复任务可以下载图片'}), 400
+
+    files_dir = queue.files_dir(job_id)
+
+    def entries():
+        failed = []
+        offset = 0
+        while True:
+            page = queue.results(job_id, offset, JOB_RESULTS_PAGE_MAX)
+            for item in page:
+                if item['status'] != 'success':
+                    failed.append(f"{item['url']}\t{item.get('error', '')}")
+                    continue
+                try:
+                    with open(os.path.join(files_dir, item['filename']), 'rb') as f:
+                        yield item['filename'], f.read()
+                except OSError as e:
+                    failed.append(f"{item['url']}\t读取修复结果失败: {str(e)}")
+            if len(page) < JOB_RESULTS_PAGE_MAX:
+                break
+            offset += len(page)
+
+        if failed:
+            yield 'failed.txt', ('\n'.join(failed) + '\n').encode('utf-8')
+
+    return Response(
+        iter_zip(entries()),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename=fixed_images_{job_id}.zip',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 # Flask app 会被 Vercel 自动检测和使用
 # 不需要额外的 handler 函数
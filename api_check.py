@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Web 接口自检（本地 HTTP 服务器 + Flask 测试客户端）
+在本机用静态文件服务器提供项目中的测试图片，通过接口检查批量检测的输出：
+- 快速判定：批量检测、多 URL /check_url 和后台任务的结果不包含越界像素数量（快速判定不统计），
+  带有 verdict_only 和不合规原因 reason
+- 增量模式：没有下载缓存（FETCH_CACHE_DIR 为空）时批量检测的 incremental=1 返回 400；
+  启用下载缓存后，内容未变化的 URL 复用下载缓存中的检测结论，即使内存缓存已清空也不再提交检测
+- 阶段耗时：下载在调度器线程中执行，批量检测的 Server-Timing 和 timing=1 仍包含 download；
+  并发下载报告实际经过的时间（不超过 total），累计耗时以 download_sum 报告；
+  启用 CPU 进程池（CPU_WORKERS）时，子进程带回的阶段耗时按累计耗时报告，不会被误判为并发阶段
+
+用法:
+    python3 api_check.py
+全部通过时退出码为 0，否则为 1。
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import atexit
+import tempfile
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# 使用独立的临时任务队列，Web 进程内启动一个任务线程；不使用持久化缓存
+QUEUE_DIR = tempfile.mkdtemp(prefix='api_check_')
+atexit.register(shutil.rmtree, QUEUE_DIR, ignore_errors=True)
+os.environ['JOB_QUEUE_DIR'] = QUEUE_DIR
+os.environ['JOB_WORKERS'] = '1'
+os.environ['FETCH_CACHE_DIR'] = ''
+os.environ['VERDICT_CACHE_DIR'] = ''
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+import index
+import cpu_pool
+import fetch_cache
+
+# 测试图片：不合规原因各不相同
+IMAGES = ('test_compliant.png', 'test_out_of_bounds.png', 'test_wrong_size.png', 'test_edge_case.png')
+JOB_TIMEOUT = 30
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(directory=ROOT):
+    """
+    启动静态文件服务器
+
+    Returns:
+        tuple: (server, base_url)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def _manifest(urls):
+    csv = 'image_url\n' + '\n'.join(urls) + '\n'
+    return {'file': (io.BytesIO(csv.encode('utf-8')), 'manifest.csv')}
+
+
+def _wait_job(client, job_id):
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] in ('completed', 'failed', 'cancelled'):
+            return job
+        time.sleep(0.2)
+    return None
+
+
+# ==================== 检查项 ====================
+
+def _verdict_only_problems(items):
+    """快速判定结果中的问题：伪造的越界像素数量、缺少 verdict_only / reason"""
+    problems = []
+    for item in items:
+        info = item.get('info') or {}
+        if item.get('status') != 'success':
+            problems.append(f"{item.get('url')} 检测失败: {item.get('error')}")
+        elif 'out_of_bounds_count' in info:
+            problems.append(f"{item['url']} 返回了越界像素数量 {info['out_of_bounds_count']}")
+        elif not info.get('verdict_only'):
+            problems.append(f"{item['url']} 缺少 verdict_only")
+        elif not item['compliant'] and not info.get('reason'):
+            problems.append(f"{item['url']} 不合规但缺少 reason")
+    return problems
+
+
+def check_verdict_only(client, base):
+    """快速判定的批量、多 URL 和后台任务结果不包含越界像素数量，带有 verdict_only 和 reason"""
+    urls = [f'{base}/{name}' for name in IMAGES]
+
+    response = client.post('/batch_upload?verdict_only=1', data=_manifest(urls))
+    batch = response.get_json()['results']
+    response = client.post('/check_url', json={'urls': urls, 'verdict_only': True})
+    check_url = response.get_json()['results']
+
+    response = client.post('/jobs', json={'urls': urls, 'verdict_only': True})
+    job = _wait_job(client, response.get_json()['job_id'])
+    if job is None or job['status'] != 'completed':
+        return False, f"后台任务没有完成: {job and job['status']}"
+    job_items = client.get(f"/jobs/{job['job_id']}/results").get_json()['results']
+
+    for name, items in (('/batch_upload', batch), ('/check_url', check_url), ('/jobs', job_items)):
+        problems = _verdict_only_problems(items)
+        if len(items) != len(urls):
+            problems.append(f'结果数 {len(items)}，应为 {len(urls)}')
+        if problems:
+            return False, f"{name}: {'；'.join(problems)}"
+        if all(item['compliant'] for item in items):
+            return False, f'{name}: 所有图片都判定为合规，测试图片没有覆盖不合规的情况'
+
+    # 完整检测仍然返回越界像素数量
+    full = client.post('/batch_upload', data=_manifest(urls)).get_json()['results']
+    if any('out_of_bounds_count' not in item.get('info', {}) for item in full):
+        return False, '完整检测的结果缺少越界像素数量'
+    reasons = sorted({item['info'].get('reason') for item in batch if not item['compliant']})
+    return True, f"批量 / 多 URL / 后台任务的快速判定结果均不含越界像素数量，不合规原因: {', '.join(reasons)}"
+
+
+def check_incremental_requires_cache(client, base):
+    """没有下载缓存时拒绝增量模式（否则每行都会报告 changed=True）"""
+    urls = [f'{base}/{IMAGES[0]}']
+    for name, request_kwargs in (('表单', {'data': {**_manifest(urls), 'incremental': '1'}}),
+                                 ('query string', {'query_string': {'incremental': 'true'}, 'data': _manifest(urls)})):
+        response = client.post('/batch_upload', **request_kwargs)
+        if response.status_code != 400:
+            return False, f'{name}传入 incremental 时返回 {response.status_code}，应为 400'
+    error = response.get_json()['error']
+    response = client.post('/batch_upload', data=_manifest(urls))
+    if response.status_code != 200 or 'changed' in response.get_json()['results'][0]:
+        return False, f'不带 incremental 的批量检测异常: {response.status_code}'
+    return True, f'表单和 query string 传入 incremental 均返回 400: {error}'
+
+
+def check_incremental_reuses_verdicts(client, base):
+    """启用下载缓存时，内容未变化的 URL 复用保存的检测结论，不再提交检测（模拟重启：清空内存缓存）"""
+    urls = [f'{base}/{name}' for name in IMAGES]
+    submitted = []
+    submit = index.submit_compliance_check
+
+    def counting_submit(image_data, *args, **kwargs):
+        submitted.append(len(image_data))
+        return submit(image_data, *args, **kwargs)
+
+    cache_dir = tempfile.mkdtemp(dir=QUEUE_DIR)
+    saved = fetch_cache.DEFAULT_CACHE_DIR, fetch_cache._default_cache
+    fetch_cache.DEFAULT_CACHE_DIR, fetch_cache._default_cache = cache_dir, None
+    index.submit_compliance_check = counting_submit
+    try:
+        first = client.post('/batch_upload', data={**_manifest(urls), 'incremental': '1'}).get_json()
+        first_submitted = len(submitted)
+        index.verdict_cache.clear()
+        second = client.post('/batch_upload', data={**_manifest(urls), 'incremental': '1'}).get_json()
+    finally:
+        index.submit_compliance_check = submit
+        fetch_cache.DEFAULT_CACHE_DIR, fetch_cache._default_cache = saved
+
+    if first_submitted != len(urls) or first['summary']['changed'] != len(urls):
+        return False, f"首次增量检测提交 {first_submitted} 次、changed {first['summary']['changed']} 行，应均为 {len(urls)}"
+    if len(submitted) != first_submitted:
+        return False, f'内容未变化时仍提交了 {len(submitted) - first_submitted} 次检测'
+    if second['summary']['unchanged'] != len(urls):
+        return False, f"再次检测 unchanged {second['summary']['unchanged']} 行，应为 {len(urls)}"
+    verdicts = [(item['url'], item['compliant']) for item in first['results']]
+    if [(item['url'], item['compliant']) for item in second['results']] != verdicts:
+        return False, '复用的检测结论与首次检测不一致'
+    if any('preview' in item for item in second['results']):
+        return False, '内容未变化的行不应返回预览图'
+    return True, f'清空内存缓存后再次增量检测 {len(urls)} 个未变化的 URL，没有提交检测，结论一致'
+
+
+def _timing_durations(header):
+    """Server-Timing 响应头 -> {名称: 毫秒}"""
+    durations = {}
+    for entry in header.split(','):
+        name, *params = [part.strip() for part in entry.split(';')]
+        for param in params:
+            if param.startswith('dur='):
+                durations[name] = float(param[len('dur='):])
+    return durations
+
+
+def check_download_timing(client, base):
+    """批量检测的 Server-Timing 和多 URL /check_url 的 timing=1 包含下载耗时，各阶段不超过请求总耗时"""
+    urls = [f'{base}/{name}' for name in IMAGES]
+    response = client.post('/batch_upload', data=_manifest(urls))
+    header = response.headers.get('Server-Timing', '')
+    if 'download;' not in header:
+        return False, f'/batch_upload 的 Server-Timing 缺少 download: {header}'
+    durations = _timing_durations(header)
+    longer = [name for name, ms in durations.items() if not name.endswith('_sum') and ms > durations['total']]
+    if longer:
+        return False, f"/batch_upload 的 Server-Timing 中 {', '.join(longer)} 超过 total: {header}"
+    response = client.post('/check_url', json={'urls': urls, 'timing': True})
+    if 'download;' not in response.headers.get('Server-Timing', ''):
+        return False, f"多 URL /check_url 的 Server-Timing 缺少 download: {response.headers.get('Server-Timing')}"
+    return True, f'/batch_upload Server-Timing: {header}'
+
+
+def check_pool_timing(client, base):
+    """CPU_WORKERS=2 时 /upload 的阶段耗时：子进程带回的阶段不带 _sum，也不超过 total"""
+    with open(os.path.join(ROOT, IMAGES[1]), 'rb') as f:
+        data = f.read()
+    index.verdict_cache.clear()
+    cpu_pool.configure(2)
+    try:
+        if cpu_pool.pool_size() == 0:
+            return True, '当前环境无法创建子进程，跳过'
+        response = client.post('/upload', data={'file': (io.BytesIO(data), IMAGES[1])})
+    finally:
+        pool = cpu_pool.get_pool()
+        cpu_pool.configure(0)
+        if pool is not None:
+            cpu_pool._discard_pool(pool)
+        index.verdict_cache.clear()
+
+    header = response.headers.get('Server-Timing', '')
+    durations = _timing_durations(header)
+    if response.status_code != 200 or 'analysis' not in durations:
+        return False, f'/upload 返回 {response.status_code}，Server-Timing: {header}'
+    summed = [name for name in durations if name.endswith('_sum')]
+    if summed:
+        return False, f"子进程阶段被误判为并发阶段（{', '.join(summed)}）: {header}"
+    longer = [name for name, ms in durations.items() if ms > durations['total']]
+    if longer:
+        return False, f"{', '.join(longer)} 超过 total: {header}"
+    return True, f'CPU_WORKERS=2 时 /upload Server-Timing: {header}'
+
+
+CHECKS = (
+    ('快速判定的批量结果', check_verdict_only),
+    ('增量模式需要下载缓存', check_incremental_requires_cache),
+    ('增量模式复用检测结论', check_incremental_reuses_verdicts),
+    ('下载阶段耗时', check_download_timing),
+    ('进程池阶段耗时', check_pool_timing),
+)
+
+
+def main():
+    server, base = start_server()
+    client = index.app.test_client()
+    failed = 0
+    try:
+        for name, check in CHECKS:
+            start = time.perf_counter()
+            try:
+                ok, message = check(client, base)
+            except Exception as e:
+                ok, message = False, f'{type(e).__name__}: {e}'
+            elapsed = time.perf_counter() - start
+            print(f"{'✅' if ok else '❌'} {name}（{elapsed:.2f}s）: {message}")
+            failed += not ok
+    finally:
+        server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
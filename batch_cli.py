@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+命令行批量检测工具（无需启动 Web 服务）
+读取 CSV/Excel 清单或本地图片目录，多进程并行检测，输出 CSV 或 JSON Lines 报告
+
+用法:
+    python3 batch_cli.py manifest.xlsx --report report.csv
+    python3 batch_cli.py ./images --report report.jsonl --fix-dir ./fixed --strategy smart_fit
+    python3 batch_cli.py manifest.csv --report report.csv --profile wide
+    python3 batch_cli.py manifest.csv --report report.csv --verdict-only
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import cpu_pool
+from index import FIX_STRATEGIES, check_context_compliance, check_image_compliance, run_fix_pipeline
+from analysis_context import AnalysisContext
+from downloader import fetch
+from image_fixer import extract_filename_from_url, sanitize_filename
+from manifest_reader import open_manifest
+from rule_profiles import DEFAULT_PROFILE, get_profile, list_profiles
+from zip_stream import unique_name
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tif', '.tiff')
+
+REPORT_FIELDS = [
+    'index', 'source', 'status', 'compliant', 'errors', 'warnings',
+    'original_width', 'original_height', 'out_of_bounds_count', 'has_watermark',
+    'fixed_path', 'error'
+]
+
+# 每个进程同时在途的任务数（任务逐个读取、提交，清单不会一次性展开）
+TASKS_PER_WORKER = 4
+
+
+@contextmanager
+def open_sources(path):
+    """
+    打开待检测的图片来源
+
+    Args:
+        path: CSV/Excel 清单文件，或本地图片目录
+
+    Yields:
+        tuple: (sources, column_used)，sources 为 URL 或本地文件路径的迭代器（清单逐行读取）
+    """
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        yield iter(files), None
+        return
+
+    with open(path, 'rb') as f:
+        image_column, urls = open_manifest(f, path)
+        yield urls, image_column
+
+
+def _init_worker():
+    # 每个图片已在独立子进程中处理，子进程内不再创建 CPU 进程池
+    cpu_pool.configure(0)
+
+
+def _source_name(source):
+    if os.path.exists(source):
+        return sanitize_filename(os.path.splitext(os.path.basename(source))[0])
+    return extract_filename_from_url(source)
+
+
+def _read_source(source):
+    if os.path.exists(source):
+        with open(source, 'rb') as f:
+            return f.read()
+    return fetch(source)
+
+
+def process_item(task):
+    """
+    检测单张图片（在子进程中运行）
+
+    Args:
+        task: (index, source, fix_path, strategy, profile_name, verdict_only)，fix_path 为空时不修复；
+              verdict_only 时只判定是否合规（out_of_bounds_count 为空，因其他原因不合规时 has_watermark 为空）；
+              完整检测不生成预览图（AnalysisContext）；需要修复时检测和修复共用一次解码，verdict_only 不生效
+
+    Returns:
+        dict: 报告中的一行
+    """
+    index, source, fix_path, strategy, profile_name, verdict_only = task
+    profile = get_profile(profile_name)
+    record = {'index': index, 'source': source, 'status': 'failed'}
+
+    try:
+        image_data = _read_source(source)
+    except Exception as e:
+        record['error'] = f'读取图片失败: {str(e)}'
+        return record
+
+    try:
+        ctx = None
+        if fix_path or not verdict_only:
+            # 报告不需要预览图：直接分析检测图；需要修复时检测和修复共用同一次解码和检测图
+            ctx = AnalysisContext(image_data, profile)
+            result = check_context_compliance(ctx)
+            verdict_only = False
+        else:
+            result = check_image_compliance(image_data, profile=profile, verdict_only=True)
+        info = result['info']
+        if 'exception' in info:
+            record['error'] = '；'.join(result['errors'])
+            return record
+
+        # 快速判定在发现第一个不合规原因后即停止，未检查的项目留空
+        unchecked = verdict_only and not result['compliant']
+        record.update({
+            'status': 'success',
+            'compliant': result['compliant'],
+            'errors': result['errors'],
+            'warnings': result['warnings'],
+            'original_width': info.get('original_width'),
+            'original_height': info.get('original_height'),
+            'out_of_bounds_count': None if verdict_only else info.get('out_of_bounds_count', 0),
+            'has_watermark': info.get('has_watermark', None if unchecked else False),
+        })
+
+        # 可选：修复不符合规范的图片
+        if fix_path and not result['compliant']:
+            _, _, fixed_img = run_fix_pipeline(ctx, strategy)
+            fixed_img.save(fix_path, format='PNG')
+            record['fixed_path'] = fix_path
+
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = f'检测失败: {str(e)}'
+
+    return record
+
+
+class ReportWriter:
+    """
+    逐行写入报告：.csv 输出 CSV，其他扩展名输出 JSON Lines
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = path.lower().endswith('.csv')
+        self._file = open(path, 'w', encoding='utf-8-sig' if self.is_csv else 'utf-8', newline='')
+        if self.is_csv:
+            self._writer = csv.DictWriter(self._file, fieldnames=REPORT_FIELDS)
+            self._writer.writeheader()
+
+    def write(self, record):
+        if self.is_csv:
+            row = dict(record)
+            for key in ('errors', 'warnings'):
+                if key in row:
+                    row[key] = '；'.join(row[key])
+            self._writer.writerow({field: row.get(field, '') for field in REPORT_FIELDS})
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+def build_tasks(sources, fix_dir, strategy, profile_name=DEFAULT_PROFILE, verdict_only=False):
+    """
+    逐个生成子进程任务；修复文件名在主进程中统一去重，规则模板只传模板名
+    """
+    used_names = {}
+    for index, source in enumerate(sources, 1):
+        fix_path = None
+        if fix_dir:
+            fix_path = os.path.join(fix_dir, unique_name(f"{_source_name(source)}.png", used_names))
+        yield index, source, fix_path, strategy, profile_name, verdict_only
+
+
+def iter_results(executor, tasks, window):
+    """
+    按任务顺序产出结果：最多 window 个任务同时在途，任务逐个读取（Executor.map 会先展开全部任务）
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(process_item, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def run(sources, report_path, workers=None, fix_dir=None, strategy='smart_fit', quiet=False,
+        profile_name=DEFAULT_PROFILE, verdict_only=False):
+    """
+    批量检测并写入报告
+
+    Args:
+        sources: URL 或本地文件路径的可迭代对象（逐个读取）
+
+    Returns:
+        dict: 汇总统计（含 images_per_second）
+    """
+    if fix_dir:
+        os.makedirs(fix_dir, exist_ok=True)
+
+    tasks = build_tasks(sources, fix_dir, strategy, profile_name, verdict_only)
+    workers = workers or os.cpu_count() or 1
+    summary = {'total': 0, 'success': 0, 'failed': 0, 'compliant': 0, 'non_compliant': 0, 'fixed': 0}
+
+    writer = ReportWriter(report_path)
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            for done, record in enumerate(iter_results(executor, tasks, workers * TASKS_PER_WORKER), 1):
+                summary['total'] = done
+                writer.write(record)
+                if record['status'] == 'success':
+                    summary['success'] += 1
+                    summary['compliant' if record['compliant'] else 'non_compliant'] += 1
+                    if record.get('fixed_path'):
+                        summary['fixed'] += 1
+                else:
+                    summary['failed'] += 1
+
+                if not quiet and done % 50 == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f"  进度 {done}，{done / elapsed:.1f} 张/秒", file=sys.stderr)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    summary['elapsed_seconds'] = round(elapsed, 3)
+    summary['images_per_second'] = round(summary['total'] / elapsed, 2) if elapsed > 0 else 0.0
+    summary['workers'] = workers
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='图片规范批量检测（命令行版）')
+    parser.add_argument('input', help='CSV/Excel 清单文件，或本地图片目录')
+    parser.add_argument('--report', required=True, help='报告路径（.csv 或 .jsonl）')
+    parser.add_argument('--workers', type=int, default=None, help='进程数（默认 CPU 核数）')
+    parser.add_argument('--fix-dir', default=None, help='修复后图片的输出目录（不指定则不修复）')
+    parser.add_argument('--strategy', default='smart_fit', choices=sorted(FIX_STRATEGIES),
+                        help='修复策略（默认 smart_fit）')
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, choices=[profile.name for profile in list_profiles()],
+                        help='规则模板（默认 default，RULE_PROFILES_FILE 可加载额外模板）')
+    parser.add_argument('--verdict-only', action='store_true',
+                        help='只判定是否合规（不统计越界像素数量，错误信息只给出最先发现的原因）')
+    parser.add_argument('--quiet', action='store_true', help='不输出进度')
+    args = parser.parse_args(argv)
+
+    with ExitStack() as stack:
+        try:
+            sources, column_used = stack.enter_context(open_sources(args.input))
+        except Exception as e:
+            print(f"❌ {str(e)}", file=sys.stderr)
+            return 2
+
+        first = next(sources, None)
+        if first is None:
+            print("❌ 没有找到待检测的图片", file=sys.stderr)
+            return 2
+
+        if column_used is not None and not args.quiet:
+            print(f"使用列: {column_used}", file=sys.stderr)
+
+        summary = run(itertools.chain([first], sources), args.report, args.workers, args.fix_dir,
+                      args.strategy, args.quiet, args.profile, args.verdict_only)
+
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+批量去重模块
+清单中重复的 URL 只下载一次；不同 URL 但内容完全相同的图片只处理一次；
+结果按清单顺序复制回每一行（ordered=False 时按完成顺序产出，每行带行号）
+
+去重记录保存在容量为 DEDUP_MEMO_SIZE 的 LRU 中，内存占用与清单长度无关；
+首次出现已被淘汰的重复 URL 会重新下载（结果不变，只是少节省一次）。
+"""
+
+import os
+import hashlib
+from collections import OrderedDict, deque
+import cpu_pool
+
+DEDUP_MEMO_SIZE = int(os.environ.get('BATCH_DEDUP_MEMO', '1024'))
+
+
+class _Memo:
+    """容量有限的 LRU 字典"""
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self._items = OrderedDict()
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+
+class _Slot:
+    """一个唯一 URL 的处理结果（首次出现的行和重复的行共享）"""
+
+    __slots__ = ('future', 'changed', 'rows')
+
+    def __init__(self):
+        self.future = None
+        self.changed = True
+        # 按完成顺序产出时，等待这个结果的行 [(idx, url)]
+        self.rows = []
+
+
+def new_savings():
+    """
+    去重节省统计
+
+    Returns:
+        dict: fetches_saved（重复 URL 少下载的次数）、analyses_saved（重复内容少处理的次数）
+    """
+    return {'fetches_saved': 0, 'analyses_saved': 0}
+
+
+def iter_deduplicated(urls, download, start, savings=None, memo_size=DEDUP_MEMO_SIZE, ordered=True,
+                      reuse_unchanged=None):
+    """
+    去重后并行处理清单，按清单顺序逐行产出结果
+
+    Args:
+        urls: 每一行的 URL（逐个读取，不会一次性展开）
+        download: download(unique_urls) -> 按输入顺序产出 (url, data, error, changed) 的可迭代对象
+        start: start(image_data) -> Future，同一内容只调用一次
+        savings: 可选，new_savings() 返回的统计字典（会被修改）
+        memo_size: 去重记录容量
+        ordered: False 时按完成顺序产出（download 也按完成顺序产出），慢 URL 不会挡住后面的行
+        reuse_unchanged: 可选，reuse_unchanged(image_data) -> Future 或 None；内容未变化（changed=False）时
+                         先调用它复用已有结果，返回 None 时再调用 start
+
+    Yields:
+        tuple: (idx, url, future, changed)，future 已完成；下载失败时为带下载异常的 Future
+    """
+    if savings is None:
+        savings = new_savings()
+    if not ordered:
+        yield from _iter_deduplicated_completed(urls, download, start, savings, memo_size, reuse_unchanged)
+        return
+
+    url_slots = _Memo(memo_size)
+    content_futures = _Memo(memo_size)
+    rows = deque()
+    # 已提交下载、尚无结果的唯一 URL，按提交顺序排列（与下载结果的顺序一致）
+    pending = deque()
+
+    def unique_urls():
+        for idx, url in enumerate(urls, 1):
+            url = str(url)
+            slot = url_slots.get(url)
+            if slot is not None:
+                savings['fetches_saved'] += 1
+                rows.append((idx, url, slot))
+                continue
+            slot = _Slot()
+            url_slots.put(url, slot)
+            rows.append((idx, url, slot))
+            pending.append(slot)
+            yield url
+
+    def ready_rows():
+        # 队首的行已有结果时依次产出（重复行引用的是更早的行，必然已有结果）
+        while rows and rows[0][2].future is not None:
+            idx, url, slot = rows.popleft()
+            yield idx, url, slot.future, slot.changed
+
+    start_unique = _start_unique(start, content_futures, savings, reuse_unchanged)
+    for (_url, _data, _error, changed), future in cpu_pool.iter_ordered(download(unique_urls()), start_unique):
+        slot = pending.popleft()
+        slot.changed = changed
+        slot.future = future
+        yield from ready_rows()
+
+    yield from ready_rows()
+
+
+def _start_unique(start, content_futures, savings, reuse_unchanged=None):
+    """按内容去重提交处理：download_result -> Future"""
+    def start_unique(download_result):
+        _url, image_data, download_error, changed = download_result
+        if download_error is not None:
+            return cpu_pool.done_future(exception=download_error)
+        if not changed and reuse_unchanged is not None:
+            # 复用的结果可能不完整（如不含预览图），不记入内容去重，内容相同的已变化行仍会重新处理
+            future = reuse_unchanged(image_data)
+            if future is not None:
+                return future
+
+        digest = hashlib.sha256(image_data).digest()
+        future = content_futures.get(digest)
+        if future is not None:
+            savings['analyses_saved'] += 1
+            return future
+        future = start(image_data)
+        content_futures.put(digest, future)
+        return future
+    return start_unique
+
+
+def _iter_deduplicated_completed(urls, download, start, savings, memo_size, reuse_unchanged=None):
+    """iter_deduplicated 的按完成顺序版本：唯一 URL 的结果就绪后，立即产出等待它的所有行"""
+    url_slots = _Memo(memo_size)
+    content_futures = _Memo(memo_size)
+    # 已提交下载、尚无结果的唯一 URL（同一 URL 被淘汰后再次出现时可能有多个）
+    waiting = {}
+    ready = deque()
+
+    def unique_urls():
+        for idx, url in enumerate(urls, 1):
+            url = str(url)
+            slot = url_slots.get(url)
+            if slot is not None:
+                savings['fetches_saved'] += 1
+                if slot.future is None:
+                    slot.rows.append((idx, url))
+                else:
+                    ready.append((idx, url, slot.future, slot.changed))
+                continue
+            slot = _Slot()
+            slot.rows.append((idx, url))
+            url_slots.put(url, slot)
+            waiting.setdefault(url, deque()).append(slot)
+            yield url
+
+    def drain():
+        while ready:
+            yield ready.popleft()
+
+    start_unique = _start_unique(start, content_futures, savings, reuse_unchanged)
+    for (url, _data, _error, changed), future in cpu_pool.iter_ordered(download(unique_urls()), start_unique):
+        slots = waiting[url]
+        slot = slots.popleft()
+        if not slots:
+            del waiting[url]
+        slot.changed = changed
+        slot.future = future
+        ready.extend((idx, row_url, future, changed) for idx, row_url in slot.rows)
+        slot.rows = None
+        yield from drain()
+
+    yield from drain()
@@ -0,0 +1,728 @@
+#!/usr/bin/env python3
+"""
+检测 / 修复引擎基准测试
+生成合成图片集（300x200 ~ 6000x4000；RGB / RGBA / P / L；透明和不透明背景；有无水印），
+记录每张图片的标准结果（检测结论、边界框、去水印和各修复策略输出的像素哈希），
+测量各函数的耗时和吞吐量，并检查结果是否与标准结果完全一致
+
+用法:
+    python3 benchmark.py generate ./bench_corpus
+    python3 benchmark.py run ./bench_corpus --report bench.json
+    python3 benchmark.py run ./bench_corpus --baseline bench.json --functions check_image_compliance
+    python3 benchmark.py decode-check
+
+优化引擎前先用当前版本生成图片集和标准结果，优化后再 run：结果不一致时退出码为 1，
+--baseline 指定优化前的报告时输出各函数的加速比。
+decode-check 在大尺寸合成图片（JPEG / PNG）上对比降分辨率解码与完整解码：
+检测结论必须一致，边界框相差不超过 1 像素，越界 / 水印像素数相差不超过 ANALYSIS_RECHECK_TOLERANCE 比例，
+另外用内容边缘、水印像素数正好落在判定阈值附近的图片检查完整解码复核后的结论，否则退出码为 1。
+标准结果与 Pillow / numpy 版本有关（JPEG 解码、LANCZOS 缩放），请在同一环境中对比。
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import argparse
+import warnings
+import statistics
+from io import BytesIO
+
+import numpy as np
+import PIL
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+import cpu_pool
+import metrics
+# 直接调用检测引擎：check_image_compliance 带结果缓存，重复测量会命中缓存
+from index import _check_image_compliance, check_context_compliance
+from analysis_context import AnalysisContext
+from analysis_decode import (
+    ANALYSIS_RECHECK_TOLERANCE, ANALYSIS_REDUCE_MARGIN, make_analysis_proxy, open_for_analysis, open_image, reduce_factor
+)
+from compliance_engine import analyze_pixels, quick_verdict
+from content_bounds import alpha_bounds
+from rule_profiles import get_profile
+from image_fixer import (
+    remove_watermark,
+    smart_crop_to_safe_area,
+    add_padding_to_safe_area,
+    smart_fit_to_safe_area
+)
+
+GOLDEN_FILE = 'golden.json'
+
+DEFAULT_SIZES = ((300, 200), (600, 400), (1200, 800), (1920, 1280), (3000, 2000), (6000, 4000))
+
+# (模式, 透明背景)；RGB 保存为 JPEG，其余保存为 PNG
+VARIANTS = (('RGBA', True), ('RGBA', False), ('RGB', False), ('P', True), ('P', False), ('L', False))
+
+# 车图在 300x200 坐标下的外框：撑满安全区 / 超出安全区 / 未撑满安全区
+LAYOUTS = {
+    'fit': (15, 40, 284, 160),
+    'overflow': (6, 30, 294, 186),
+    'small': (90, 70, 210, 130),
+}
+
+# 水印文字块（300x200 坐标，右下角）：白色、alpha 110
+WATERMARK_BLOCKS = [(232 + i * 8, 152, 237 + i * 8, 164) for i in range(6)]
+WATERMARK_ALPHA = 110
+
+# 降分辨率解码对比：图片尺寸和允许的边界框误差（像素）
+DECODE_CHECK_SIZES = ((1920, 1280), (3000, 2000), (4500, 3000), (6000, 4000))
+DECODE_CHECK_TOLERANCE = 1
+DECODE_CHECK_COUNTS = ('error_count', 'watermark_count')
+
+# 判定阈值附近的图片（300x200 坐标）：车图外框的左边缘相对越界 / 过小阈值的偏移，水印块宽度（高 2 像素）
+BOUNDARY_EDGE_OFFSETS = (-1, -0.5, 0, 0.5)
+BOUNDARY_WATERMARK_WIDTHS = (2.0, 2.5, 3.0, 3.25)
+
+# 在当前进程中直接调用引擎函数，不使用 CPU 进程池
+cpu_pool.configure(0)
+
+# 带透明色的调色板图片转换为 RGBA 时 Pillow 会给出提示，与测量无关
+warnings.filterwarnings('ignore', message='Palette images with Transparency')
+
+
+# ==================== 合成图片集 ====================
+
+def render_scene(width, height, layout, transparent, watermark, rng):
+    """
+    绘制一张合成车图（RGBA 数组）
+
+    Args:
+        width, height: 图片尺寸
+        layout: LAYOUTS 中的布局名
+        transparent: 背景是否透明
+        watermark: 是否在右下角加半透明白色水印
+        rng: numpy 随机数生成器（车身颜色和纹理）
+
+    Returns:
+        numpy 数组，形状 (height, width, 4)
+    """
+    sx, sy = width / 300, height / 200
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    if not transparent:
+        shade = np.linspace(250, 232, height).astype(np.uint8)
+        pixels[:, :, :3] = shade[:, None, None]
+        pixels[:, :, 3] = 255
+
+    # 车身（下半部椭圆）+ 车顶（上半部椭圆）+ 车轮
+    x0, y0, x1, y1 = LAYOUTS[layout]
+    u = (np.arange(width) + 0.5)[None, :] / sx
+    v = (np.arange(height) + 0.5)[:, None] / sy
+    cx, w, h = (x0 + x1) / 2, x1 - x0, y1 - y0
+    body = ((u - cx) / (w / 2)) ** 2 + ((v - (y0 + 0.62 * h)) / (0.38 * h)) ** 2 <= 1
+    cabin = ((u - cx) / (0.3 * w)) ** 2 + ((v - (y0 + 0.3 * h)) / (0.3 * h)) ** 2 <= 1
+    car = body | cabin
+
+    color = rng.integers(20, 160, size=3)
+    noise = rng.integers(-8, 9, size=(height, width, 1), dtype=np.int16)
+    texture = np.clip(color[None, None, :] + noise, 0, 255).astype(np.uint8)
+    pixels[car, :3] = texture[car]
+    pixels[car, 3] = 255
+
+    wheel_ry = 0.12 * h
+    for wheel_x in (x0 + 0.22 * w, x1 - 0.22 * w):
+        wheel = ((u - wheel_x) / (wheel_ry * sy / sx)) ** 2 + ((v - (y1 - wheel_ry)) / wheel_ry) ** 2 <= 1
+        pixels[wheel] = (25, 25, 25, 255)
+
+    if watermark:
+        for bx0, by0, bx1, by1 in WATERMARK_BLOCKS:
+            block = pixels[int(by0 * sy):int(by1 * sy), int(bx0 * sx):int(bx1 * sx)]
+            if transparent:
+                block[:] = (255, 255, 255, WATERMARK_ALPHA)
+            else:
+                # 不透明背景上水印与背景混合，像素仍不透明
+                weight = WATERMARK_ALPHA / 255
+                block[:, :, :3] = (block[:, :, :3] * (1 - weight) + 255 * weight).astype(np.uint8)
+
+    return pixels
+
+
+def to_mode(pixels, mode):
+    """
+    将 RGBA 数组转换为指定模式的图片
+
+    Returns:
+        tuple: (PIL Image对象, 文件格式)
+    """
+    img = Image.fromarray(pixels, 'RGBA')
+    if mode == 'RGBA':
+        return img, 'PNG'
+    if mode == 'RGB':
+        return img.convert('RGB'), 'JPEG'
+    if mode == 'P':
+        # 透明背景时调色板带 alpha（PNG tRNS），半透明水印得以保留
+        source = img if pixels[:, :, 3].min() < 255 else img.convert('RGB')
+        return source.quantize(64, method=Image.Quantize.FASTOCTREE), 'PNG'
+    return img.convert('L'), 'PNG'
+
+
+def corpus_specs(sizes=DEFAULT_SIZES):
+    """
+    图片集中每张图片的生成参数（各尺寸下布局轮换，每种模式都覆盖三种布局）
+
+    Returns:
+        list[dict]: name, width, height, mode, transparent, layout, watermark
+    """
+    layouts = list(LAYOUTS)
+    specs = []
+    for size_index, (width, height) in enumerate(sizes):
+        for variant_index, (mode, transparent) in enumerate(VARIANTS):
+            for watermark in (False, True):
+                layout = layouts[(variant_index * 2 + watermark + size_index) % len(layouts)]
+                ext = 'jpg' if mode == 'RGB' else 'png'
+                name = f"{width}x{height}_{mode}{'_t' if transparent else ''}_{layout}{'_wm' if watermark else ''}.{ext}"
+                specs.append({
+                    'name': name, 'width': width, 'height': height, 'mode': mode,
+                    'transparent': transparent, 'layout': layout, 'watermark': watermark
+                })
+    return specs
+
+
+def generate(corpus_dir, sizes=DEFAULT_SIZES, seed=0, quiet=False):
+    """
+    生成图片集，并用当前引擎记录标准结果（golden.json）
+
+    Returns:
+        dict: golden.json 的内容
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    images = []
+    for spec in corpus_specs(sizes):
+        rng = np.random.default_rng([seed, spec['width'], len(images)])
+        pixels = render_scene(spec['width'], spec['height'], spec['layout'],
+                              spec['transparent'], spec['watermark'], rng)
+        img, file_format = to_mode(pixels, spec['mode'])
+        path = os.path.join(corpus_dir, spec['name'])
+        img.save(path, format=file_format, **({'quality': 90} if file_format == 'JPEG' else {}))
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        images.append({**spec, 'golden': golden_results(data)})
+        if not quiet:
+            print(f"  {spec['name']}", file=sys.stderr)
+
+    golden = {'environment': environment(), 'rules': get_profile().fingerprint, 'seed': seed, 'images': images}
+    with open(os.path.join(corpus_dir, GOLDEN_FILE), 'w', encoding='utf-8') as f:
+        json.dump(golden, f, ensure_ascii=False, indent=1)
+    return golden
+
+
+# ==================== 被测函数与结果摘要 ====================
+
+def image_digest(img):
+    """图片输出的摘要：模式、尺寸和像素哈希"""
+    return {'mode': img.mode, 'size': list(img.size), 'sha256': hashlib.sha256(img.tobytes()).hexdigest()}
+
+
+def check_digest(result):
+    """检测结果的摘要：去掉预览图（编码参数可能调整）和异常堆栈"""
+    info = {key: value for key, value in result['info'].items() if key not in ('resized_image', 'exception')}
+    digest = {'compliant': result['compliant'], 'errors': result['errors'],
+              'warnings': result['warnings'], 'info': info}
+    # 元组统一为列表，便于与 JSON 中的标准结果比较
+    return json.loads(json.dumps(digest))
+
+
+def verdict_digest(result):
+    """快速判定的摘要：只比较结论（原因和错误信息与完整检测不同）"""
+    return {'compliant': result['compliant']}
+
+
+def _run_check(data, img):
+    return _check_image_compliance(data)
+
+
+def _run_verdict(data, img):
+    return _check_image_compliance(data, verdict_only=True)
+
+
+def _run_remove_watermark(data, img):
+    return remove_watermark(img)
+
+
+def _run_smart_crop(data, img):
+    return smart_crop_to_safe_area(img)
+
+
+def _run_add_padding(data, img):
+    return add_padding_to_safe_area(img)
+
+
+def _run_smart_fit(data, img):
+    return smart_fit_to_safe_area(img)
+
+
+# 函数名 -> (调用方式, 结果摘要)；检测从图片字节开始（含解码），其余函数的输入为已解码的原图
+BENCHMARKS = {
+    'check_image_compliance': (_run_check, check_digest),
+    'check_verdict_only': (_run_verdict, verdict_digest),
+    'remove_watermark': (_run_remove_watermark, image_digest),
+    'smart_crop_to_safe_area': (_run_smart_crop, image_digest),
+    'add_padding_to_safe_area': (_run_add_padding, image_digest),
+    'smart_fit_to_safe_area': (_run_smart_fit, image_digest),
+}
+
+
+def expected_digest(golden, name):
+    """
+    标准结果中的摘要；没有快速判定标准结果的旧图片集，使用完整检测的结论
+    """
+    if name not in golden and name == 'check_verdict_only':
+        return verdict_digest(golden['check_image_compliance'])
+    return golden[name]
+
+
+def decode(data):
+    img = open_image(data)
+    img.load()
+    return img
+
+
+def content_bounds(data):
+    """检测图上的边界框：内容（alpha > 10）、车图（排除水印）、分析用的不透明边界框"""
+    ctx = AnalysisContext(data)
+    bounds = {'content': ctx.content_bounds(), 'car': ctx.car_bounds(),
+              'analysis': ctx.analysis()['bounds']}
+    return json.loads(json.dumps(bounds))
+
+
+def golden_results(data):
+    """
+    用当前引擎计算一张图片的标准结果
+
+    Returns:
+        dict: 各被测函数的结果摘要，以及 bounds（边界框）
+    """
+    img = decode(data)
+    golden = {name: digest(run(data, img)) for name, (run, digest) in BENCHMARKS.items()}
+    golden['bounds'] = content_bounds(data)
+    return golden
+
+
+# ==================== 基准测试 ====================
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def measure(run, data, img, repeat):
+    """
+    重复调用被测函数
+
+    Returns:
+        tuple: (首次调用的输出, 各次耗时（秒）, 首次调用的阶段耗时 {阶段名: 秒})
+    """
+    output = None
+    times = []
+    stages = {}
+    for i in range(repeat):
+        trace = metrics.StageTrace()
+        token = metrics.activate(trace)
+        start = time.perf_counter()
+        try:
+            result = run(data, img)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.deactivate(token)
+        times.append(elapsed)
+        if i == 0:
+            output, stages = result, trace.stages
+    return output, times, stages
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(samples):
+    """
+    汇总一个函数在所有图片上的耗时（每张图片取多次调用的中位数）
+
+    Returns:
+        dict: images, mean_ms, median_ms, p95_ms, images_per_second, megapixels_per_second,
+              stages_ms（每张图片各阶段的平均耗时）, by_size（各尺寸的中位耗时）, mismatches
+    """
+    seconds = [sample['seconds'] for sample in samples]
+    total = sum(seconds)
+    megapixels = sum(sample['megapixels'] for sample in samples)
+
+    stages = {}
+    for sample in samples:
+        for name, value in sample['stages'].items():
+            stages[name] = stages.get(name, 0.0) + value
+
+    by_size = {}
+    for sample in samples:
+        by_size.setdefault(sample['size'], []).append(sample['seconds'])
+
+    return {
+        'images': len(samples),
+        'mean_ms': round(total / len(samples) * 1000, 2),
+        'median_ms': round(statistics.median(seconds) * 1000, 2),
+        'p95_ms': round(_percentile(seconds, 0.95) * 1000, 2),
+        'images_per_second': round(len(samples) / total, 2) if total > 0 else 0.0,
+        'megapixels_per_second': round(megapixels / total, 2) if total > 0 else 0.0,
+        'stages_ms': {name: round(value / len(samples) * 1000, 2) for name, value in stages.items()},
+        'by_size': {size: round(statistics.median(values) * 1000, 2) for size, values in by_size.items()},
+        'mismatches': [sample['image'] for sample in samples if not sample['match']],
+    }
+
+
+def run_benchmark(corpus_dir, functions=None, repeat=3, verify=True, quiet=False):
+    """
+    对图片集中的每张图片测量各函数耗时，并与标准结果比较
+
+    Returns:
+        dict: 报告（environment, repeat, functions: {函数名: summarize() 的结果}, images）
+    """
+    with open(os.path.join(corpus_dir, GOLDEN_FILE), encoding='utf-8') as f:
+        golden = json.load(f)
+
+    if verify and golden['rules'] != get_profile().fingerprint:
+        print("⚠️ 检测规则与生成标准结果时不同，检测结论可能不一致", file=sys.stderr)
+    if verify and golden['environment']['pillow'] != PIL.__version__:
+        print(f"⚠️ 标准结果由 Pillow {golden['environment']['pillow']} 生成，当前为 {PIL.__version__}", file=sys.stderr)
+
+    functions = functions or list(BENCHMARKS)
+    samples = {name: [] for name in functions}
+    images = []
+
+    for entry in golden['images']:
+        with open(os.path.join(corpus_dir, entry['name']), 'rb') as f:
+            data = f.read()
+        img = decode(data)
+        size = f"{entry['width']}x{entry['height']}"
+        row = {'image': entry['name']}
+
+        for name in functions:
+            run, digest = BENCHMARKS[name]
+            output, times, stages = measure(run, data, img, repeat)
+            match = not verify or digest(output) == expected_digest(entry['golden'], name)
+            seconds = statistics.median(times)
+            samples[name].append({
+                'image': entry['name'], 'size': size, 'seconds': seconds, 'stages': stages,
+                'megapixels': entry['width'] * entry['height'] / 1e6, 'match': match
+            })
+            row[name] = round(seconds * 1000, 2)
+            if not match:
+                print(f"❌ {name} 结果与标准结果不一致: {entry['name']}", file=sys.stderr)
+
+        if verify and content_bounds(data) != entry['golden']['bounds']:
+            print(f"❌ 边界框与标准结果不一致: {entry['name']}", file=sys.stderr)
+            row['bounds_mismatch'] = True
+        images.append(row)
+        if not quiet:
+            print(f"  {entry['name']}", file=sys.stderr)
+
+    return {
+        'environment': environment(),
+        'repeat': repeat,
+        'functions': {name: summarize(values) for name, values in samples.items()},
+        'images': images,
+    }
+
+
+# ==================== 降分辨率解码对比 ====================
+
+def canvas_pixels(data, path, margin, profile):
+    """
+    按指定的预缩小倍数生成检测图（margin=0 为完整解码）
+
+    Args:
+        path: check（检测：open_for_analysis）或 fix（修复：make_analysis_proxy）
+
+    Returns:
+        numpy 数组（RGBA，画布尺寸）
+    """
+    if path == 'check':
+        img, _meta = open_for_analysis(data, profile.canvas, margin)
+        img.load()
+        if img.size != profile.canvas:
+            img = img.resize(profile.canvas, Image.Resampling.LANCZOS)
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+    else:
+        img = make_analysis_proxy(decode(data), profile.canvas, margin)
+    return np.asarray(img)
+
+
+def decode_summary(pixels, profile):
+    """检测图的结论、边界框和像素数"""
+    analysis = analyze_pixels(pixels, profile)
+    compliant = (not analysis['error_count'] and not analysis['too_small']
+                 and analysis['watermark_count'] <= profile.watermark_min_pixels)
+    summary = {
+        'compliant': compliant,
+        'verdict': quick_verdict(pixels, profile),
+        'bounds': analysis['bounds'],
+        'content': alpha_bounds(pixels[:, :, 3], profile.visible_alpha),
+    }
+    summary.update({key: analysis[key] for key in DECODE_CHECK_COUNTS})
+    return summary
+
+
+def _bounds_delta(reduced, full):
+    if reduced is None or full is None:
+        return 0 if reduced == full else None
+    return max(abs(a - b) for a, b in zip(reduced, full))
+
+
+def compare_decode(data, margin=ANALYSIS_REDUCE_MARGIN, profile=None):
+    """
+    对比一张图片降分辨率解码与完整解码的检测结果
+
+    Returns:
+        list[str]: 不一致的项目，一致时为空
+    """
+    profile = profile or get_profile()
+    problems = []
+    for path in ('check', 'fix'):
+        reduced = decode_summary(canvas_pixels(data, path, margin, profile), profile)
+        full = decode_summary(canvas_pixels(data, path, 0, profile), profile)
+        if reduced['compliant'] != full['compliant'] or reduced['verdict'] != full['verdict']:
+            problems.append(f"{path}: 结论不一致（降分辨率 {reduced['verdict']}，完整解码 {full['verdict']}）")
+        for key in ('bounds', 'content'):
+            delta = _bounds_delta(reduced[key], full[key])
+            if delta is None or delta > DECODE_CHECK_TOLERANCE:
+                problems.append(f"{path}: {key} 边界框相差过大（{reduced[key]} / {full[key]}）")
+        # 像素数较少时按水印阈值计算允许的误差（near_threshold 复核的范围）
+        for key in DECODE_CHECK_COUNTS:
+            limit = ANALYSIS_RECHECK_TOLERANCE * max(reduced[key], full[key], profile.watermark_min_pixels)
+            if abs(reduced[key] - full[key]) > limit:
+                problems.append(f"{path}: {key} 相差过大（{reduced[key]} / {full[key]}）")
+    return problems
+
+
+def compare_checked(data, profile=None):
+    """
+    对比检测接口（降分辨率解码，接近阈值时完整解码复核）与完整解码的结论
+
+    Returns:
+        list[str]: 不一致的项目，一致时为空
+    """
+    profile = profile or get_profile()
+    expected = decode_summary(canvas_pixels(data, 'check', 0, profile), profile)['compliant']
+    results = {
+        'check_image_compliance': _check_image_compliance(data, profile_name=profile.name)['compliant'],
+        'check_verdict_only': _check_image_compliance(data, profile_name=profile.name, verdict_only=True)['compliant'],
+        'check_context_compliance': check_context_compliance(AnalysisContext(data, profile))['compliant'],
+    }
+    return [f'{name}: 结论 {compliant}，完整解码 {expected}'
+            for name, compliant in results.items() if compliant != expected]
+
+
+def render_boundary_scene(width, height, car, watermark=None):
+    """
+    绘制判定阈值附近的图片（透明背景上的不透明矩形车图，可选白色半透明水印块）
+
+    Args:
+        car: 车图外框 (x0, y0, x1, y1)，300x200 坐标，可以是小数
+        watermark: 水印块 (x, y, 宽, 高)，300x200 坐标
+
+    Returns:
+        numpy 数组，形状 (height, width, 4)
+    """
+    sx, sy = width / 300, height / 200
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    x0, y0, x1, y1 = car
+    pixels[round(y0 * sy):round(y1 * sy), round(x0 * sx):round(x1 * sx)] = (60, 80, 120, 255)
+    if watermark:
+        x, y, w, h = watermark
+        pixels[round(y * sy):round((y + h) * sy), round(x * sx):round((x + w) * sx)] = (255, 255, 255, WATERMARK_ALPHA)
+    return pixels
+
+
+def boundary_specs(profile):
+    """
+    判定阈值附近的图片参数：左边缘贴近越界阈值 / 过小阈值，水印像素数接近 watermark_min_pixels
+
+    Returns:
+        list[tuple]: (名称, 车图外框, 水印块)
+    """
+    safe_area = profile.safe_area
+    fit = (safe_area['left'] + 1, 40, safe_area['right'] - 1, 160)
+    specs = []
+    for offset in BOUNDARY_EDGE_OFFSETS:
+        specs.append((f'edge{offset:+}', (safe_area['left'] - profile.outward_tolerance + offset, 60, 200, 140), None))
+        specs.append((f'inward{offset:+}', (safe_area['left'] + profile.inward_tolerance + offset, 60, 200, 140), None))
+    for width in BOUNDARY_WATERMARK_WIDTHS:
+        specs.append((f'watermark{width}', fit, (240, 165, width, 2)))
+    return specs
+
+
+def run_decode_check(sizes=DECODE_CHECK_SIZES, seed=0, quiet=False):
+    """
+    在大尺寸合成图片上对比降分辨率解码与完整解码（图片只在内存中生成）
+
+    Returns:
+        dict: images（对比的图片数）, reduced（实际做了预缩小的图片数）, failures {图片名: 问题列表}
+    """
+    profile = get_profile()
+    report = {'images': 0, 'reduced': 0, 'failures': {}}
+    for index, spec in enumerate(corpus_specs(sizes)):
+        rng = np.random.default_rng([seed, spec['width'], index])
+        pixels = render_scene(spec['width'], spec['height'], spec['layout'],
+                              spec['transparent'], spec['watermark'], rng)
+        img, file_format = to_mode(pixels, spec['mode'])
+        buffered = BytesIO()
+        img.save(buffered, format=file_format, **({'quality': 90} if file_format == 'JPEG' else {}))
+        data = buffered.getvalue()
+
+        report['images'] += 1
+        # 调色板图片不做预缩小，结果与完整解码相同
+        report['reduced'] += spec['mode'] != 'P' and reduce_factor(img.size, profile.canvas) >= 2
+        problems = compare_decode(data, ANALYSIS_REDUCE_MARGIN, profile)
+        if problems:
+            report['failures'][spec['name']] = problems
+            print(f"❌ {spec['name']}: {'；'.join(problems)}", file=sys.stderr)
+        elif not quiet:
+            print(f"  {spec['name']}", file=sys.stderr)
+
+    # 判定阈值附近的图片：检测接口的结论与完整解码一致
+    for width, height in sizes:
+        for name, car, watermark in boundary_specs(profile):
+            name = f'{width}x{height}_boundary_{name}.png'
+            buffered = BytesIO()
+            Image.fromarray(render_boundary_scene(width, height, car, watermark), 'RGBA').save(buffered, format='PNG')
+            report['images'] += 1
+            report['reduced'] += reduce_factor((width, height), profile.canvas) >= 2
+            problems = compare_checked(buffered.getvalue(), profile)
+            if problems:
+                report['failures'][name] = problems
+                print(f"❌ {name}: {'；'.join(problems)}", file=sys.stderr)
+            elif not quiet:
+                print(f"  {name}", file=sys.stderr)
+    return report
+
+
+def format_report(report, baseline=None):
+    """
+    报告的文本表格；指定 baseline（之前的报告）时附加加速比（基线平均耗时 / 当前平均耗时）
+    """
+    lines = [f"{'function':<28}{'images':>7}{'mean ms':>11}{'median ms':>11}{'p95 ms':>11}{'img/s':>10}{'MP/s':>10}{'mismatch':>10}"]
+    for name, summary in report['functions'].items():
+        lines.append(
+            f"{name:<28}{summary['images']:>7}{summary['mean_ms']:>11}{summary['median_ms']:>11}"
+            f"{summary['p95_ms']:>11}{summary['images_per_second']:>10}{summary['megapixels_per_second']:>10}"
+            f"{len(summary['mismatches']):>10}"
+        )
+
+    lines.append('')
+    lines.append('各尺寸中位耗时（ms）')
+    for name, summary in report['functions'].items():
+        sizes = '  '.join(f'{size}: {ms}' for size, ms in summary['by_size'].items())
+        lines.append(f'  {name}: {sizes}')
+
+    lines.append('')
+    lines.append('各阶段平均耗时（ms / 张）')
+    for name, summary in report['functions'].items():
+        stages = '  '.join(f'{stage}: {ms}' for stage, ms in summary['stages_ms'].items())
+        lines.append(f'  {name}: {stages or "-"}')
+
+    if baseline:
+        lines.append('')
+        lines.append('加速比（基线 / 当前）')
+        for name, summary in report['functions'].items():
+            before = baseline['functions'].get(name)
+            if not before:
+                continue
+            speedup = before['mean_ms'] / summary['mean_ms'] if summary['mean_ms'] else 0.0
+            sizes = '  '.join(
+                f"{size}: {before['by_size'][size] / ms:.2f}x"
+                for size, ms in summary['by_size'].items() if ms and size in before['by_size']
+            )
+            lines.append(f'  {name}: {speedup:.2f}x  （{sizes}）')
+
+    return '\n'.join(lines)
+
+
+def parse_sizes(value):
+    sizes = []
+    for item in value.split(','):
+        width, height = item.lower().split('x')
+        sizes.append((int(width), int(height)))
+    return tuple(sizes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='检测 / 修复引擎基准测试')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help='生成合成图片集和标准结果')
+    gen.add_argument('corpus', help='图片集目录')
+    gen.add_argument('--sizes', type=parse_sizes, default=DEFAULT_SIZES,
+                     help='图片尺寸，逗号分隔（默认 300x200,600x400,1200x800,1920x1280,3000x2000,6000x4000）')
+    gen.add_argument('--seed', type=int, default=0, help='随机种子（默认 0）')
+    gen.add_argument('--quiet', action='store_true', help='不输出进度')
+
+    bench = commands.add_parser('run', help='测量耗时并与标准结果比较')
+    bench.add_argument('corpus', help='图片集目录（含 golden.json）')
+    bench.add_argument('--functions', default=None,
+                       help=f"被测函数，逗号分隔（默认全部：{','.join(BENCHMARKS)}）")
+    bench.add_argument('--repeat', type=int, default=3, help='每张图片重复调用次数，取中位数（默认 3）')
+    bench.add_argument('--report', default=None, help='JSON 报告输出路径')
+    bench.add_argument('--baseline', default=None, help='之前的 JSON 报告，用于计算加速比')
+    bench.add_argument('--no-verify', action='store_true', help='只测耗时，不与标准结果比较')
+    bench.add_argument('--quiet', action='store_true', help='不输出进度')
+
+    check = commands.add_parser('decode-check', help='对比降分辨率解码与完整解码的检测结果')
+    check.add_argument('--sizes', type=parse_sizes, default=DECODE_CHECK_SIZES,
+                       help='图片尺寸，逗号分隔（默认 1920x1280,3000x2000,4500x3000,6000x4000）')
+    check.add_argument('--seed', type=int, default=0, help='随机种子（默认 0）')
+    check.add_argument('--quiet', action='store_true', help='不输出进度')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        golden = generate(args.corpus, args.sizes, args.seed, args.quiet)
+        print(f"✅ 已生成 {len(golden['images'])} 张图片和标准结果: {os.path.join(args.corpus, GOLDEN_FILE)}")
+        return 0
+
+    if args.command == 'decode-check':
+        if ANALYSIS_REDUCE_MARGIN <= 0:
+            print('⚠️ ANALYSIS_REDUCE_MARGIN=0，降分辨率解码已关闭，两条路径相同', file=sys.stderr)
+        report = run_decode_check(args.sizes, args.seed, args.quiet)
+        failed = len(report['failures'])
+        print(f"{'❌' if failed else '✅'} 对比 {report['images']} 张图片（{report['reduced']} 张做了预缩小）："
+              f"{failed} 张结论不一致、边界框相差超过 {DECODE_CHECK_TOLERANCE} 像素或像素数相差过大")
+        return 1 if failed else 0
+
+    functions = args.functions.split(',') if args.functions else None
+    unknown = [name for name in functions or [] if name not in BENCHMARKS]
+    if unknown:
+        print(f"❌ 不支持的函数: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    if not os.path.exists(os.path.join(args.corpus, GOLDEN_FILE)):
+        print(f"❌ 没有找到 {GOLDEN_FILE}，请先运行 generate", file=sys.stderr)
+        return 2
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = run_benchmark(args.corpus, functions, max(1, args.repeat), not args.no_verify, args.quiet)
+    print(format_report(report, baseline))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    mismatched = any(summary['mismatches'] for summary in report['functions'].values())
+    mismatched = mismatched or any(row.get('bounds_mismatch') for row in report['images'])
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
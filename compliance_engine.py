@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+图片规范检测引擎（数组版）
+基于 alpha 通道一次性向量化计算越界、容差、边界框和水印判定；
+quick_verdict 只判定是否合规，用于大批量初筛；
+near_threshold 判断结果是否接近判定阈值（降分辨率解码的检测图需要完整解码复核）
+"""
+
+import numpy as np
+from content_bounds import alpha_bounds
+from rule_profiles import get_profile
+
+# 快速判定的不合规原因
+OUT_OF_BOUNDS = 'out_of_bounds'
+WATERMARK = 'watermark'
+TOO_SMALL = 'too_small'
+
+
+def _check_canvas(pixels, profile):
+    height, width = pixels.shape[:2]
+    if (width, height) != profile.canvas:
+        raise ValueError(f'检测图尺寸 {width}x{height} 与规则模板 {profile.name} 的画布 '
+                         f'{profile.canvas[0]}x{profile.canvas[1]} 不一致')
+
+
+def _is_too_small(bounds, profile, slack=0):
+    """不透明像素边界框是否没有撑满安全区域（slack > 0 放宽、< 0 收紧内侧容差）"""
+    min_x, min_y, max_x, max_y = bounds
+    safe_area = profile.safe_area
+    reach = profile.inward_tolerance + slack
+
+    # 水平或垂直至少一个方向有一边撑到位即可
+    left_ok = min_x <= safe_area['left'] + reach
+    right_ok = max_x >= safe_area['right'] - reach
+    top_ok = min_y <= safe_area['top'] + reach
+    bottom_ok = max_y >= safe_area['bottom'] - reach
+    return not ((left_ok or right_ok) or (top_ok or bottom_ok))
+
+
+def _is_out_of_bounds(bounds, profile, slack=0):
+    """有内容像素的边界框是否超出容差外（slack > 0 放宽、< 0 收紧外侧容差），与 error_zone 判定一致"""
+    min_x, min_y, max_x, max_y = bounds
+    safe_area = profile.safe_area
+    reach = profile.outward_tolerance + slack
+    return (min_x < safe_area['left'] - reach or max_x > safe_area['right'] + reach
+            or min_y < safe_area['top'] - reach or max_y > safe_area['bottom'] + reach)
+
+
+def _watermark_count(pixels, profile):
+    """右下角水印区域的白色半透明像素数"""
+    wm_y, wm_x = profile.watermark_origin
+    wm_region = pixels[wm_y:, wm_x:]
+    wm_alpha = wm_region[:, :, 3]
+    wm_brightness = np.mean(wm_region[:, :, :3], axis=2)
+    wm_mask = (wm_alpha > 0) & (wm_alpha < profile.watermark_alpha_max) & (wm_brightness > profile.watermark_brightness_min)
+    return int(np.count_nonzero(wm_mask))
+
+
+def analyze_pixels(pixels, profile=None):
+    """
+    对 RGBA 像素数组做一次完整的规范分析
+
+    越界区域掩码、水印区域等几何信息在规则模板编译时已预先计算，这里只做逐像素的向量化判定。
+
+    Args:
+        pixels: numpy 数组，形状 (height, width, 4)，RGBA 模式，尺寸为模板画布尺寸
+        profile: 规则模板（RuleProfile），默认 default
+
+    Returns:
+        dict: error_count, error_samples, warning_count, bounds,
+              too_small, watermark_count
+    """
+    profile = profile or get_profile()
+    _check_canvas(pixels, profile)
+    width = pixels.shape[1]
+    alpha = pixels[:, :, 3]
+
+    # 1. 越界检测（容差内警告，容差外不通过）
+    visible = alpha > profile.visible_alpha
+    error_mask = visible & profile.error_zone
+    error_count = int(np.count_nonzero(error_mask))
+    warning_count = int(np.count_nonzero(visible & profile.warning_zone))
+
+    # 样本按行优先顺序取前 N 个，坐标格式为 (x, y)
+    error_samples = []
+    if error_count:
+        flat = np.flatnonzero(error_mask)[:profile.sample_limit]
+        error_samples = [(int(i % width), int(i // width)) for i in flat]
+
+    # 2. 不透明像素边界框（行/列投影）
+    bounds = alpha_bounds(alpha, profile.opaque_alpha)
+    too_small = bounds is not None and _is_too_small(bounds, profile)
+
+    # 3. 右下角水印检测（白色半透明像素）
+    watermark_count = _watermark_count(pixels, profile)
+
+    return {
+        'error_count': error_count,
+        'error_samples': error_samples,
+        'warning_count': warning_count,
+        'bounds': bounds,
+        'too_small': too_small,
+        'watermark_count': watermark_count,
+    }
+
+
+def quick_verdict(pixels, profile=None):
+    """
+    只判定是否合规（结论与 analyze_pixels 一致），确定结论后立即返回，不统计像素数量、不取越界样本
+
+    依次检查：
+        1. 容差外的四条边框带（只扫描边框像素，不扫描安全区内部）
+        2. 右下角水印区域（先按 alpha 筛选候选像素，候选不足时不计算亮度）
+        3. 不透明像素的列 / 行最大值投影（最外侧的列或行撑到安全区边缘即可，列方向满足时不再计算行投影）
+
+    Args:
+        pixels: numpy 数组，形状 (height, width, 4)，RGBA 模式，尺寸为模板画布尺寸
+        profile: 规则模板（RuleProfile），默认 default
+
+    Returns:
+        str: 最先发现的不合规原因（OUT_OF_BOUNDS / WATERMARK / TOO_SMALL），合规时为 None
+    """
+    profile = profile or get_profile()
+    _check_canvas(pixels, profile)
+    alpha = pixels[:, :, 3]
+
+    # 1. 越界：容差外有可见像素即不合规
+    for rows, cols in profile.error_strips:
+        if alpha[rows, cols].max() > profile.visible_alpha:
+            return OUT_OF_BOUNDS
+
+    # 2. 水印：白色半透明像素超过阈值
+    wm_y, wm_x = profile.watermark_origin
+    wm_alpha = alpha[wm_y:, wm_x:]
+    candidates = (wm_alpha > 0) & (wm_alpha < profile.watermark_alpha_max)
+    if np.count_nonzero(candidates) > profile.watermark_min_pixels:
+        wm_brightness = np.mean(pixels[wm_y:, wm_x:][candidates][:, :3], axis=1)
+        if np.count_nonzero(wm_brightness > profile.watermark_brightness_min) > profile.watermark_min_pixels:
+            return WATERMARK
+
+    # 3. 过小：水平或垂直方向至少一边撑到位；没有不透明像素时不判定过小
+    left, right = profile.safe_area['left'], profile.safe_area['right']
+    top, bottom = profile.safe_area['top'], profile.safe_area['bottom']
+    reach = profile.inward_tolerance
+
+    opaque_cols = alpha.max(axis=0) > profile.opaque_alpha
+    if not opaque_cols.any():
+        return None
+    if opaque_cols[:left + reach + 1].any() or opaque_cols[max(right - reach, 0):].any():
+        return None
+
+    opaque_rows = alpha.max(axis=1) > profile.opaque_alpha
+    if opaque_rows[:top + reach + 1].any() or opaque_rows[max(bottom - reach, 0):].any():
+        return None
+    return TOO_SMALL
+
+
+def near_threshold(pixels, profile=None, tolerance=0.25, slack=1):
+    """
+    检测结果是否接近判定阈值：边界框移动 slack 像素或水印像素数变化 tolerance 比例时结论可能改变
+
+    降分辨率解码的检测图与完整解码只在内容边缘的抗锯齿像素上不同（边界框相差不超过 1 像素，
+    像素数量相差几个百分点，见 analysis_decode），结果接近阈值时应改用完整解码复核。
+
+    Args:
+        pixels: numpy 数组，形状 (height, width, 4)，RGBA 模式，尺寸为模板画布尺寸
+        profile: 规则模板（RuleProfile），默认 default
+        tolerance: 水印像素数的相对误差范围
+        slack: 边界框的误差范围（像素）
+
+    Returns:
+        bool: 接近阈值时为 True
+    """
+    profile = profile or get_profile()
+    _check_canvas(pixels, profile)
+    alpha = pixels[:, :, 3]
+
+    content = alpha_bounds(alpha, profile.visible_alpha)
+    if content is not None and _is_out_of_bounds(content, profile, slack) != _is_out_of_bounds(content, profile, -slack):
+        return True
+
+    bounds = alpha_bounds(alpha, profile.opaque_alpha)
+    if bounds is not None and _is_too_small(bounds, profile, slack) != _is_too_small(bounds, profile, -slack):
+        return True
+
+    watermark_count = _watermark_count(pixels, profile)
+    return abs(watermark_count - profile.watermark_min_pixels) <= tolerance * max(watermark_count, profile.watermark_min_pixels)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+内容边界框计算模块
+基于 alpha 通道的行/列投影计算边界框，供检测和修复共用
+"""
+
+import numpy as np
+
+
+def alpha_array(img):
+    """
+    取出图片的 alpha 通道数组
+
+    Args:
+        img: PIL Image对象
+
+    Returns:
+        numpy 数组，形状 (height, width)；非 RGBA 图片视为完全不透明
+    """
+    if img.mode == 'RGBA':
+        return np.asarray(img.getchannel('A'))
+    width, height = img.size
+    return np.full((height, width), 255, dtype=np.uint8)
+
+
+def alpha_bounds(alpha, threshold, exclude=None):
+    """
+    计算 alpha > threshold 的像素边界框（行/列投影）
+
+    Args:
+        alpha: alpha 通道数组，形状 (height, width)
+        threshold: alpha 阈值
+        exclude: 可选布尔掩码，True 的位置不计入边界框
+
+    Returns:
+        tuple: (min_x, min_y, max_x, max_y)，没有内容时返回 None
+    """
+    mask = alpha > threshold
+    if exclude is not None:
+        mask &= ~exclude
+
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+
+    return (int(cols[0]), int(rows[0]), int(cols[-1]), int(rows[-1]))
+
+
+def watermark_region(width, height, fraction):
+    """
+    右下角水印区域掩码（x、y 都不小于尺寸的 fraction 倍；规则模板编译时计算一次）
+
+    Returns:
+        只读 numpy 布尔数组，形状 (height, width)
+    """
+    xs = np.arange(width) >= width * fraction
+    ys = np.arange(height) >= height * fraction
+    region = ys[:, None] & xs[None, :]
+    region.setflags(write=False)
+    return region
+
+
+def watermark_mask(alpha, region, alpha_max):
+    """
+    计算水印像素掩码：水印区域内 alpha < alpha_max 的像素
+
+    Args:
+        alpha: alpha 通道数组，形状 (height, width)
+        region: watermark_region() 返回的区域掩码（与 alpha 同尺寸）
+        alpha_max: alpha 上限
+
+    Returns:
+        numpy 布尔数组，True 表示水印像素
+    """
+    return (alpha < alpha_max) & region
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+CPU 进程池模块
+解码、缩放、像素分析、PNG 编码等 CPU 密集步骤交给独立进程执行，不受 GIL 限制
+
+进程数由环境变量 CPU_WORKERS 配置（默认 CPU 核数，Web 入口 api/index.py 未设置时为 0）；
+CPU_WORKERS=0 时在当前线程内直接执行。
+任务参数和返回值通过 pickle 传递：只传图片字节和紧凑的结果，不传解码后的图像。
+无法创建子进程的环境（部分 Serverless 平台）自动回退为当前线程执行。
+子进程意外退出（OOM 等）导致进程池损坏时丢弃旧进程池，下一个任务重新创建；重新创建后仍无法提交时在当前线程执行。
+任务中记录的阶段耗时（metrics.stage）随结果带回，由主进程写入直方图，并累加到提交任务时的 StageTrace。
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+DEFAULT_WORKERS = int(os.environ.get('CPU_WORKERS', str(os.cpu_count() or 1)))
+
+_workers = DEFAULT_WORKERS
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(workers):
+    """
+    设置进程数（需在第一次提交任务前调用）
+
+    Args:
+        workers: 进程数，0 表示在当前线程内执行
+    """
+    global _workers
+    _workers = max(0, int(workers))
+
+
+def _mp_context():
+    # 多线程的 Web 服务中 fork 可能复制被其他线程持有的锁，优先使用 forkserver
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def get_pool():
+    """
+    获取共享进程池（首次调用时创建）
+
+    Returns:
+        ProcessPoolExecutor，进程池不可用时返回 None
+    """
+    global _pool, _workers
+    if _workers <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None and _workers > 0:
+                try:
+                    _pool = ProcessPoolExecutor(max_workers=_workers, mp_context=_mp_context())
+                except (OSError, NotImplementedError, ImportError):
+                    _workers = 0
+    return _pool
+
+
+def _discard_pool(broken):
+    """丢弃已损坏的进程池（其他线程已替换时不做处理）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not broken:
+            return
+        _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def pool_size():
+    """实际使用的进程数，0 表示当前线程执行"""
+    return _workers if get_pool() is not None else 0
+
+
+def _traced_call(fn, args, kwargs):
+    # 在子进程（或当前线程）中执行任务，收集任务内记录的阶段耗时
+    trace = metrics.StageTrace(forward=True)
+    token = metrics.activate(trace)
+    try:
+        return fn(*args, **kwargs), trace.stages
+    finally:
+        metrics.deactivate(token)
+
+
+def submit(fn, *args, **kwargs):
+    """
+    提交任务
+
+    Args:
+        fn: 模块级函数（子进程中按名称导入）
+        *args, **kwargs: 可 pickle 的参数
+
+    Returns:
+        Future；进程池不可用时任务已在当前线程执行完成
+    """
+    trace = metrics.current_trace()
+    inner = None
+    # 进程池已损坏时丢弃并重新创建一次
+    for _attempt in range(2):
+        pool = get_pool()
+        if pool is None:
+            break
+        try:
+            inner = pool.submit(_traced_call, fn, args, kwargs)
+            break
+        except (BrokenProcessPool, RuntimeError):
+            _discard_pool(pool)
+
+    if inner is None:
+        try:
+            result, stages = _traced_call(fn, args, kwargs)
+        except Exception as e:
+            return done_future(exception=e)
+        metrics.record_stages(stages, trace)
+        return done_future(result)
+
+    future = Future()
+
+    def finish(inner):
+        try:
+            result, stages = inner.result()
+        except BrokenProcessPool as e:
+            # 在途任务随进程池一起失败；丢弃进程池，后续任务使用新的进程池
+            _discard_pool(pool)
+            future.set_exception(e)
+            return
+        except Exception as e:
+            future.set_exception(e)
+            return
+        metrics.record_stages(stages, trace)
+        future.set_result(result)
+
+    inner.add_done_callback(finish)
+    return future
+
+
+def done_future(result=None, exception=None):
+    """
+    创建已完成的 Future（缓存命中、下载失败等不需要进程池的情况）
+    """
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+def run(fn, *args, **kwargs):
+    """提交任务并等待结果"""
+    return submit(fn, *args, **kwargs).result()
+
+
+def window_size():
+    """有序并行时同时在途的任务数（进程数的 2 倍，保证进程不空闲）"""
+    return max(1, pool_size() * 2)
+
+
+def iter_ordered(items, start):
+    """
+    按输入顺序并行处理：窗口内的任务同时执行，结果按原顺序逐个产出
+
+    Args:
+        items: 输入的可迭代对象（逐个读取，不会一次性展开）
+        start: start(item) -> Future
+
+    Yields:
+        tuple: (item, future)，future 已完成
+    """
+    window = window_size()
+    pending = deque()
+    for item in items:
+        pending.append((item, start(item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            future.exception()
+            yield item, future
+    while pending:
+        item, future = pending.popleft()
+        future.exception()
+        yield item, future
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+下载模块自检（本地 HTTP 服务器）
+在本机启动一个 HTTP/1.1 服务器，用真实请求检查下载模块的行为：
+- 连接复用：顺序下载只使用一个 keep-alive 连接，并发下载的连接数不超过下载线程数
+- 大小上限：Content-Length 超过上限时直接拒绝；没有 Content-Length 的超大响应读到上限即中断
+- 条件请求：带 ETag / Last-Modified 的图片再次下载时发送 If-None-Match / If-Modified-Since，
+  304 时复用缓存内容；没有验证信息的响应不保存内容，只记录哈希
+- 缓存上限：内容总大小超过上限时按下载时间淘汰最旧的记录
+- 错误与重试：注入 503 / 连接中断时按退避时间重试，404 不重试，超过重试次数后报告失败
+- 慢主机：注入延迟时，按输入顺序返回会被队首的慢请求挡住，按完成顺序返回不会
+
+用法:
+    python3 download_check.py
+全部通过时退出码为 0，否则为 1。
+"""
+
+import os
+import sys
+import time
+import shutil
+import socket
+import atexit
+import tempfile
+import threading
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 下载缓存使用临时目录，退出时删除
+CACHE_DIR = tempfile.mkdtemp(prefix='download_check_')
+atexit.register(shutil.rmtree, CACHE_DIR, ignore_errors=True)
+os.environ['FETCH_CACHE_DIR'] = CACHE_DIR
+
+import downloader
+from batch_dedup import iter_deduplicated
+from cpu_pool import done_future
+from fetch_cache import FetchCache, get_fetch_cache
+from fetch_scheduler import FETCH_RETRIES
+
+IMAGE_BODY = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 20
+STREAM_CHUNK = 64 * 1024
+STREAM_TOTAL = 64 * 1024 * 1024
+SIZE_LIMIT = 256 * 1024
+LAST_MODIFIED = 'Wed, 01 Jan 2025 00:00:00 GMT'
+SLOW_DELAY = 1.5
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        route = self.server.routes.get(path)
+        with self.server.lock:
+            self.server.requests.append((path, dict(self.headers)))
+        if route is None:
+            self.send_body(b'not found', status=404)
+        else:
+            route(self)
+
+    def send_body(self, data, status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'image/png' if status == 200 else 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CheckServer(ThreadingHTTPServer):
+    """
+    本地测试服务器
+
+    属性:
+        routes: {路径: handler_fn(handler)}
+        connections: 已建立的 TCP 连接数
+        requests: [(路径, 请求头)]
+        streamed: 无长度响应实际写出的字节数
+        version: /etag.png 的内容版本（修改后 ETag 和内容都会变化）
+        not_modified: 返回 304 的次数
+        attempts: 注入错误的路由按 key 参数统计的请求次数
+    """
+
+    daemon_threads = True
+
+    def __init__(self, routes):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.routes = routes
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.streamed = None
+        self.stream_done = threading.Event()
+        self.version = 1
+        self.not_modified = 0
+        self.attempts = {}
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # 客户端主动断开（超过大小上限、连接池关闭）是预期行为
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+
+def _image(handler):
+    handler.send_body(IMAGE_BODY)
+
+
+def _not_modified(handler):
+    with handler.server.lock:
+        handler.server.not_modified += 1
+    handler.send_response(304)
+    handler.send_header('Content-Length', '0')
+    handler.end_headers()
+
+
+def _etag(handler):
+    version = handler.server.version
+    etag = f'"v{version}"'
+    if handler.headers.get('If-None-Match') == etag:
+        _not_modified(handler)
+    else:
+        handler.send_body(IMAGE_BODY + bytes([version]), headers={'ETag': etag})
+
+
+def _last_modified(handler):
+    if handler.headers.get('If-Modified-Since') == LAST_MODIFIED:
+        _not_modified(handler)
+    else:
+        handler.send_body(IMAGE_BODY + b'last-modified', headers={'Last-Modified': LAST_MODIFIED})
+
+
+def _query(handler):
+    return {name: values[0] for name, values in parse_qs(urlsplit(handler.path).query).items()}
+
+
+def _slow(handler):
+    # 注入延迟：?delay=秒
+    time.sleep(float(_query(handler).get('delay', SLOW_DELAY)))
+    handler.send_body(IMAGE_BODY)
+
+
+def _flaky(handler):
+    # 注入错误：同一 key 的前 fail 次请求按 mode 失败（503 或直接断开连接），之后正常返回
+    query = _query(handler)
+    with handler.server.lock:
+        attempt = handler.server.attempts.get(query['key'], 0)
+        handler.server.attempts[query['key']] = attempt + 1
+    if attempt >= int(query.get('fail', 1)):
+        handler.send_body(IMAGE_BODY)
+    elif query.get('mode') == 'reset':
+        handler.close_connection = True
+        handler.connection.shutdown(socket.SHUT_RDWR)
+    else:
+        handler.send_body(b'unavailable', status=503, headers={'Retry-After': '0'})
+
+
+def _declared_large(handler):
+    handler.send_body(b'\0' * (SIZE_LIMIT + 1))
+
+
+def _undeclared_large(handler):
+    # 不给出 Content-Length，一直写到客户端断开
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'image/png')
+    handler.send_header('Connection', 'close')
+    handler.end_headers()
+    handler.close_connection = True
+    sent = 0
+    try:
+        while sent < STREAM_TOTAL:
+            handler.wfile.write(b'\0' * STREAM_CHUNK)
+            sent += STREAM_CHUNK
+    except OSError:
+        pass
+    handler.server.streamed = sent
+    handler.server.stream_done.set()
+
+
+ROUTES = {
+    '/image.png': _image,
+    '/etag.png': _etag,
+    '/last-modified.png': _last_modified,
+    '/slow.png': _slow,
+    '/flaky.png': _flaky,
+    '/declared-large.png': _declared_large,
+    '/undeclared-large.png': _undeclared_large,
+}
+
+
+# ==================== 检查项 ====================
+
+def check_connection_reuse(server):
+    """顺序下载复用同一个连接；并发下载的连接数不超过下载线程数"""
+    base = server.base_url
+    before = server.connections
+    for i in range(10):
+        if downloader.fetch(f'{base}/image.png?n={i}') != IMAGE_BODY:
+            return False, '下载内容与服务器返回的不一致'
+    sequential = server.connections - before
+    if sequential != 1:
+        return False, f'顺序下载 10 次建立了 {sequential} 个连接（应为 1）'
+
+    workers = 4
+    before = server.connections
+    urls = [f'{base}/image.png?batch={i}' for i in range(40)]
+    results = list(downloader.iter_downloads(urls, workers))
+    concurrent = server.connections - before
+    if any(error is not None or data != IMAGE_BODY for _url, data, error, _changed in results):
+        return False, '并发下载有失败或内容不一致'
+    if concurrent > workers:
+        return False, f'{workers} 个下载线程建立了 {concurrent} 个连接'
+    return True, f'顺序下载 10 次使用 1 个连接；{workers} 线程并发下载 40 次使用 {concurrent} 个新连接'
+
+
+def check_size_limit(server):
+    """Content-Length 超限直接拒绝；没有 Content-Length 时读到上限即中断，不读完整个响应"""
+    base = server.base_url
+    session = downloader.get_session()
+
+    try:
+        downloader.read_body(session.get(f'{base}/declared-large.png', stream=True), max_bytes=SIZE_LIMIT)
+        return False, 'Content-Length 超过上限时没有拒绝'
+    except downloader.DownloadTooLarge:
+        pass
+
+    try:
+        downloader.read_body(session.get(f'{base}/undeclared-large.png', stream=True), max_bytes=SIZE_LIMIT)
+        return False, '没有 Content-Length 的超大响应没有被拒绝'
+    except downloader.DownloadTooLarge:
+        pass
+    if not server.stream_done.wait(10):
+        return False, '客户端中断后服务器仍在写出响应'
+    if server.streamed >= STREAM_TOTAL:
+        return False, '超过上限后仍读完了整个响应'
+
+    data = downloader.read_body(session.get(f'{base}/image.png', stream=True), max_bytes=SIZE_LIMIT)
+    if data != IMAGE_BODY:
+        return False, '上限以内的图片下载内容不一致'
+    return True, (f'上限 {SIZE_LIMIT} 字节：声明超限直接拒绝；无长度响应在服务器写出 '
+                  f'{server.streamed // 1024} KB 时中断（共 {STREAM_TOTAL // 1024 // 1024} MB）')
+
+
+def _last_request(server, path):
+    with server.lock:
+        return next(headers for request_path, headers in reversed(server.requests) if request_path == path)
+
+
+def check_conditional_requests(server):
+    """带验证信息的响应再次下载时发条件请求并复用缓存；内容变化时 changed 为 True"""
+    base = server.base_url
+    cache = get_fetch_cache()
+    if cache is None:
+        return False, '下载缓存没有启用'
+
+    for path, header in (('/etag.png', 'If-None-Match'), ('/last-modified.png', 'If-Modified-Since')):
+        url = f'{base}{path}'
+        data, changed = downloader.fetch_validated(url)
+        if not changed or header in _last_request(server, path):
+            return False, f'{path} 首次下载应为无条件请求且 changed=True'
+        not_modified = server.not_modified
+        cached, changed = downloader.fetch_validated(url)
+        if header not in _last_request(server, path):
+            return False, f'{path} 再次下载没有发送 {header}'
+        if server.not_modified != not_modified + 1 or cached != data or changed:
+            return False, f'{path} 收到 304 后没有复用缓存内容'
+
+    server.version += 1
+    data, changed = downloader.fetch_validated(f'{base}/etag.png')
+    if not changed or data != IMAGE_BODY + bytes([server.version]):
+        return False, 'ETag 变化后没有重新下载新内容'
+
+    url = f'{base}/image.png?plain'
+    downloader.fetch_validated(url)
+    data, changed = downloader.fetch_validated(url)
+    entry = cache.lookup(url)
+    if changed or entry is None:
+        return False, '没有验证信息的响应内容未变时 changed 应为 False'
+    if os.path.exists(cache._blob_path(entry['content_hash'])):
+        return False, '没有验证信息的响应不应保存内容'
+    return True, 'ETag / Last-Modified 再次下载均收到 304 并复用缓存；无验证信息的响应只记录哈希'
+
+
+def check_cache_limit(server):
+    """内容总大小超过上限时按 fetched_at 淘汰最旧的记录，并删除不再引用的内容文件"""
+    count, limit = 20, 8 * (len(IMAGE_BODY) + 1)
+    cache_dir = tempfile.mkdtemp(dir=CACHE_DIR)
+    cache = FetchCache(cache_dir, max_bytes=limit)
+    urls = [f'{server.base_url}/cached/{i}.png' for i in range(count)]
+    for i, url in enumerate(urls):
+        cache.store(url, IMAGE_BODY + bytes([i]), etag=f'"{i}"')
+
+    stored = cache.stored_bytes()
+    if stored > limit:
+        return False, f'缓存内容 {stored} 字节超过上限 {limit}'
+    if cache.lookup(urls[0]) is not None or cache.lookup(urls[-1]) is None:
+        return False, '淘汰顺序不是最旧优先'
+    blobs = sum(len(files) for _root, _dirs, files in os.walk(os.path.join(cache_dir, 'blobs')))
+    kept = sum(cache.lookup(url) is not None for url in urls)
+    if blobs != kept:
+        return False, f'保留 {kept} 条记录，但内容文件有 {blobs} 个'
+    return True, f'上限 {limit} 字节：写入 {count} 条后保留最新的 {kept} 条（{stored} 字节）'
+
+
+def check_retries(server):
+    """503 和连接中断按退避重试；404 不重试；一直失败时重试 FETCH_RETRIES 次后报告错误"""
+    base = server.base_url
+    urls = [
+        f'{base}/flaky.png?key=503&fail={FETCH_RETRIES}',
+        f'{base}/flaky.png?key=reset&fail=1&mode=reset',
+        f'{base}/flaky.png?key=down&fail=100',
+        f'{base}/missing.png',
+    ]
+    results = {url: error for url, _data, error, _changed in downloader.iter_downloads(urls, 4)}
+    if results[urls[0]] is not None or results[urls[1]] is not None:
+        return False, f'可重试的错误重试后仍失败: {results[urls[0]] or results[urls[1]]}'
+    if results[urls[2]] is None or results[urls[3]] is None:
+        return False, '一直失败的 URL 没有报告错误'
+
+    attempts = server.attempts
+    missing = sum(path == '/missing.png' for path, _headers in server.requests)
+    if attempts['503'] != FETCH_RETRIES + 1 or attempts['down'] != FETCH_RETRIES + 1 or missing != 1:
+        return False, f"请求次数不符：503 {attempts['503']} 次，一直失败 {attempts['down']} 次，404 {missing} 次"
+    return True, (f'503 / 连接中断重试后成功；一直 503 的 URL 请求 {FETCH_RETRIES + 1} 次后失败；'
+                  f'404 只请求 1 次')
+
+
+def _time_to_results(results, count):
+    """读取前 count 个结果所用的秒数，以及全部结果"""
+    start = time.perf_counter()
+    collected, elapsed = [], None
+    for item in results:
+        collected.append(item)
+        if len(collected) == count:
+            elapsed = time.perf_counter() - start
+    return elapsed, collected
+
+
+def check_slow_head(server):
+    """队首是慢请求时：按输入顺序返回要等它完成；按完成顺序返回时其他结果先到，并能按行号对应"""
+    base = server.base_url
+    workers, fast = 4, 40
+    urls = [f'{base}/slow.png?delay={SLOW_DELAY}'] + [f'{base}/image.png?fast={i}' for i in range(fast)]
+
+    ordered_elapsed, ordered = _time_to_results(downloader.iter_downloads(urls, workers), fast // 2)
+    if [url for url, *_rest in ordered] != urls:
+        return False, '按输入顺序返回时顺序不一致'
+    if ordered_elapsed < SLOW_DELAY:
+        return False, '按输入顺序返回时队首的慢请求没有挡住后面的结果'
+
+    completed_elapsed, completed = _time_to_results(downloader.iter_downloads(urls, workers, ordered=False), fast // 2)
+    if sorted(url for url, *_rest in completed) != sorted(urls) or completed[-1][0] != urls[0]:
+        return False, '按完成顺序返回时结果缺失，或慢请求不是最后一个'
+    if completed_elapsed >= SLOW_DELAY:
+        return False, f'按完成顺序返回时前 {fast // 2} 个结果仍被慢请求挡住'
+
+    # 去重后按完成顺序逐行产出：每行的行号与清单一致，重复行也能拿到结果
+    rows = urls + urls[1:3]
+    items = list(iter_deduplicated(
+        rows, lambda unique: downloader.iter_downloads(unique, workers, ordered=False),
+        lambda data: done_future(len(data)), ordered=False))
+    if sorted(idx for idx, *_rest in items) != list(range(1, len(rows) + 1)):
+        return False, '按完成顺序去重后行号缺失或重复'
+    if any(rows[idx - 1] != url or future.result() != len(IMAGE_BODY) for idx, url, future, _changed in items):
+        return False, '按完成顺序去重后行号与 URL 不对应'
+    return True, (f'队首延迟 {SLOW_DELAY}s：按输入顺序前 {fast // 2} 个结果用时 {ordered_elapsed:.2f}s，'
+                  f'按完成顺序用时 {completed_elapsed:.2f}s')
+
+
+CHECKS = (
+    ('连接复用', check_connection_reuse),
+    ('下载大小上限', check_size_limit),
+    ('条件请求与下载缓存', check_conditional_requests),
+    ('下载缓存容量上限', check_cache_limit),
+    ('错误注入与重试', check_retries),
+    ('慢主机与结果顺序', check_slow_head),
+)
+
+
+def main():
+    server = CheckServer(ROUTES).start()
+    failed = 0
+    try:
+        for name, check in CHECKS:
+            start = time.perf_counter()
+            try:
+                ok, message = check(server)
+            except Exception as e:
+                ok, message = False, f'{type(e).__name__}: {e}'
+            elapsed = time.perf_counter() - start
+            print(f"{'✅' if ok else '❌'} {name}（{elapsed:.2f}s）: {message}")
+            failed += not ok
+    finally:
+        server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
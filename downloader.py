@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+图片下载模块
+复用连接池（keep-alive）并发下载图片，结果按输入顺序（或完成顺序）返回
+启用下载缓存时使用条件请求，内容未变化的 URL 不再重复下载
+按主机自适应限制并发，临时错误自动重试（见 fetch_scheduler）
+响应内容分块流式读取，超过 MAX_DOWNLOAD_BYTES 立即中断，单张图片不会占满内存
+"""
+
+import os
+import queue
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from fetch_cache import CACHE_ERRORS, get_fetch_cache
+from fetch_scheduler import FetchScheduler, fetch_with_retry
+from metrics import DOWNLOAD_BYTES, stage
+
+DOWNLOAD_TIMEOUT = 10
+DEFAULT_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', '8'))
+MAX_WORKERS = 32
+# 单张图片的下载大小上限（字节），0 表示不限制
+MAX_DOWNLOAD_BYTES = int(os.environ.get('MAX_DOWNLOAD_BYTES', str(32 * 1024 * 1024)))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class DownloadTooLarge(requests.exceptions.RequestException):
+    """图片文件超过 MAX_DOWNLOAD_BYTES（不可重试）"""
+
+
+def get_session():
+    """
+    获取共享的 requests Session（连接池大小与最大并发数一致）
+
+    Returns:
+        requests.Session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def normalize_workers(workers):
+    """
+    规范化并发数：空值使用默认值，并限制在 1 ~ MAX_WORKERS 之间
+
+    Args:
+        workers: 期望的并发数（int / str / None）
+
+    Returns:
+        int: 实际并发数
+    """
+    try:
+        workers = int(workers) if workers not in (None, '') else DEFAULT_WORKERS
+    except (TypeError, ValueError):
+        workers = DEFAULT_WORKERS
+    return max(1, min(MAX_WORKERS, workers))
+
+
+def read_body(response, max_bytes=MAX_DOWNLOAD_BYTES):
+    """
+    检查响应状态并分块读取内容，超过大小上限时立即中断；读取结束后关闭响应
+
+    Content-Length 已超过上限时不读取内容；Content-Length 缺失或不准确时按实际读取的字节数判断
+    （gzip 等压缩内容按解压后的大小计算）。
+
+    Args:
+        response: 以 stream=True 发出的请求的响应
+        max_bytes: 大小上限（字节），0 表示不限制
+
+    Returns:
+        bytes: 响应内容
+
+    Raises:
+        requests.exceptions.HTTPError: 响应状态码表示错误
+        DownloadTooLarge: 内容超过大小上限
+    """
+    try:
+        response.raise_for_status()
+
+        length = response.headers.get('Content-Length', '')
+        if max_bytes and length.isdigit() and int(length) > max_bytes:
+            raise DownloadTooLarge(
+                f'图片文件过大（{int(length)} 字节），超过上限 {max_bytes} 字节', response=response
+            )
+
+        chunks = []
+        received = 0
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            received += len(chunk)
+            if max_bytes and received > max_bytes:
+                raise DownloadTooLarge(f'图片文件过大，超过上限 {max_bytes} 字节', response=response)
+            chunks.append(chunk)
+        DOWNLOAD_BYTES.inc(received, kind='full')
+        return b''.join(chunks)
+    finally:
+        # 未读完就关闭时连接直接断开，不会回到连接池
+        response.close()
+
+
+def fetch_validated(url, timeout=DOWNLOAD_TIMEOUT):
+    """
+    下载单张图片，启用下载缓存时发送条件请求（If-None-Match / If-Modified-Since）
+
+    服务器返回 304 时直接复用本地缓存的内容。
+
+    Args:
+        url: 图片URL
+        timeout: 超时时间（秒）
+
+    Returns:
+        tuple: (data, changed)，changed 表示内容与上次下载相比是否有变化
+
+    Raises:
+        requests.exceptions.RequestException: 下载失败（包括超过大小上限的 DownloadTooLarge）
+    """
+    with stage('download'):
+        cache = get_fetch_cache()
+        entry = None
+        if cache is not None:
+            try:
+                entry = cache.lookup(url)
+            except CACHE_ERRORS:
+                cache = None
+
+        headers = cache.validation_headers(entry) if cache is not None else {}
+        response = get_session().get(url, timeout=timeout, headers=headers, stream=True)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            data = cache.load(entry['content_hash'])
+            if data is not None:
+                try:
+                    cache.touch(url)
+                except CACHE_ERRORS:
+                    pass
+                return data, False
+            # 缓存内容丢失，重新完整下载
+            response = get_session().get(url, timeout=timeout, stream=True)
+
+        data = read_body(response)
+
+        changed = True
+        if cache is not None:
+            try:
+                content_hash = cache.store(
+                    url, data,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified')
+                )
+                changed = entry is None or entry['content_hash'] != content_hash
+            except CACHE_ERRORS:
+                pass
+
+        return data, changed
+
+
+def fetch(url, timeout=DOWNLOAD_TIMEOUT):
+    """
+    下载单张图片（遵守主机并发上限，临时错误自动重试）
+
+    Args:
+        url: 图片URL
+        timeout: 单次请求超时时间（秒）
+
+    Returns:
+        bytes: 图片数据
+
+    Raises:
+        requests.exceptions.RequestException: 下载失败（重试后仍失败）
+    """
+    return fetch_with_retry(lambda u: fetch_validated(u, timeout), url)[0]
+
+
+def iter_downloads(urls, workers=None, ordered=True):
+    """
+    并发下载图片，按输入顺序（ordered=False 时按完成顺序）逐个返回结果
+
+    Args:
+        urls: URL 可迭代对象
+        workers: 并发线程数（默认 DEFAULT_WORKERS）
+        ordered: 是否按输入顺序返回（见 iter_scheduled）
+
+    Yields:
+        tuple: (url, data, error, changed)，下载成功时 error 为 None，失败时 data 为 None；
+               changed 表示内容与上次下载相比是否有变化
+    """
+    for url, result, error in iter_scheduled(fetch_validated, urls, workers, ordered):
+        if error is not None:
+            yield url, None, error, True
+        else:
+            data, changed = result
+            yield url, data, None, changed
+
+
+def iter_scheduled(fetch_fn, urls, workers=None, ordered=True):
+    """
+    用下载调度器并发执行 fetch_fn(url)，按输入顺序逐个返回结果
+
+    同时在途的任务数不超过 workers * 4，内存占用与清单长度无关。
+    下载线程在各主机之间轮流调度，单个主机受自适应并发上限约束；
+    可重试的错误按退避时间重试，整批共享一个重试预算。
+
+    按输入顺序返回时，队首的慢请求（慢主机、重试退避）会挡住后面已完成的结果：
+    窗口填满后不再提交新任务，直到队首完成。ordered=False 时按完成顺序返回，
+    慢请求只占用窗口中的一个位置，调用方需自行按行号对应结果。
+
+    Args:
+        fetch_fn: fetch_fn(url) 执行一次请求
+        urls: URL 可迭代对象
+        workers: 并发线程数（默认 DEFAULT_WORKERS）
+        ordered: 是否按输入顺序返回
+
+    Yields:
+        tuple: (url, result, error)，成功时 error 为 None，失败时 result 为 None
+    """
+    workers = normalize_workers(workers)
+    # 窗口大于线程数：某个主机变慢时，其他主机的任务仍可继续下载
+    window = workers * 4
+    if not ordered:
+        yield from _iter_completed(fetch_fn, urls, workers, window)
+        return
+    pending = deque()
+
+    scheduler = FetchScheduler(fetch_fn, workers)
+    try:
+        for url in urls:
+            pending.append((url, scheduler.submit(url)))
+            if len(pending) >= window:
+                url, ticket = pending.popleft()
+                yield (url, *ticket.result())
+        while pending:
+            url, ticket = pending.popleft()
+            yield (url, *ticket.result())
+    finally:
+        scheduler.close()
+
+
+def _iter_completed(fetch_fn, urls, workers, window):
+    """iter_scheduled 的按完成顺序版本：最多 window 个任务在途，完成一个补充一个"""
+    done = queue.SimpleQueue()
+    in_flight = 0
+
+    scheduler = FetchScheduler(fetch_fn, workers)
+    try:
+        for url in urls:
+            scheduler.submit(url, on_done=done.put)
+            in_flight += 1
+            if in_flight >= window:
+                ticket = done.get()
+                in_flight -= 1
+                yield (ticket.url, *ticket.outcome)
+        while in_flight:
+            ticket = done.get()
+            in_flight -= 1
+            yield (ticket.url, *ticket.outcome)
+    finally:
+        scheduler.close()
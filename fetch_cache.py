@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+URL 下载缓存模块
+记录每个 URL 的 ETag / Last-Modified 和内容，支持条件请求（304 时复用本地内容）
+
+默认关闭，设置 FETCH_CACHE_DIR 后启用。只有带 ETag / Last-Modified 的响应才保存内容；
+没有验证信息的响应只记录内容哈希（增量模式据此判断内容是否变化）。
+增量模式的检测结论（不含预览图）按内容哈希 + 规则指纹保存在同一数据库中，内容未变化的 URL 直接复用，
+不再解码检测；记录随引用该内容的最后一个 URL 一起删除。
+内容总大小超过 FETCH_CACHE_MAX_BYTES 时按最近下载 / 验证时间（fetched_at）删除最旧的记录。
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+DEFAULT_CACHE_DIR = os.environ.get('FETCH_CACHE_DIR', '')
+DEFAULT_MAX_BYTES = int(os.environ.get('FETCH_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# 超出上限时删除到上限的该比例，避免每次写入都触发淘汰
+EVICT_RATIO = 0.9
+
+# 保存了内容的记录（有验证信息才能发条件请求、复用内容）
+_VALIDATED = '(etag IS NOT NULL OR last_modified IS NOT NULL)'
+
+# 缓存读写可能出现的异常（调用方捕获后按未缓存处理）
+CACHE_ERRORS = (OSError, sqlite3.Error)
+
+
+class FetchCache:
+    """
+    持久化 URL 下载缓存
+
+    - 元数据（etag、last_modified、内容哈希）存放在 SQLite 中
+    - 图片内容按 sha256 存放在 blobs/ 目录，相同内容只保存一份；只保存有验证信息的响应
+    - 内容总大小不超过 max_bytes（0 表示不限制），按 fetched_at 淘汰最旧的记录
+    - 检测结论按 (内容哈希, 规则指纹) 保存，只要还有 URL 引用该内容就保留
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(cache_dir, 'fetch_cache.sqlite3')
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, 'blobs'), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                'content_hash TEXT NOT NULL, size INTEGER, fetched_at REAL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS verdicts ('
+                'content_hash TEXT NOT NULL, fingerprint TEXT NOT NULL, verdict TEXT NOT NULL, '
+                'PRIMARY KEY (content_hash, fingerprint))'
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.cache_dir, 'blobs', content_hash[:2], content_hash)
+
+    def lookup(self, url):
+        """
+        查询 URL 的缓存记录
+
+        Returns:
+            dict: {etag, last_modified, content_hash, size}，无记录或内容丢失时返回 None；
+                  没有验证信息的记录不保存内容，只用于比较内容哈希
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                'SELECT etag, last_modified, content_hash, size FROM entries WHERE url = ?',
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        if (row[0] or row[1]) and not os.path.exists(self._blob_path(row[2])):
+            return None
+        return {
+            'etag': row[0],
+            'last_modified': row[1],
+            'content_hash': row[2],
+            'size': row[3],
+        }
+
+    def validation_headers(self, entry):
+        """
+        根据缓存记录生成条件请求头
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since
+        """
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def load(self, content_hash):
+        """
+        读取缓存的图片内容
+
+        Returns:
+            bytes，文件不存在时返回 None
+        """
+        try:
+            with open(self._blob_path(content_hash), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def store(self, url, data, etag=None, last_modified=None):
+        """
+        保存下载结果：有验证信息时保存内容，否则只记录内容哈希
+
+        Returns:
+            str: 内容哈希（sha256）
+        """
+        etag = etag or None
+        last_modified = last_modified or None
+        content_hash = content_digest(data)
+        path = self._blob_path(content_hash)
+        if (etag or last_modified) and not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        with self._lock, self._connect() as conn:
+            previous = conn.execute('SELECT content_hash FROM entries WHERE url = ?', (url,)).fetchone()
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (url, etag, last_modified, content_hash, size, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (url, etag, last_modified, content_hash, len(data), time.time())
+            )
+            released = [previous[0]] if previous and previous[0] != content_hash else []
+            if etag or last_modified:
+                released += self._evict(conn)
+            self._remove_unreferenced(conn, released)
+        return content_hash
+
+    def load_verdict(self, content_hash, fingerprint):
+        """
+        读取内容对应的检测结论
+
+        Returns:
+            dict，没有记录时返回 None
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                'SELECT verdict FROM verdicts WHERE content_hash = ? AND fingerprint = ?',
+                (content_hash, fingerprint)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def store_verdict(self, content_hash, fingerprint, verdict):
+        """
+        保存内容对应的检测结论（可 JSON 序列化，不含预览图）；没有 URL 引用该内容时不保存
+        """
+        raw = json.dumps(verdict, ensure_ascii=False)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO verdicts (content_hash, fingerprint, verdict) '
+                'SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM entries WHERE content_hash = ?)',
+                (content_hash, fingerprint, raw, content_hash)
+            )
+
+    def stored_bytes(self):
+        """已保存内容的总大小（字节，相同内容只计一次）"""
+        with self._lock, self._connect() as conn:
+            return self._stored_bytes(conn)
+
+    def _stored_bytes(self, conn):
+        row = conn.execute(
+            f'SELECT SUM(size) FROM (SELECT MAX(size) AS size FROM entries WHERE {_VALIDATED} GROUP BY content_hash)'
+        ).fetchone()
+        return row[0] or 0
+
+    def _evict(self, conn):
+        """
+        内容总大小超过上限时，按 fetched_at 从旧到新删除记录（调用方需持有锁）
+
+        Returns:
+            list: 被删除记录的内容哈希
+        """
+        if not self.max_bytes:
+            return []
+        total = self._stored_bytes(conn)
+        if total <= self.max_bytes:
+            return []
+
+        target = self.max_bytes * EVICT_RATIO
+        released = []
+        rows = conn.execute(
+            f'SELECT url, content_hash, size FROM entries WHERE {_VALIDATED} ORDER BY fetched_at'
+        ).fetchall()
+        for url, content_hash, size in rows:
+            if total <= target:
+                break
+            conn.execute('DELETE FROM entries WHERE url = ?', (url,))
+            released.append(content_hash)
+            # 同一内容可能被多个 URL 引用，最后一个引用删除后才释放空间
+            shared = conn.execute(
+                f'SELECT 1 FROM entries WHERE content_hash = ? AND {_VALIDATED} LIMIT 1', (content_hash,)
+            ).fetchone()
+            if shared is None:
+                total -= size or 0
+        return released
+
+    def _remove_unreferenced(self, conn, content_hashes):
+        """删除不再被有验证信息的记录引用的内容文件，以及不再被任何记录引用的检测结论（调用方需持有锁）"""
+        for content_hash in set(content_hashes):
+            if conn.execute('SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1', (content_hash,)).fetchone() is None:
+                conn.execute('DELETE FROM verdicts WHERE content_hash = ?', (content_hash,))
+            referenced = conn.execute(
+                f'SELECT 1 FROM entries WHERE content_hash = ? AND {_VALIDATED} LIMIT 1', (content_hash,)
+            ).fetchone()
+            if referenced is None:
+                try:
+                    os.remove(self._blob_path(content_hash))
+                except OSError:
+                    pass
+
+    def touch(self, url):
+        """记录一次 304 重新验证"""
+        with self._lock, self._connect() as conn:
+            conn.execute('UPDATE entries SET fetched_at = ? WHERE url = ?', (time.time(), url))
+
+
+def content_digest(data):
+    """内容哈希（sha256 十六进制），与缓存记录中的 content_hash 一致"""
+    return hashlib.sha256(data).hexdigest()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_fetch_cache():
+    """
+    获取默认的下载缓存（FETCH_CACHE_DIR 为空时禁用，返回 None）
+    """
+    global _default_cache
+    if not DEFAULT_CACHE_DIR:
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                try:
+                    _default_cache = FetchCache(DEFAULT_CACHE_DIR)
+                except CACHE_ERRORS:
+                    return None
+    return _default_cache
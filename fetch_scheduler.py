@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+下载调度模块
+按主机自适应限制并发（AIMD：成功时加性增加，出错或明显变慢时乘性减少），
+可重试的错误（超时、连接错误、429、5xx）按指数退避 + 随机抖动重试，
+同一批下载共享重试预算；各主机轮流调度，慢主机只占用自己的并发配额，不会占满全部下载线程
+"""
+
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+import requests
+
+HOST_INITIAL_LIMIT = int(os.environ.get('HOST_INITIAL_CONCURRENCY', '8'))
+HOST_MAX_LIMIT = int(os.environ.get('HOST_MAX_CONCURRENCY', '32'))
+HOST_MIN_LIMIT = 1
+DECREASE_FACTOR = 0.5        # 出错或变慢时并发上限乘以该系数
+SLOW_FACTOR = 3.0            # 延迟超过基准延迟的倍数视为拥塞
+SLOW_MIN_LATENCY = 0.5       # 低于该延迟（秒）的请求不视为变慢
+
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', '2'))   # 每个 URL 最多重试次数（不含首次请求）
+RETRY_BASE_DELAY = 0.2       # 秒
+RETRY_MAX_DELAY = 5.0        # 秒，同时也是 Retry-After 的上限
+RETRY_BUDGET_MIN = 10        # 每批至少允许的重试次数
+RETRY_BUDGET_RATIO = 0.2     # 每发出一个请求增加的重试额度
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+def host_of(url):
+    """URL 的主机名（含端口），用于按主机限流"""
+    try:
+        return urlparse(url).netloc.lower()
+    except ValueError:
+        return ''
+
+
+def is_retryable(error):
+    """
+    判断下载错误是否值得重试：超时、连接错误、429 和 5xx
+
+    Args:
+        error: 下载时抛出的异常
+
+    Returns:
+        bool
+    """
+    if isinstance(error, (requests.exceptions.ConnectionError,
+                          requests.exceptions.Timeout,
+                          requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRYABLE_STATUS
+    return False
+
+
+def retry_delay(attempt, error=None):
+    """
+    计算重试等待时间：服务器给出 Retry-After 时优先使用，否则指数退避 + 完全随机抖动
+
+    Args:
+        attempt: 已重试次数（从 0 开始）
+        error: 上一次的异常
+
+    Returns:
+        float: 等待秒数
+    """
+    response = getattr(error, 'response', None)
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(RETRY_MAX_DELAY, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+class HostLimiter:
+    """
+    单个主机的自适应并发上限（AIMD）
+
+    成功且延迟正常：上限增加 1/上限（约每轮增加 1）；
+    可重试的错误或延迟超过基准 SLOW_FACTOR 倍：上限乘以 DECREASE_FACTOR，一个延迟周期内只减少一次。
+    """
+
+    def __init__(self, initial=HOST_INITIAL_LIMIT, maximum=HOST_MAX_LIMIT):
+        self.maximum = max(HOST_MIN_LIMIT, maximum)
+        self.limit = float(max(HOST_MIN_LIMIT, min(self.maximum, initial)))
+        self.in_flight = 0
+        self.base_latency = None
+        self.stats = {'successes': 0, 'failures': 0, 'decreases': 0}
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self):
+        """不阻塞地占用一个并发名额，已达上限时返回 False"""
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        """阻塞直到占用一个并发名额"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, ok, latency):
+        """
+        释放名额并根据本次请求结果调整上限
+
+        Args:
+            ok: 请求是否正常（不可重试的错误如 404 也算正常：主机已正常响应）
+            latency: 请求耗时（秒）
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if ok:
+                self.stats['successes'] += 1
+                # 基准延迟：取观察到的最小值，并缓慢向近期延迟靠拢
+                if self.base_latency is None or latency < self.base_latency:
+                    self.base_latency = latency
+                else:
+                    self.base_latency += (latency - self.base_latency) * 0.01
+
+                if latency > SLOW_MIN_LATENCY and latency > self.base_latency * SLOW_FACTOR:
+                    self._decrease(now)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            else:
+                self.stats['failures'] += 1
+                self._decrease(now)
+            self._cond.notify_all()
+
+    def _decrease(self, now):
+        # 调用方需持有锁；同一波错误只减少一次，避免并发直接降到底
+        if now - self._last_decrease < max(self.base_latency or 0.0, RETRY_BASE_DELAY):
+            return
+        self.limit = max(HOST_MIN_LIMIT, self.limit * DECREASE_FACTOR)
+        self._last_decrease = now
+        self.stats['decreases'] += 1
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'limit': round(self.limit, 2),
+                'in_flight': self.in_flight,
+                'base_latency': round(self.base_latency, 4) if self.base_latency is not None else None,
+                **self.stats
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_host_limiter(host):
+    """
+    获取主机的并发限制器（进程内共享，跨批次保留学习到的上限）
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = HostLimiter()
+        return limiter
+
+
+def host_stats():
+    """各主机当前的并发上限和请求统计"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {host: limiter.snapshot() for host, limiter in limiters.items()}
+
+
+class RetryBudget:
+    """
+    一批下载共享的重试预算：初始 minimum 次，每发出一个请求增加 ratio 次
+
+    主机大面积故障时重试次数被限制在请求数的固定比例内，不会成倍放大请求量。
+    """
+
+    def __init__(self, minimum=RETRY_BUDGET_MIN, ratio=RETRY_BUDGET_RATIO):
+        self.ratio = ratio
+        self.used = 0
+        self.denied = 0
+        self._tokens = float(minimum)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens += self.ratio
+
+    def withdraw(self):
+        """申请一次重试，预算不足时返回 False"""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.used += 1
+                return True
+            self.denied += 1
+            return False
+
+
+def fetch_with_retry(fetch_fn, url, budget=None, retries=FETCH_RETRIES):
+    """
+    单个 URL 的下载：遵守主机并发上限，可重试的错误按退避时间重试
+
+    Args:
+        fetch_fn: fetch_fn(url) 执行一次下载
+        url: 图片URL
+        budget: 可选，共享的 RetryBudget
+        retries: 最多重试次数
+
+    Returns:
+        fetch_fn 的返回值
+
+    Raises:
+        最后一次下载的异常
+    """
+    limiter = get_host_limiter(host_of(url))
+    attempt = 0
+    while True:
+        if budget is not None:
+            budget.deposit()
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            result = fetch_fn(url)
+        except Exception as e:
+            retryable = is_retryable(e)
+            limiter.release(not retryable, time.monotonic() - start)
+            if retryable and attempt < retries and (budget is None or budget.withdraw()):
+                time.sleep(retry_delay(attempt, e))
+                attempt += 1
+                continue
+            raise
+        limiter.release(True, time.monotonic() - start)
+        return result
+
+
+class _Ticket:
+    """调度器中的一个下载任务"""
+
+    def __init__(self, url, on_done=None):
+        self.url = url
+        # 提交方的上下文（请求的阶段耗时记录等），下载线程在其中执行下载
+        self.context = contextvars.copy_context()
+        self.limiter = get_host_limiter(host_of(url))
+        self.attempt = 0
+        self.not_before = 0.0
+        self.outcome = None
+        self._on_done = on_done
+        self._done = threading.Event()
+
+    def finish(self, outcome):
+        self.outcome = outcome
+        self._done.set()
+        if self._on_done is not None:
+            self._on_done(self)
+
+    def result(self):
+        """等待下载完成，返回 (result, error)"""
+        self._done.wait()
+        return self.outcome
+
+
+class FetchScheduler:
+    """
+    批量下载调度器
+
+    下载线程在各主机的队列之间轮流取任务，只选择未达到并发上限、且不在退避等待中的任务；
+    失败的任务按退避时间重新排队，不占用下载线程等待。
+    """
+
+    # 有主机因并发上限暂时不可调度时，重新检查的间隔（秒）
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, fetch_fn, workers, retries=FETCH_RETRIES, budget=None):
+        self.fetch_fn = fetch_fn
+        self.retries = retries
+        self.budget = budget if budget is not None else RetryBudget()
+        self._queues = OrderedDict()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, url, on_done=None):
+        """
+        提交下载任务
+
+        下载在提交时的上下文副本中执行：提交方请求的阶段耗时（metrics.stage）包含下载耗时，
+        并发下载的累计耗时和时间范围分别记录（见 metrics.stage_breakdown）
+
+        Args:
+            url: 图片URL
+            on_done: 可选，on_done(ticket) 在任务完成时（下载线程中）调用
+
+        Returns:
+            _Ticket: 调用 result() 等待 (result, error)
+        """
+        ticket = _Ticket(url, on_done)
+        with self._cond:
+            self._enqueue(ticket)
+            self._cond.notify()
+        return ticket
+
+    def close(self):
+        """停止调度：正在下载的任务完成后下载线程退出，未开始的任务不再执行"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _enqueue(self, ticket):
+        # 调用方需持有锁
+        # 按主机分队列（以主机的限制器为键）
+        if ticket.limiter not in self._queues:
+            self._queues[ticket.limiter] = deque()
+        self._queues[ticket.limiter].append(ticket)
+
+    def _next_ticket(self):
+        """
+        轮流检查各主机，取出第一个可以开始的任务（调用方需持有锁）
+
+        Returns:
+            tuple: (ticket, wait)，没有可开始的任务时 ticket 为 None，wait 为建议等待秒数（None 表示等待通知）
+        """
+        now = time.monotonic()
+        wait = None
+        for _ in range(len(self._queues)):
+            limiter, queue = next(iter(self._queues.items()))
+            self._queues.move_to_end(limiter)
+
+            ready = next((t for t in queue if t.not_before <= now), None)
+            if ready is None:
+                earliest = min(t.not_before for t in queue) - now
+                wait = earliest if wait is None else min(wait, earliest)
+                continue
+            if not limiter.try_acquire():
+                wait = self.POLL_INTERVAL if wait is None else min(wait, self.POLL_INTERVAL)
+                continue
+
+            queue.remove(ready)
+            if not queue:
+                del self._queues[limiter]
+            return ready, None
+        return None, wait
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    ticket, wait = self._next_ticket()
+                    if ticket is not None:
+                        break
+                    self._cond.wait(wait)
+            self._run(ticket)
+
+    def _run(self, ticket):
+        self.budget.deposit()
+        start = time.monotonic()
+        try:
+            outcome = (ticket.context.run(self.fetch_fn, ticket.url), None)
+        except Exception as e:
+            outcome = (None, e)
+
+        error = outcome[1]
+        retryable = error is not None and is_retryable(error)
+        ticket.limiter.release(not retryable, time.monotonic() - start)
+
+        with self._cond:
+            if retryable and ticket.attempt < self.retries and self.budget.withdraw():
+                ticket.not_before = time.monotonic() + retry_delay(ticket.attempt, error)
+                ticket.attempt += 1
+                self._enqueue(ticket)
+            else:
+                ticket.finish(outcome)
+            # 释放了主机名额，唤醒等待的下载线程
+            self._cond.notify_all()
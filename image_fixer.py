@@ -9,60 +9,47 @@ import numpy as np
 import re
 from urllib.parse import urlparse, parse_qs
 from io import BytesIO
+from analysis_decode import make_analysis_proxy
+from content_bounds import alpha_array, alpha_bounds
+from metrics import timed
+from rule_profiles import DEFAULT_CANVAS, get_profile
 
-# 安全区域配置（与 web_validator.py 一致）
-SAFE_AREA = {
-    'left': 14,
-    'right': 285,
-    'top': 24,
-    'bottom': 175
-}
 
-
-def find_content_bounds(img):
+def find_content_bounds(img, profile=None):
     """
     找到图片中所有不透明像素的边界框
 
     Args:
-        img: PIL Image对象（RGBA模式，300x200尺寸）
+        img: PIL Image对象（RGBA模式，检测画布尺寸）
+        profile: 规则模板，默认 default
 
     Returns:
         tuple: (min_x, min_y, max_x, max_y) 内容边界框
     """
+    profile = profile or get_profile()
     width, height = img.size
-    min_x, min_y = width, height
-    max_x, max_y = 0, 0
-
-    for y in range(height):
-        for x in range(width):
-            pixel = img.getpixel((x, y))
-            alpha = pixel[3] if len(pixel) == 4 else 255
-
-            # 如果像素不透明，更新边界
-            if alpha > 10:
-                min_x = min(min_x, x)
-                min_y = min(min_y, y)
-                max_x = max(max_x, x)
-                max_y = max(max_y, y)
+    bounds = alpha_bounds(alpha_array(img), profile.visible_alpha)
 
     # 如果没有找到任何内容，返回整个图片区域
-    if min_x == width and min_y == height:
+    if bounds is None:
         return (0, 0, width - 1, height - 1)
 
-    return (min_x, min_y, max_x, max_y)
+    return bounds
 
 
-def calculate_optimal_crop_box(content_bounds, safe_area):
+def calculate_optimal_crop_box(content_bounds, safe_area, canvas=DEFAULT_CANVAS):
     """
     计算最佳裁剪框，确保内容在安全区域内
 
     Args:
         content_bounds: (min_x, min_y, max_x, max_y) 内容边界
         safe_area: 安全区域字典
+        canvas: 检测画布尺寸 (width, height)
 
     Returns:
-        tuple: (left, top, right, bottom) 裁剪框坐标（在300x200尺寸上）
+        tuple: (left, top, right, bottom) 裁剪框坐标（在检测画布尺寸上）
     """
+    canvas_width, canvas_height = canvas
     min_x, min_y, max_x, max_y = content_bounds
 
     # 计算内容的宽度和高度
@@ -76,7 +63,7 @@ def calculate_optimal_crop_box(content_bounds, safe_area):
     # 如果内容已经在安全区域内，不需要裁剪
     if (min_x >= safe_area['left'] and max_x <= safe_area['right'] and
         min_y >= safe_area['top'] and max_y <= safe_area['bottom']):
-        return (0, 0, 300, 200)
+        return (0, 0, canvas_width, canvas_height)
 
     # 计算需要裁剪的区域
     # 策略：居中裁剪，确保内容在安全区域内
@@ -96,43 +83,46 @@ def calculate_optimal_crop_box(content_bounds, safe_area):
     # 计算新的裁剪框
     crop_left = max(0, -offset_x)
     crop_top = max(0, -offset_y)
-    crop_right = min(300, 300 - offset_x)
-    crop_bottom = min(200, 200 - offset_y)
+    crop_right = min(canvas_width, canvas_width - offset_x)
+    crop_bottom = min(canvas_height, canvas_height - offset_y)
 
     return (crop_left, crop_top, crop_right, crop_bottom)
 
 
-def smart_crop_to_safe_area(img):
+@timed('strategy_smart_crop')
+def smart_crop_to_safe_area(img, proxy=None, profile=None):
     """
     智能裁剪：在原图上找到最佳裁剪区域，确保内容在安全区域内
 
     Args:
         img: PIL Image对象（原始尺寸）
+        proxy: 可选，已生成的画布尺寸 RGBA 检测图（见 AnalysisContext），避免重复缩放
+        profile: 规则模板，默认 default（300×200）
 
     Returns:
         PIL Image对象（修复后，保持原始尺寸）
     """
+    profile = profile or get_profile()
+    canvas_width, canvas_height = profile.canvas
     original_width, original_height = img.size
 
-    # 1. 缩放到300×200进行检测
-    test_img = img.resize((300, 200), Image.Resampling.LANCZOS)
-    if test_img.mode != 'RGBA':
-        test_img = test_img.convert('RGBA')
+    # 1. 缩放到画布尺寸进行检测
+    test_img = proxy if proxy is not None else make_analysis_proxy(img, profile.canvas)
 
     # 2. 找到内容边界
-    content_bounds = find_content_bounds(test_img)
+    content_bounds = find_content_bounds(test_img, profile)
 
-    # 3. 计算最佳裁剪框（在300×200尺寸上）
-    crop_box_300x200 = calculate_optimal_crop_box(content_bounds, SAFE_AREA)
+    # 3. 计算最佳裁剪框（在画布尺寸上）
+    crop_box_canvas = calculate_optimal_crop_box(content_bounds, profile.safe_area, profile.canvas)
 
     # 4. 映射回原图尺寸
-    scale_x = original_width / 300
-    scale_y = original_height / 200
+    scale_x = original_width / canvas_width
+    scale_y = original_height / canvas_height
     crop_box_original = (
-        int(crop_box_300x200[0] * scale_x),
-        int(crop_box_300x200[1] * scale_y),
-        int(crop_box_300x200[2] * scale_x),
-        int(crop_box_300x200[3] * scale_y)
+        int(crop_box_canvas[0] * scale_x),
+        int(crop_box_canvas[1] * scale_y),
+        int(crop_box_canvas[2] * scale_x),
+        int(crop_box_canvas[3] * scale_y)
     )
 
     # 5. 在原图上裁剪
@@ -158,36 +148,39 @@ def smart_crop_to_safe_area(img):
     return result
 
 
-def add_padding_to_safe_area(img):
+@timed('strategy_add_padding')
+def add_padding_to_safe_area(img, proxy=None, profile=None):
     """
     添加边距：在原图四周添加白边或透明边，将内容推入安全区域
 
     Args:
         img: PIL Image对象（原始尺寸）
+        proxy: 可选，已生成的画布尺寸 RGBA 检测图（见 AnalysisContext），避免重复缩放
+        profile: 规则模板，默认 default（300×200）
 
     Returns:
         PIL Image对象（修复后，保持原始尺寸）
     """
+    profile = profile or get_profile()
+    safe_area = profile.safe_area
     original_width, original_height = img.size
 
-    # 1. 缩放到300×200进行检测
-    test_img = img.resize((300, 200), Image.Resampling.LANCZOS)
-    if test_img.mode != 'RGBA':
-        test_img = test_img.convert('RGBA')
+    # 1. 缩放到画布尺寸进行检测
+    test_img = proxy if proxy is not None else make_analysis_proxy(img, profile.canvas)
 
     # 2. 找到内容边界
-    content_bounds = find_content_bounds(test_img)
+    content_bounds = find_content_bounds(test_img, profile)
     min_x, min_y, max_x, max_y = content_bounds
 
-    # 3. 计算需要添加的边距（在300×200尺寸上）
-    padding_left = max(0, SAFE_AREA['left'] - min_x)
-    padding_right = max(0, max_x - SAFE_AREA['right'])
-    padding_top = max(0, SAFE_AREA['top'] - min_y)
-    padding_bottom = max(0, max_y - SAFE_AREA['bottom'])
+    # 3. 计算需要添加的边距（在画布尺寸上）
+    padding_left = max(0, safe_area['left'] - min_x)
+    padding_right = max(0, max_x - safe_area['right'])
+    padding_top = max(0, safe_area['top'] - min_y)
+    padding_bottom = max(0, max_y - safe_area['bottom'])
 
     # 4. 映射回原图尺寸
-    scale_x = original_width / 300
-    scale_y = original_height / 200
+    scale_x = original_width / profile.canvas[0]
+    scale_y = original_height / profile.canvas[1]
 
     padding_left_original = int(padding_left * scale_x)
     padding_right_original = int(padding_right * scale_x)
@@ -270,27 +263,30 @@ def sanitize_filename(filename):
     return cleaned if cleaned else 'image'
 
 
-def is_watermark_pixel(x, y, alpha, img_width, img_height):
+def is_watermark_pixel(x, y, alpha, img_width, img_height, profile=None):
     """
     判断像素是否为水印
 
-    规则：alpha < 50 且在右下角区域
+    规则：alpha < 50 且在右下角区域（默认模板的阈值）
 
     Args:
         x, y: 像素坐标
         alpha: 透明度值
         img_width, img_height: 图片尺寸
+        profile: 规则模板，默认 default
 
     Returns:
         bool: True表示是水印
     """
+    profile = profile or get_profile()
+
     # 半透明判定
-    if alpha >= 50:
+    if alpha >= profile.car_watermark_alpha_max:
         return False
 
-    # 右下角区域判定（右下1/4区域）
-    right_threshold = img_width * 0.75
-    bottom_threshold = img_height * 0.75
+    # 右下角区域判定（默认右下1/4区域）
+    right_threshold = img_width * profile.car_watermark_fraction
+    bottom_threshold = img_height * profile.car_watermark_fraction
 
     if x >= right_threshold and y >= bottom_threshold:
         return True
@@ -298,44 +294,33 @@ def is_watermark_pixel(x, y, alpha, img_width, img_height):
     return False
 
 
-def find_car_bounds_exclude_watermark(img):
+def find_car_bounds_exclude_watermark(img, profile=None):
     """
     找到车图边界，排除右下角水印
 
     Args:
-        img: PIL Image对象（RGBA模式，300x200尺寸）
+        img: PIL Image对象（RGBA模式，检测画布尺寸）
+        profile: 规则模板，默认 default
 
     Returns:
         tuple: (min_x, min_y, max_x, max_y) 车图边界框（不含水印）
     """
+    profile = profile or get_profile()
     width, height = img.size
-    min_x, min_y = width, height
-    max_x, max_y = 0, 0
+    alpha = alpha_array(img)
 
-    for y in range(height):
-        for x in range(width):
-            pixel = img.getpixel((x, y))
-            alpha = pixel[3] if len(pixel) == 4 else 255
-
-            # 检查是否为水印
-            if is_watermark_pixel(x, y, alpha, width, height):
-                continue
-
-            # 如果是不透明的车图像素（alpha > 200）
-            if alpha > 200:
-                min_x = min(min_x, x)
-                min_y = min(min_y, y)
-                max_x = max(max_x, x)
-                max_y = max(max_y, y)
+    # 排除水印像素后，只考虑不透明的车图像素（默认 alpha > 200）
+    bounds = alpha_bounds(alpha, profile.opaque_alpha, exclude=profile.car_watermark_mask(alpha))
 
     # 如果没有找到车图内容，返回整个图片区域
-    if min_x == width and min_y == height:
+    if bounds is None:
         return (0, 0, width - 1, height - 1)
 
-    return (min_x, min_y, max_x, max_y)
+    return bounds
 
 
-def smart_fit_to_safe_area(img):
+@timed('strategy_smart_fit')
+def smart_fit_to_safe_area(img, proxy=None, profile=None):
     """
     智能适配：居中调整 + 等比缩放（放大或缩小），排除水印干扰
 
@@ -349,32 +334,32 @@ def smart_fit_to_safe_area(img):
 
     Args:
         img: PIL Image对象（原始尺寸）
+        proxy: 可选，已生成的画布尺寸 RGBA 检测图（见 AnalysisContext），避免重复缩放
+        profile: 规则模板，默认 default（300×200）
 
     Returns:
         PIL Image对象（修复后，保持原始尺寸）
     """
+    profile = profile or get_profile()
+    safe_area = profile.safe_area
     original_width, original_height = img.size
 
-    # 1. 缩放到300×200进行分析
-    test_img = img.resize((300, 200), Image.Resampling.LANCZOS)
-    if test_img.mode != 'RGBA':
-        test_img = test_img.convert('RGBA')
+    # 1. 缩放到画布尺寸进行分析
+    test_img = proxy if proxy is not None else make_analysis_proxy(img, profile.canvas)
 
     # 2. 找到车图边界（排除水印）
-    car_bounds = find_car_bounds_exclude_watermark(test_img)
+    car_bounds = find_car_bounds_exclude_watermark(test_img, profile)
     min_x, min_y, max_x, max_y = car_bounds
 
     # 计算车图尺寸
     car_width = max_x - min_x + 1
     car_height = max_y - min_y + 1
 
-    # 安全区域尺寸
-    safe_width = SAFE_AREA['right'] - SAFE_AREA['left']  # 271
-    safe_height = SAFE_AREA['bottom'] - SAFE_AREA['top']  # 151
+    # 安全区域尺寸（默认 271x151）
+    safe_width, safe_height = profile.safe_size
 
     # 3. 计算居中位置
-    safe_center_x = (SAFE_AREA['left'] + SAFE_AREA['right']) // 2
-    safe_center_y = (SAFE_AREA['top'] + SAFE_AREA['bottom']) // 2
+    safe_center_x, safe_center_y = profile.safe_center
 
     car_center_x = (min_x + max_x) // 2
     car_center_y = (min_y + max_y) // 2
@@ -393,16 +378,15 @@ def smart_fit_to_safe_area(img):
     scale_ratio = 1.0
 
     # 检查是否超出安全区
-    is_overflow = (new_min_x < SAFE_AREA['left'] or new_max_x > SAFE_AREA['right'] or
-                   new_min_y < SAFE_AREA['top'] or new_max_y > SAFE_AREA['bottom'])
+    is_overflow = (new_min_x < safe_area['left'] or new_max_x > safe_area['right'] or
+                   new_min_y < safe_area['top'] or new_max_y > safe_area['bottom'])
 
     # 检查是否过小（未撑满安全区）
     is_too_small = (car_width < safe_width * 0.98 and car_height < safe_height * 0.98)
 
     if is_overflow or is_too_small:
-        # 计算宽度和高度的缩放比例
-        target_width = 264
-        target_height = 144
+        # 计算宽度和高度的缩放比例（目标尺寸默认 264x144）
+        target_width, target_height = profile.fit_target
         width_scale = target_width / car_width
         height_scale = target_height / car_height
 
@@ -414,8 +398,8 @@ def smart_fit_to_safe_area(img):
         img = img.convert('RGBA')
 
     # 映射回原图尺寸
-    scale_x = original_width / 300
-    scale_y = original_height / 200
+    scale_x = original_width / profile.canvas[0]
+    scale_y = original_height / profile.canvas[1]
 
     # 创建结果图片
     result = Image.new('RGBA', (original_width, original_height), (255, 255, 255, 0))
@@ -447,24 +431,37 @@ def smart_fit_to_safe_area(img):
     return result
 
 
-def remove_watermark(img, alpha_threshold=200, brightness_threshold=250,
-                     x_fraction=0.65, y_fraction=0.50):
+def remove_watermark(img, alpha_threshold=None, brightness_threshold=None,
+                     x_fraction=None, y_fraction=None, profile=None):
     """
     去除右下角半透明白色水印
 
     策略：在指定区域内，将"半透明 + 高亮度（白色）"的像素设为完全透明。
     通过亮度过滤区分水印（白色文字）和车影（深色），确保车图不受影响。
 
+    未指定的阈值与检测时相同，取自规则模板（默认：右侧 35%、下半部分，alpha < 200 且亮度 > 250）。
+
     Args:
         img: PIL Image 对象
-        alpha_threshold: alpha 上限，低于此值且满足亮度条件的像素视为水印（默认 200）
-        brightness_threshold: 亮度下限，高于此值视为白色水印像素（默认 250）
-        x_fraction: 水印区域 X 起始比例（默认 0.65，即右侧 35%）
-        y_fraction: 水印区域 Y 起始比例（默认 0.50，即下半部分）
+        alpha_threshold: alpha 上限，低于此值且满足亮度条件的像素视为水印（默认取模板的 watermark_alpha_max）
+        brightness_threshold: 亮度下限，高于此值视为白色水印像素（默认取模板的 watermark_brightness_min）
+        x_fraction: 水印区域 X 起始比例（默认取模板的 watermark_x_fraction）
+        y_fraction: 水印区域 Y 起始比例（默认取模板的 watermark_y_fraction）
+        profile: 规则模板，默认 default
 
     Returns:
         PIL Image: 去除水印后的图片（原始尺寸）
     """
+    profile = profile or get_profile()
+    if alpha_threshold is None:
+        alpha_threshold = profile.watermark_alpha_max
+    if brightness_threshold is None:
+        brightness_threshold = profile.watermark_brightness_min
+    if x_fraction is None:
+        x_fraction = profile.watermark_x_fraction
+    if y_fraction is None:
+        y_fraction = profile.watermark_y_fraction
+
     img = img.copy().convert('RGBA')
     pixels = np.array(img)
     h, w = pixels.shape[:2]
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+图片预检模块
+只下载图片开头的几 KB（服务器支持时使用 Range 请求，不支持时读到文件头即断开连接），读取文件头中的格式、模式和尺寸，
+不下载完整文件、不解码像素；用于批量清单的快速分拣：
+
+- ok：文件头正常，需要完整检测
+- rejected：超过硬性限制（不是图片、像素数过多、文件过大），完整检测必然失败
+- unknown：前 PROBE_MAX_BYTES 字节内没有读到完整的文件头（如元数据很大的 JPEG），交给完整检测判断
+- failed：无法访问（重试后仍失败）
+"""
+
+import os
+import struct
+from collections import deque
+from io import BytesIO
+from PIL import Image
+from analysis_decode import MAX_IMAGE_PIXELS
+from downloader import DOWNLOAD_TIMEOUT, MAX_DOWNLOAD_BYTES, get_session, iter_scheduled
+from metrics import DOWNLOAD_BYTES, stage
+from rule_profiles import get_profile
+
+# 第一次尝试解析文件头的字节数，不够时加倍，最多读取 PROBE_MAX_BYTES
+PROBE_BYTES = int(os.environ.get('PROBE_BYTES', str(4 * 1024)))
+PROBE_MAX_BYTES = int(os.environ.get('PROBE_MAX_BYTES', str(256 * 1024)))
+PROBE_CHUNK_SIZE = 4 * 1024
+
+OK = 'ok'
+REJECTED = 'rejected'
+UNKNOWN = 'unknown'
+FAILED = 'failed'
+
+
+class ProbeRejected(ValueError):
+    """预检发现图片超过硬性限制，跳过完整下载和检测"""
+
+
+def _webp_header(data):
+    # Pillow 打开 WebP 时需要完整文件，这里直接解析 RIFF 头（VP8X / VP8L / VP8）
+    if len(data) < 30 or data[:4] != b'RIFF' or data[8:12] != b'WEBP':
+        return None
+    chunk = data[12:16]
+    if chunk == b'VP8X':
+        alpha = bool(data[20] & 0x10)
+        width = 1 + int.from_bytes(data[24:27], 'little')
+        height = 1 + int.from_bytes(data[27:30], 'little')
+    elif chunk == b'VP8L' and data[20] == 0x2f:
+        bits = struct.unpack('<I', data[21:25])[0]
+        width = 1 + (bits & 0x3fff)
+        height = 1 + ((bits >> 14) & 0x3fff)
+        alpha = bool((bits >> 28) & 1)
+    elif chunk == b'VP8 ' and data[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', data[26:30])
+        width, height = width & 0x3fff, height & 0x3fff
+        alpha = False
+    else:
+        return None
+    return {'format': 'WEBP', 'mode': 'RGBA' if alpha else 'RGB', 'width': width, 'height': height}
+
+
+def read_header(data):
+    """
+    从图片开头的字节读取格式、模式和尺寸（只解析文件头，不解码像素）
+
+    Args:
+        data: 图片开头的字节（可以不完整）
+
+    Returns:
+        dict: format, mode, width, height（像素数超过 Pillow 上限时为 None，并包含 header_error）；
+              字节不足或不是图片时返回 None
+    """
+    header = _webp_header(data)
+    if header is not None:
+        return header
+
+    try:
+        with Image.open(BytesIO(bytes(data))) as img:
+            return {'format': img.format, 'mode': img.mode, 'width': img.width, 'height': img.height}
+    except Image.DecompressionBombError as e:
+        # 像素数超过 Pillow 的解压炸弹上限时 Image.open 直接报错，拿不到尺寸
+        return {'format': None, 'mode': None, 'width': None, 'height': None, 'header_error': str(e)}
+    except Exception:
+        # 各格式插件在数据不完整时抛出的异常类型不一，统一视为“尚未读到文件头”
+        return None
+
+
+def _file_size(response):
+    # 206：Content-Range 中的总大小；200：Content-Length
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length', '')
+    return int(length) if response.status_code == 200 and length.isdigit() else None
+
+
+def _request_range(url, timeout, first, last):
+    return get_session().get(
+        url, timeout=timeout, stream=True,
+        headers={'Range': f'bytes={first}-{last}', 'Accept-Encoding': 'identity'}
+    )
+
+
+def _read_until_header(response, data, max_bytes):
+    """
+    继续读取响应内容并尝试解析文件头（读到的字节数每翻一倍解析一次）
+
+    Returns:
+        tuple: (header, eof)，eof 表示响应内容已读完
+    """
+    next_try = max(PROBE_BYTES, len(data) * 2)
+    for chunk in response.iter_content(PROBE_CHUNK_SIZE):
+        data += chunk
+        if len(data) >= min(next_try, max_bytes):
+            header = read_header(data)
+            if header is not None or len(data) >= max_bytes:
+                return header, False
+            next_try *= 2
+    return read_header(data), True
+
+
+def probe(url, timeout=DOWNLOAD_TIMEOUT, max_bytes=PROBE_MAX_BYTES):
+    """
+    读取单张图片的文件头
+
+    先请求前 PROBE_BYTES 字节，文件头不完整时再请求到 max_bytes 为止；
+    服务器不支持 Range 时在同一个响应中继续读取，读到文件头或达到 max_bytes 后立即断开连接。
+
+    Args:
+        url: 图片URL
+        timeout: 超时时间（秒）
+        max_bytes: 最多读取的字节数
+
+    Returns:
+        dict: format, mode, width, height（未读到文件头时为 None），
+              file_size（服务器未告知时为 None）、content_type、ranged（服务器是否支持 Range）、
+              bytes_read、complete（是否读完了整个文件）
+
+    Raises:
+        requests.exceptions.RequestException: 请求失败
+    """
+    with stage('probe'):
+        data = bytearray()
+        response = _request_range(url, timeout, 0, min(PROBE_BYTES, max_bytes) - 1)
+        try:
+            response.raise_for_status()
+            ranged = response.status_code == 206
+            file_size = _file_size(response)
+            content_type = response.headers.get('Content-Type')
+            header, eof = _read_until_header(response, data, max_bytes)
+        finally:
+            response.close()
+
+        # 支持 Range 时第一次只拿到前 PROBE_BYTES 字节，文件头不完整再补读剩余部分
+        if header is None and ranged and len(data) < max_bytes and (file_size is None or len(data) < file_size):
+            response = _request_range(url, timeout, len(data), max_bytes - 1)
+            try:
+                response.raise_for_status()
+                if response.status_code == 206:
+                    header, eof = _read_until_header(response, data, max_bytes)
+            finally:
+                response.close()
+
+        DOWNLOAD_BYTES.inc(len(data), kind='probe')
+
+        if file_size is not None:
+            complete = len(data) >= file_size
+        else:
+            complete = eof and not ranged
+
+        result = {'format': None, 'mode': None, 'width': None, 'height': None}
+        result.update(header or {})
+        result.update({
+            'file_size': file_size if file_size is not None else (len(data) if complete else None),
+            'content_type': content_type,
+            'ranged': ranged,
+            'bytes_read': len(data),
+            'complete': complete
+        })
+        return result
+
+
+def triage(info, profile=None):
+    """
+    根据文件头判断图片是否超过硬性限制
+
+    Args:
+        info: probe() 的返回值
+        profile: 规则模板（默认 default），尺寸与检测画布不同时给出缩放提示
+
+    Returns:
+        tuple: (status, errors, warnings)，status 为 OK / REJECTED / UNKNOWN
+    """
+    canvas = (profile or get_profile()).canvas
+    errors = []
+    warnings = []
+
+    if info.get('header_error'):
+        errors.append(f'图片像素过多，超过上限 {MAX_IMAGE_PIXELS} 像素')
+    elif info['format'] is None:
+        if info['complete']:
+            errors.append(f"无法识别图片格式（Content-Type: {info['content_type'] or '未知'}）")
+        else:
+            warnings.append(f"前 {info['bytes_read']} 字节内没有读到图片文件头，需要完整检测")
+    else:
+        width, height = info['width'], info['height']
+        if MAX_IMAGE_PIXELS and width * height > MAX_IMAGE_PIXELS:
+            errors.append(f'图片像素过多（{width}x{height}），超过上限 {MAX_IMAGE_PIXELS} 像素')
+        if (width, height) != canvas:
+            warnings.append(f"原始图片尺寸为 {width}x{height}，检测时将自动缩放到 {canvas[0]}x{canvas[1]}")
+
+    if MAX_DOWNLOAD_BYTES and info['file_size'] is not None and info['file_size'] > MAX_DOWNLOAD_BYTES:
+        errors.append(f"图片文件过大（{info['file_size']} 字节），超过上限 {MAX_DOWNLOAD_BYTES} 字节")
+
+    if errors:
+        return REJECTED, errors, warnings
+    if info['format'] is None:
+        return UNKNOWN, errors, warnings
+    return OK, errors, warnings
+
+
+def iter_probes(urls, workers=None, profile=None, ordered=True):
+    """
+    并发预检图片，按输入顺序逐个返回分拣结果（与下载共用主机并发限制和重试）
+
+    Args:
+        urls: URL 可迭代对象
+        workers: 并发线程数（默认 DEFAULT_WORKERS）
+        profile: 规则模板（默认 default）
+        ordered: False 时按完成顺序返回（见 downloader.iter_scheduled）
+
+    Yields:
+        dict: url, status, errors, warnings，可访问时还包含 probe() 返回的文件头信息
+    """
+    for url, info, error in iter_scheduled(probe, urls, workers, ordered):
+        if error is not None:
+            yield {'url': url, 'status': FAILED, 'errors': [], 'warnings': [], 'error': error}
+            continue
+        status, errors, warnings = triage(info, profile)
+        yield {'url': url, 'status': status, 'errors': errors, 'warnings': warnings, **info}
+
+
+def iter_probed_downloads(urls, download, workers=None, ordered=True):
+    """
+    先预检，只完整下载未超过硬性限制的图片；结果顺序与输入一致
+
+    Args:
+        urls: URL 可迭代对象
+        download: download(urls) -> 按输入顺序产出 (url, data, error, changed)，
+                  例如 lambda urls: iter_downloads(urls, workers)
+        workers: 预检并发线程数
+        ordered: False 时预检和下载都按完成顺序返回，download 也应按完成顺序产出
+
+    Yields:
+        tuple: (url, data, error, changed)；预检被拒绝时 error 为 ProbeRejected，
+               无法访问时为预检请求的异常
+    """
+    if not ordered:
+        yield from _iter_probed_completed(urls, download, workers)
+        return
+    order = deque()
+
+    def passing(probes):
+        for item in probes:
+            if item['status'] == FAILED:
+                order.append((item['url'], item['error']))
+            elif item['status'] == REJECTED:
+                order.append((item['url'], ProbeRejected('；'.join(item['errors']))))
+            else:
+                order.append((item['url'], None))
+                yield item['url']
+
+    def rejected_head():
+        # 队首被拒绝的 URL 依次产出
+        while order and order[0][1] is not None:
+            url, error = order.popleft()
+            yield url, None, error, True
+
+    for result in download(passing(iter_probes(urls, workers))):
+        yield from rejected_head()
+        order.popleft()
+        yield result
+    yield from rejected_head()
+
+
+def _iter_probed_completed(urls, download, workers):
+    """iter_probed_downloads 的按完成顺序版本：被拒绝的 URL 在下一个下载结果之前产出"""
+    rejected = deque()
+
+    def passing(probes):
+        for item in probes:
+            if item['status'] == FAILED:
+                rejected.append((item['url'], None, item['error'], True))
+            elif item['status'] == REJECTED:
+                rejected.append((item['url'], None, ProbeRejected('；'.join(item['errors'])), True))
+            else:
+                yield item['url']
+
+    for result in download(passing(iter_probes(urls, workers, ordered=False))):
+        while rejected:
+            yield rejected.popleft()
+        yield result
+    while rejected:
+        yield rejected.popleft()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+后台批量任务队列模块
+批量检测 / 批量修复作为任务保存在 SQLite 中，由后台线程逐条处理；
+每条结果处理完即写入数据库（检查点），进程重启后从未完成的条目继续，不会从头开始
+
+默认关闭，设置 JOB_QUEUE_DIR 后启用（Web 服务和 job_worker.py 需使用同一目录）
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DEFAULT_QUEUE_DIR = os.environ.get('JOB_QUEUE_DIR', '')
+CHECKPOINT_ITEMS = 20        # 每处理多少条写入一次检查点
+CHECKPOINT_SECONDS = 2.0     # 距上次检查点超过该时间（秒）时也写入，保证进度及时更新
+STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '60'))   # 超过该时间没有心跳的运行中任务可被其他进程接管
+POLL_INTERVAL = 1.0          # 空闲时查询新任务的间隔（秒）
+SUBMIT_CHUNK = 500           # 创建任务时每个事务写入的条目数（写锁只在写入这一批时持有）
+
+# 任务状态
+PENDING = 'pending'          # 正在写入条目，不会被领取
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobLost(RuntimeError):
+    """创建中的任务已被其他进程清理（心跳超时）"""
+
+
+# 任务读写可能出现的异常
+QUEUE_ERRORS = (OSError, sqlite3.Error)
+
+
+class JobQueue:
+    """
+    基于 SQLite 的持久化任务队列
+
+    - jobs：任务类型、参数、状态、心跳（创建中的任务为 pending，写入期间定期更新心跳）
+    - job_items：任务中的每个 URL 及其结果（result 为空表示尚未处理）
+    - 修复任务生成的文件保存在 files/<job_id>/ 目录
+    """
+
+    def __init__(self, queue_dir=DEFAULT_QUEUE_DIR):
+        self.queue_dir = queue_dir
+        self.db_path = os.path.join(queue_dir, 'jobs.sqlite3')
+        os.makedirs(queue_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, options TEXT, '
+                'column_used TEXT, total INTEGER NOT NULL, error TEXT, worker TEXT, heartbeat REAL, '
+                'created_at REAL, started_at REAL, finished_at REAL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_items ('
+                'job_id TEXT NOT NULL, idx INTEGER NOT NULL, url TEXT NOT NULL, filename TEXT, '
+                'status TEXT, compliant INTEGER, result TEXT, PRIMARY KEY (job_id, idx))'
+            )
+            # 创建过程中进程退出、写了一半的任务（心跳超时）
+            stale = [row[0] for row in conn.execute(
+                'SELECT id FROM jobs WHERE status = ? AND heartbeat < ?', (PENDING, time.time() - STALE_SECONDS)
+            )]
+            self._delete_jobs(conn, stale)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def files_dir(self, job_id):
+        """修复任务输出文件的目录"""
+        return os.path.join(self.queue_dir, 'files', job_id)
+
+    def submit(self, kind, urls, options=None, column_used=None, name_for=None):
+        """
+        创建任务（URL 逐个写入，不需要先把清单读入内存）
+
+        Args:
+            kind: 任务类型（check / fix）
+            urls: URL 可迭代对象
+            options: 任务参数（可 JSON 序列化）
+            column_used: 表格中使用的列名
+            name_for: 可选，name_for(url) 返回该条目的输出文件名
+
+        Returns:
+            tuple: (任务 ID, 条目数)
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, status, options, column_used, total, heartbeat, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, PENDING, json.dumps(options or {}), column_used, 0, now, now)
+            )
+
+        # 清单边读取边写入，每 SUBMIT_CHUNK 条一个短事务：读取上传的清单期间不持有写锁，
+        # 后台任务的检查点、心跳不会被大清单的上传挡住。写入期间任务为 pending，不会被领取，
+        # 另有线程定期更新心跳（清单读取很慢时也不会被当作已退出的写入清理掉）；
+        # 读取清单出错时删除已写入的部分，进程中途退出时由下次打开队列时按心跳清理
+        total = 0
+        chunk = []
+        done = threading.Event()
+        threading.Thread(target=self._keep_pending, args=(job_id, done), daemon=True).start()
+        try:
+            for url in urls:
+                total += 1
+                chunk.append((job_id, total, url, name_for(url) if name_for else None))
+                if len(chunk) >= SUBMIT_CHUNK:
+                    with self._connect() as conn:
+                        self._write_items(conn, job_id, chunk)
+                    chunk = []
+            with self._connect() as conn:
+                if chunk:
+                    self._write_items(conn, job_id, chunk)
+                cursor = conn.execute(
+                    'UPDATE jobs SET status = ?, total = ?, heartbeat = NULL WHERE id = ? AND status = ?',
+                    (QUEUED, total, job_id, PENDING)
+                )
+                if cursor.rowcount == 0:
+                    raise JobLost(f'任务 {job_id} 在写入过程中被清理（心跳超时），请重新提交')
+        except BaseException:
+            with self._connect() as conn:
+                self._delete_jobs(conn, [job_id])
+            raise
+        finally:
+            done.set()
+        return job_id, total
+
+    def _write_items(self, conn, job_id, rows):
+        conn.executemany('INSERT INTO job_items (job_id, idx, url, filename) VALUES (?, ?, ?, ?)', rows)
+
+    def _keep_pending(self, job_id, done):
+        """创建任务期间定期更新 pending 任务的心跳"""
+        while not done.wait(STALE_SECONDS / 3):
+            try:
+                with self._connect() as conn:
+                    cursor = conn.execute('UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = ?',
+                                          (time.time(), job_id, PENDING))
+                if cursor.rowcount == 0:
+                    return
+            except QUEUE_ERRORS:
+                pass
+
+    def _delete_jobs(self, conn, job_ids):
+        for job_id in job_ids:
+            conn.execute('DELETE FROM job_items WHERE job_id = ?', (job_id,))
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def get(self, job_id):
+        """
+        查询任务状态、进度和汇总
+
+        Returns:
+            dict，任务不存在时返回 None
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, kind, status, options, column_used, total, error, created_at, started_at, finished_at '
+                'FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            counts = conn.execute(
+                'SELECT '
+                'COUNT(result), '
+                "SUM(status = 'success'), "
+                "SUM(status = 'failed'), "
+                "SUM(status = 'success' AND compliant = 1), "
+                "SUM(status = 'success' AND compliant = 0) "
+                'FROM job_items WHERE job_id = ?', (job_id,)
+            ).fetchone()
+
+        total = row[5]
+        processed = counts[0] or 0
+        return {
+            'job_id': row[0],
+            'kind': row[1],
+            'status': row[2],
+            'options': json.loads(row[3] or '{}'),
+            'column_used': row[4],
+            'error': row[6],
+            'created_at': row[7],
+            'started_at': row[8],
+            'finished_at': row[9],
+            'progress': {
+                'processed': processed,
+                'total': total,
+                'percent': round(processed * 100.0 / total, 1) if total else 100.0
+            },
+            'summary': {
+                'total': total,
+                'success': counts[1] or 0,
+                'failed': counts[2] or 0,
+                'compliant': counts[3] or 0,
+                'non_compliant': counts[4] or 0
+            }
+        }
+
+    def results(self, job_id, offset=0, limit=100):
+        """
+        分页读取已处理条目的结果（按清单顺序）
+
+        Returns:
+            list: 结果字典
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT result FROM job_items WHERE job_id = ? AND result IS NOT NULL '
+                'ORDER BY idx LIMIT ? OFFSET ?', (job_id, limit, offset)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def cancel(self, job_id):
+        """
+        取消排队中或运行中的任务
+
+        Returns:
+            bool: 是否取消成功（任务已结束时返回 False）
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)',
+                (CANCELLED, time.time(), job_id, QUEUED, RUNNING)
+            )
+        return cursor.rowcount > 0
+
+    def claim(self, worker_id):
+        """
+        领取一个任务：排队中的任务，或心跳超时（原进程已退出）的运行中任务
+
+        Returns:
+            dict: {job_id, kind, options}，没有可领取的任务时返回 None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, kind, options FROM jobs '
+                'WHERE status = ? OR (status = ? AND heartbeat < ?) '
+                'ORDER BY created_at LIMIT 1',
+                (QUEUED, RUNNING, now - STALE_SECONDS)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, worker = ?, heartbeat = ?, started_at = COALESCE(started_at, ?) '
+                'WHERE id = ?',
+                (RUNNING, worker_id, now, now, row[0])
+            )
+        return {'job_id': row[0], 'kind': row[1], 'options': json.loads(row[2] or '{}')}
+
+    def pending_items(self, job_id):
+        """
+        读取尚未处理的条目（从上次检查点继续）
+
+        Returns:
+            list: (idx, url, filename)
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT idx, url, filename FROM job_items WHERE job_id = ? AND result IS NULL ORDER BY idx',
+                (job_id,)
+            ).fetchall()
+
+    def checkpoint(self, job_id, worker_id, records):
+        """
+        写入一批结果并更新心跳
+
+        Args:
+            records: 结果字典列表（包含 index、status，检测成功时包含 compliant）
+
+        Returns:
+            bool: 任务是否仍由该进程运行（被取消或被其他进程接管时返回 False）
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = ? AND worker = ?',
+                (time.time(), job_id, RUNNING, worker_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.executemany(
+                'UPDATE job_items SET status = ?, compliant = ?, result = ? WHERE job_id = ? AND idx = ?',
+                (
+                    (
+                        record['status'],
+                        None if record.get('compliant') is None else int(record['compliant']),
+                        json.dumps(record, ensure_ascii=False),
+                        job_id,
+                        record['index']
+                    )
+                    for record in records
+                )
+            )
+        return True
+
+    def heartbeat(self, job_id, worker_id):
+        """
+        更新心跳（单条处理时间较长时避免被其他进程误判为已退出）
+
+        Returns:
+            bool: 任务是否仍由该进程运行
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = ? AND worker = ?',
+                (time.time(), job_id, RUNNING, worker_id)
+            )
+        return cursor.rowcount > 0
+
+    def finish(self, job_id, worker_id, status, error=None):
+        """标记任务结束（只更新仍由该进程运行的任务）"""
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ? AND worker = ?',
+                (status, error, time.time(), job_id, RUNNING, worker_id)
+            )
+
+
+class JobWorker(threading.Thread):
+    """
+    后台任务线程：循环领取任务，按清单顺序处理未完成的条目，
+    每 CHECKPOINT_ITEMS 条或每 CHECKPOINT_SECONDS 秒写入一次检查点；处理期间另有线程定期更新心跳
+
+    handlers: {任务类型: handler(job, items)}，handler 按 items 顺序逐条生成结果字典
+    """
+
+    def __init__(self, queue, handlers, poll_interval=POLL_INTERVAL):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                job = self.queue.claim(self.worker_id)
+            except QUEUE_ERRORS:
+                job = None
+            if job is None:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        """处理一个已领取的任务"""
+        job_id = job['job_id']
+        handler = self.handlers.get(job['kind'])
+        if handler is None:
+            self._finish(job_id, FAILED, f"不支持的任务类型: {job['kind']}")
+            return
+
+        done = threading.Event()
+        threading.Thread(target=self._keep_alive, args=(job_id, done), daemon=True).start()
+        try:
+            batch = []
+            last_checkpoint = time.monotonic()
+            for record in handler(job, self.queue.pending_items(job_id)):
+                batch.append(record)
+                if len(batch) >= CHECKPOINT_ITEMS or time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+                    if not self.queue.checkpoint(job_id, self.worker_id, batch):
+                        return
+                    batch = []
+                    last_checkpoint = time.monotonic()
+                if self._stop_event.is_set():
+                    break
+            if batch and not self.queue.checkpoint(job_id, self.worker_id, batch):
+                return
+            if not self._stop_event.is_set():
+                self._finish(job_id, COMPLETED)
+        except Exception as e:
+            self._finish(job_id, FAILED, str(e))
+        finally:
+            done.set()
+
+    def _finish(self, job_id, status, error=None):
+        # 写入失败时任务保持运行中，心跳超时后由其他线程接管；任务线程继续处理后续任务
+        try:
+            self.queue.finish(job_id, self.worker_id, status, error)
+        except QUEUE_ERRORS:
+            pass
+
+    def _keep_alive(self, job_id, done):
+        while not done.wait(STALE_SECONDS / 3):
+            try:
+                if not self.queue.heartbeat(job_id, self.worker_id):
+                    return
+            except QUEUE_ERRORS:
+                pass
+
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    获取默认的任务队列（JOB_QUEUE_DIR 为空时禁用，返回 None）
+    """
+    global _default_queue
+    if not DEFAULT_QUEUE_DIR:
+        return None
+    if _default_queue is None:
+        with _default_lock:
+            if _default_queue is None:
+                try:
+                    _default_queue = JobQueue(DEFAULT_QUEUE_DIR)
+                except QUEUE_ERRORS:
+                    return None
+    return _default_queue
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+独立的后台任务进程
+Web 服务默认不启动任务线程（JOB_WORKERS=0），由该进程处理 /jobs 提交的批量检测 / 修复任务；
+Web 服务和该进程需设置同一个 JOB_QUEUE_DIR
+
+用法:
+    JOB_QUEUE_DIR=/var/lib/image_checker/jobs python3 job_worker.py --workers 2
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+from index import start_job_workers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='后台批量任务处理进程')
+    parser.add_argument('--workers', type=int, default=1, help='任务线程数（默认 1）')
+    args = parser.parse_args(argv)
+
+    workers = start_job_workers(max(1, args.workers))
+    if not workers:
+        print("❌ 后台任务队列未启用（JOB_QUEUE_DIR 为空）", file=sys.stderr)
+        return 2
+
+    print(f"✅ 已启动 {len(workers)} 个任务线程，按 Ctrl+C 退出", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+表格清单读取模块
+逐行读取 CSV / Excel 中的图片链接：CSV 用 csv 模块流式解析，XLSX 用 openpyxl 只读模式逐行迭代，
+读到第一行即可开始处理图片，内存占用与表格行数无关
+"""
+
+import io
+import csv
+import itertools
+
+# 图片链接列的候选列名（精确匹配，不区分大小写）
+POSSIBLE_COLUMNS = ['url', 'image_url', 'img_url', 'link', 'image', 'img', '图片', '图片链接', '链接']
+# 模糊匹配关键字
+COLUMN_KEYWORDS = ['url', 'link', 'image', 'img', '图片', '链接']
+
+# 视为空单元格的值（与 pandas 默认的缺失值一致）
+MISSING_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+])
+
+
+class ManifestError(ValueError):
+    """上传的表格无法使用（格式不支持、没有图片链接列或没有链接）"""
+
+
+def find_image_column(columns):
+    """
+    查找包含图片链接的列：先精确匹配（不区分大小写），再模糊匹配，最后使用第一列
+
+    Returns:
+        列名，表格没有列时返回 None
+    """
+    columns = list(columns)
+    possible = [pc.lower() for pc in POSSIBLE_COLUMNS]
+
+    # 首先尝试精确匹配（不区分大小写）
+    for col in columns:
+        if col.lower() in possible:
+            return col
+
+    # 如果没找到，尝试模糊匹配
+    for col in columns:
+        col_lower = col.lower()
+        if any(keyword in col_lower for keyword in COLUMN_KEYWORDS):
+            return col
+
+    # 如果还是没找到，使用第一列
+    if len(columns) > 0:
+        return columns[0]
+    return None
+
+
+def _header_names(header):
+    # 空表头与 pandas 一致命名为 "Unnamed: i"
+    return [
+        str(name) if name is not None and str(name) != '' else f'Unnamed: {i}'
+        for i, name in enumerate(header)
+    ]
+
+
+def _iter_column(rows, col_index):
+    for row in rows:
+        if col_index >= len(row):
+            continue
+        value = row[col_index]
+        if value is None:
+            continue
+        value = str(value)
+        if value in MISSING_VALUES:
+            continue
+        yield value
+
+
+def _csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    return csv.reader(text)
+
+
+def _xlsx_rows(stream):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    # 与 pandas.read_excel 一致：读取第一个工作表
+    sheet = workbook.worksheets[0]
+    try:
+        for row in sheet.iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def _xls_rows(stream):
+    # 旧版 .xls 没有流式读取方式，退回 pandas 整体读取
+    import pandas as pd
+
+    df = pd.read_excel(stream, dtype=object)
+    yield list(df.columns)
+    for row in df.itertuples(index=False):
+        yield [None if pd.isna(value) else value for value in row]
+
+
+def open_manifest(stream, filename):
+    """
+    打开表格清单，识别图片链接列
+
+    Args:
+        stream: 二进制文件对象（上传文件或本地文件）
+        filename: 文件名，用于判断格式
+
+    Returns:
+        tuple: (image_column, urls)，urls 为逐行读取的 URL 迭代器
+
+    Raises:
+        ManifestError: 表格无法使用，错误信息可直接返回给客户端
+    """
+    lower = filename.lower()
+    if lower.endswith('.csv'):
+        rows = _csv_rows(stream)
+    elif lower.endswith('.xlsx'):
+        rows = _xlsx_rows(stream)
+    elif lower.endswith('.xls'):
+        rows = _xls_rows(stream)
+    else:
+        raise ManifestError('不支持的文件格式，请上传 CSV 或 Excel 文件')
+
+    rows = iter(rows)
+    header = next(rows, None)
+    columns = _header_names(header or [])
+
+    # 查找包含图片链接的列
+    image_column = find_image_column(columns)
+    if image_column is None:
+        raise ManifestError('表格为空或没有找到图片链接列')
+
+    urls = _iter_column(rows, columns.index(image_column))
+    first = next(urls, None)
+    if first is None:
+        raise ManifestError(f'在列 "{image_column}" 中没有找到有效的图片链接')
+
+    return image_column, itertools.chain([first], urls)
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+运行指标模块
+按阶段记录耗时直方图（下载、解码、缩放、分析、去水印、修复策略、编码……），
+统计处理的图片数、下载字节数、检测结论和错误数，以 Prometheus 文本格式输出（/metrics）；
+单个请求的阶段耗时同时通过 Server-Timing 响应头返回
+
+CPU 进程池中执行的阶段耗时随任务结果带回主进程后再记录（见 cpu_pool），子进程本身不保存指标。
+多进程部署（如 gunicorn 多 worker）时每个进程各自统计。
+"""
+
+import time
+import functools
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 阶段耗时直方图的桶边界（秒）
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 请求耗时直方图的桶边界（秒）
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """带标签的指标（同一组标签值对应一个样本）"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        help_text = self.help_text.replace('\\', '\\\\').replace('\n', '\\n')
+        lines = [f'# HELP {self.name} {help_text}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            samples = sorted(self._samples.items())
+            if not samples and not self.labelnames:
+                samples = [((), self._empty())]
+            lines.extend(self._render_samples(samples))
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def _empty(self):
+        return 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._samples.get(self._key(labels), 0)
+
+    def _render_samples(self, samples):
+        for key, value in samples:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    """累计直方图：每个样本保存各桶计数、总和与总数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _empty(self):
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = self._empty()
+            sample[0][index] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def _render_samples(self, samples):
+        for key, (counts, total, count) in samples:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+_registry = []
+
+
+def counter(name, help_text, labelnames=()):
+    """创建并注册计数器"""
+    metric = Counter(name, help_text, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, help_text, labelnames=(), buckets=STAGE_BUCKETS):
+    """创建并注册直方图"""
+    metric = Histogram(name, help_text, labelnames, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    """
+    所有指标的 Prometheus 文本格式
+
+    Returns:
+        str
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = histogram(
+    'image_checker_stage_seconds', '各处理阶段耗时（秒）', ('stage',), STAGE_BUCKETS
+)
+REQUEST_SECONDS = histogram(
+    'image_checker_request_seconds', '请求耗时（秒，流式响应只统计到开始输出）', ('route',), REQUEST_BUCKETS
+)
+IMAGES_PROCESSED = counter(
+    'image_checker_images_processed_total', '处理的图片数', ('route', 'strategy')
+)
+DOWNLOAD_BYTES = counter(
+    'image_checker_download_bytes_total', '下载的图片字节数（full：完整下载，probe：预检）', ('kind',)
+)
+VERDICTS = counter(
+    'image_checker_verdicts_total', '检测结论（compliant / non_compliant；修复时为原图的结论）', ('route', 'strategy', 'verdict')
+)
+ERRORS = counter(
+    'image_checker_errors_total', '处理失败的图片数（download / probe_rejected / process）', ('route', 'strategy', 'kind')
+)
+
+
+# ==================== 阶段耗时 ====================
+
+class StageTrace:
+    """
+    一次请求或一个任务内各阶段的累计耗时（同名阶段累加，保持首次出现的顺序）
+
+    forward=True 时只收集、不记录直方图：CPU 进程池任务的阶段耗时由主进程收到结果后统一记录。
+    spans 记录本进程内各阶段从最早开始到最晚结束的时间范围（perf_counter），
+    同一阶段在多个线程中并发执行（如批量下载）时，累计耗时会超过实际经过的时间。
+    没有时间范围的耗时（CPU 进程池子进程中测量后带回）记入的阶段，spans 中为 None。
+    """
+
+    def __init__(self, forward=False):
+        self.forward = forward
+        self.stages = {}
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, end=None):
+        """
+        累加阶段耗时
+
+        Args:
+            end: 可选，本次执行结束的时间（perf_counter），用于计算阶段的时间范围；
+                 为 None 时该阶段不再有时间范围，只报告累计耗时
+        """
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            if end is None:
+                self.spans[name] = None
+            elif name not in self.spans:
+                self.spans[name] = (end - seconds, end)
+            elif self.spans[name] is not None:
+                span = self.spans[name]
+                self.spans[name] = (min(span[0], end - seconds), max(span[1], end))
+
+
+_current_trace = contextvars.ContextVar('image_checker_stage_trace', default=None)
+
+
+def current_trace():
+    """当前线程（上下文）正在收集的 StageTrace，没有时返回 None"""
+    return _current_trace.get()
+
+
+def activate(trace):
+    """
+    开始在当前上下文中收集阶段耗时
+
+    Returns:
+        token，传给 deactivate() 恢复之前的 StageTrace
+    """
+    return _current_trace.set(trace)
+
+
+def deactivate(token):
+    _current_trace.reset(token)
+
+
+def record_stages(stages, trace=None, end=None):
+    """
+    记录一组阶段耗时：写入直方图，并累加到 trace（若有）
+
+    Args:
+        stages: {阶段名: 秒}
+        trace: 可选，需要同时累加的 StageTrace
+        end: 可选，这些阶段结束的时间（perf_counter，本进程内测量时传入；子进程带回的耗时不传）
+    """
+    for name, seconds in stages.items():
+        if trace is not None:
+            trace.add(name, seconds, end)
+        if trace is None or not trace.forward:
+            STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def timed(name):
+    """
+    装饰器：记录函数每次调用的耗时（阶段名为 name）
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def stage(name):
+    """
+    记录代码块的耗时
+
+    用法:
+        with stage('decode'):
+            img.load()
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        record_stages({name: end - start}, _current_trace.get(), end)
+
+
+# ==================== Server-Timing ====================
+
+# 并发阶段的累计耗时：阶段名加该后缀
+SUM_SUFFIX = '_sum'
+
+
+def stage_breakdown(stages, spans=None):
+    """
+    按展示用的阶段名汇总耗时（毫秒）：各修复策略（strategy_*）合并为 strategy
+
+    并发执行的阶段（累计耗时超过 spans 中的时间范围，如批量下载）报告从最早开始到最晚结束的时间，
+    累计耗时另以 <阶段名>_sum 报告，避免出现比整个请求还长的阶段；
+    含有子进程耗时的阶段（spans 中为 None）只报告累计耗时。
+
+    Args:
+        stages: {阶段名: 秒}
+        spans: 可选，StageTrace.spans
+
+    Returns:
+        dict: {阶段名: 毫秒}，保持阶段首次出现的顺序
+    """
+    breakdown = {}
+    for name, seconds in stages.items():
+        span = spans.get(name) if spans else None
+        if span is not None and span[1] - span[0] < seconds:
+            breakdown[name] = (span[1] - span[0]) * 1000
+            breakdown[name + SUM_SUFFIX] = seconds * 1000
+            continue
+        if name.startswith('strategy_'):
+            name = 'strategy'
+        breakdown[name] = breakdown.get(name, 0.0) + seconds * 1000
+    return {name: round(ms, 1) for name, ms in breakdown.items()}
+
+
+def server_timing(stages, total=None, spans=None):
+    """
+    Server-Timing 响应头的值，例如 download;dur=812.4, decode;dur=35.1, total;dur=901.2
+    并发阶段的累计耗时带说明，例如 download_sum;desc="download summed over concurrent calls";dur=2410.7
+
+    Args:
+        stages: {阶段名: 秒}
+        total: 可选，整个请求的耗时（秒）
+        spans: 可选，StageTrace.spans（见 stage_breakdown）
+    """
+    entries = []
+    for name, ms in stage_breakdown(stages, spans).items():
+        if name.endswith(SUM_SUFFIX) and spans and spans.get(name[:-len(SUM_SUFFIX)]) is not None:
+            entries.append(f'{name};desc="{name[:-len(SUM_SUFFIX)]} summed over concurrent calls";dur={ms}')
+        else:
+            entries.append(f'{name};dur={ms}')
+    if total is not None:
+        entries.append(f'total;dur={round(total * 1000, 1)}')
+    return ', '.join(entries)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+预览图模块
+缓存模板边框叠加层，并按配置的格式（PNG/WebP/JPEG）编码预览图
+"""
+
+import os
+import base64
+from functools import lru_cache
+from io import BytesIO
+from PIL import Image, ImageDraw
+from metrics import stage
+
+PREVIEW_SIZE = (300, 200)
+
+# 模板颜色
+TEMPLATE_RED = (232, 115, 107)
+OVERLAY_RED = (232, 115, 107, 120)     # 半透明红色
+OVERLAY_GREEN = (0, 255, 0, 180)       # 半透明绿色
+
+# 预览图编码配置：png（快速压缩）/ webp / jpeg
+PREVIEW_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+DEFAULT_PREVIEW_FORMAT = os.environ.get('PREVIEW_FORMAT', 'png').lower()
+DEFAULT_PREVIEW_QUALITY = int(os.environ.get('PREVIEW_QUALITY', '80'))
+PNG_COMPRESS_LEVEL = 1
+
+
+def _draw_border(draw, key, fill, width, height):
+    left, right, top, bottom = key
+    bands = [
+        [0, 0, width - 1, top - 1],                 # 上边框
+        [0, bottom + 1, width - 1, height - 1],     # 下边框
+        [0, top, left - 1, bottom],                 # 左边框
+        [right + 1, top, width - 1, bottom],        # 右边框
+    ]
+    for x0, y0, x1, y1 in bands:
+        # 安全区域贴着画布边缘时该侧没有边框
+        if x0 <= x1 and y0 <= y1:
+            draw.rectangle([x0, y0, x1, y1], fill=fill)
+
+
+@lru_cache(maxsize=16)
+def border_overlay(key, size=PREVIEW_SIZE):
+    """
+    生成红色边框 + 绿色安全线叠加层（按安全区域缓存，只绘制一次）
+
+    Args:
+        key: 安全区域元组 (left, right, top, bottom)，见 rule_profiles.safe_area_key
+        size: 叠加层尺寸
+
+    Returns:
+        PIL Image对象（RGBA），调用方不应修改
+    """
+    width, height = size
+    left, right, top, bottom = key
+
+    overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    _draw_border(draw, key, OVERLAY_RED, width, height)
+
+    # 绘制安全区域的绿色边界线
+    draw.line([left, top, right, top], fill=OVERLAY_GREEN, width=2)
+    draw.line([left, bottom, right, bottom], fill=OVERLAY_GREEN, width=2)
+    draw.line([left, top, left, bottom], fill=OVERLAY_GREEN, width=2)
+    draw.line([right, top, right, bottom], fill=OVERLAY_GREEN, width=2)
+
+    return overlay
+
+
+@lru_cache(maxsize=16)
+def template_data_uri(key, size=PREVIEW_SIZE):
+    """
+    生成模板图片（白底 + 红色边框）的 data URI（按安全区域缓存）
+    """
+    width, height = size
+    img = Image.new('RGB', size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    _draw_border(draw, key, TEMPLATE_RED, width, height)
+
+    buffered = BytesIO()
+    img.save(buffered, format='PNG')
+    img_str = base64.b64encode(buffered.getvalue()).decode()
+    return f"data:image/png;base64,{img_str}"
+
+
+def apply_overlay(img, overlay):
+    """
+    将边框叠加层合成到预览图上
+
+    Args:
+        img: 预览图（与叠加层同尺寸）
+        overlay: border_overlay() 生成的叠加层
+
+    Returns:
+        PIL Image对象（RGBA）
+    """
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    return Image.alpha_composite(img, overlay)
+
+
+def normalize_preview_format(preview_format):
+    """
+    规范化预览图格式，未知格式回退到默认格式
+
+    Returns:
+        str: PREVIEW_FORMATS 中的键
+    """
+    preview_format = (preview_format or DEFAULT_PREVIEW_FORMAT).lower()
+    if preview_format not in PREVIEW_FORMATS:
+        preview_format = DEFAULT_PREVIEW_FORMAT if DEFAULT_PREVIEW_FORMAT in PREVIEW_FORMATS else 'png'
+    return preview_format
+
+
+def preview_settings(preview_format=None, quality=None):
+    """
+    规范化预览图编码参数
+
+    Returns:
+        tuple: (preview_format, quality)
+    """
+    try:
+        quality = int(quality) if quality else DEFAULT_PREVIEW_QUALITY
+    except (TypeError, ValueError):
+        quality = DEFAULT_PREVIEW_QUALITY
+    return normalize_preview_format(preview_format), max(1, min(100, quality))
+
+
+def encode_preview_bytes(img, preview_format=None, quality=None):
+    """
+    按指定格式编码预览图
+
+    Args:
+        img: PIL Image对象
+        preview_format: png / webp / jpeg（默认读取 PREVIEW_FORMAT 环境变量）
+        quality: WebP/JPEG 质量 1-100（默认读取 PREVIEW_QUALITY 环境变量）
+
+    Returns:
+        tuple: (bytes, mime_type)
+    """
+    preview_format, quality = preview_settings(preview_format, quality)
+    pil_format, mime = PREVIEW_FORMATS[preview_format]
+
+    buffered = BytesIO()
+    if pil_format == 'PNG':
+        img.save(buffered, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+    elif pil_format == 'WEBP':
+        img.save(buffered, format='WEBP', quality=quality, method=0)
+    else:
+        # JPEG 不支持透明通道，合成到白色背景上
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        img.save(buffered, format='JPEG', quality=quality)
+
+    return buffered.getvalue(), mime
+
+
+def encode_preview(img, preview_format=None, quality=None):
+    """
+    编码预览图为 data URI
+
+    Returns:
+        str: data:<mime>;base64,...
+    """
+    with stage('encode'):
+        data, mime = encode_preview_bytes(img, preview_format, quality)
+    with stage('base64'):
+        return f"data:{mime};base64,{base64.b64encode(data).decode()}"
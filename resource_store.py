@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+临时资源存储模块
+图片以二进制形式短期保存在内存中，响应里只返回可下载的资源 ID，避免 base64 data URI
+
+注意：资源保存在当前进程内存中，Serverless 多实例部署时需要同一实例处理后续下载请求。
+"""
+
+import os
+import time
+import secrets
+import threading
+from collections import OrderedDict
+
+DEFAULT_TTL = int(os.environ.get('RESOURCE_TTL', '300'))                               # 秒
+DEFAULT_MAX_BYTES = int(os.environ.get('RESOURCE_MAX_BYTES', str(256 * 1024 * 1024)))  # 256MB
+
+
+class ResourceStore:
+    """
+    带过期时间和总大小上限的内存资源存储
+
+    超过 ttl 的资源自动失效；总大小超过 max_bytes 时淘汰最早存入的资源。
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # 调用方需持有锁
+        while self._items:
+            resource_id, item = next(iter(self._items.items()))
+            if item['expires'] > now and self._total_bytes <= self.max_bytes:
+                break
+            self._items.popitem(last=False)
+            self._total_bytes -= len(item['data'])
+
+    def put(self, data, mimetype, filename=None):
+        """
+        保存资源
+
+        Args:
+            data: 二进制内容
+            mimetype: MIME 类型
+            filename: 可选，下载文件名
+
+        Returns:
+            str: 资源 ID
+        """
+        resource_id = secrets.token_urlsafe(16)
+        now = time.time()
+        with self._lock:
+            self._items[resource_id] = {
+                'data': data,
+                'mimetype': mimetype,
+                'filename': filename,
+                'expires': now + self.ttl,
+            }
+            self._total_bytes += len(data)
+            self._evict(now)
+        return resource_id
+
+    def get(self, resource_id):
+        """
+        读取资源
+
+        Returns:
+            dict: {data, mimetype, filename}，不存在或已过期时返回 None
+        """
+        with self._lock:
+            self._evict(time.time())
+            item = self._items.get(resource_id)
+        if item is None:
+            return None
+        return {
+            'data': item['data'],
+            'mimetype': item['mimetype'],
+            'filename': item['filename'],
+        }
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+检测规则模板模块
+每个模板定义检测画布尺寸、安全区域、容差和水印判定阈值；模板注册时编译一次：
+越界区域掩码、水印检测区域、车图水印排除掩码都预先生成，
+检测时直接使用，不再按请求重新计算几何信息（预览叠加层和模板图由 preview 按安全区域缓存）
+
+内置模板 default（300x200，安全区 左14 右285 上24 下175）。
+环境变量 RULE_PROFILES_FILE 指向 JSON 文件时加载额外模板，未指定的字段使用默认值，例如：
+    {
+        "wide": {"canvas": [600, 200], "safe_area": {"left": 30, "right": 569, "top": 24, "bottom": 175},
+                 "description": "横幅位"}
+    }
+CPU 进程池的子进程按模板名重新取得模板（同一环境变量），任务参数中只传模板名。
+"""
+
+import os
+import json
+import numpy as np
+from analysis_decode import ANALYSIS_RECHECK_TOLERANCE, ANALYSIS_REDUCE_MARGIN
+from content_bounds import watermark_mask, watermark_region
+from verdict_cache import rules_fingerprint
+
+DEFAULT_PROFILE = 'default'
+RULE_PROFILES_FILE = os.environ.get('RULE_PROFILES_FILE', '')
+
+# 默认检测画布和安全区域
+DEFAULT_CANVAS = (300, 200)
+DEFAULT_SAFE_AREA = {
+    'left': 14,
+    'right': 285,
+    'top': 24,
+    'bottom': 175
+}
+
+# 判定阈值
+VISIBLE_ALPHA = 10        # alpha > 10 视为有内容（越界检测）
+OPAQUE_ALPHA = 200        # alpha > 200 视为不透明（边界框检测）
+OUTWARD_TOLERANCE = 2     # 绿线外允许 2 像素容差
+INWARD_TOLERANCE = 5      # 绿线内允许 5 像素容差
+SAMPLE_LIMIT = 10         # 越界像素样本数量
+FIT_INSET = 7             # 智能适配的缩放目标：安全区宽高各减 7 像素（默认 264x144）
+
+# 水印检测 / 去除配置（右下角白色半透明像素）
+WATERMARK_X_FRACTION = 0.65
+WATERMARK_Y_FRACTION = 0.50
+WATERMARK_ALPHA_MAX = 200
+WATERMARK_BRIGHTNESS_MIN = 250
+WATERMARK_MIN_PIXELS = 20
+
+# 计算车图边界框时排除的水印（右下 1/4 区域内 alpha < 50 的像素）
+CAR_WATERMARK_FRACTION = 0.75
+CAR_WATERMARK_ALPHA_MAX = 50
+
+
+class UnknownProfile(ValueError):
+    """请求的规则模板不存在"""
+
+
+def safe_area_key(safe_area):
+    """
+    安全区域字典转为可哈希的元组（也用作预览叠加层的缓存键）
+
+    Returns:
+        tuple: (left, right, top, bottom)
+    """
+    return (safe_area['left'], safe_area['right'], safe_area['top'], safe_area['bottom'])
+
+
+def zone_masks(width, height, safe_area, tolerance):
+    """
+    计算越界区域掩码
+
+    Returns:
+        tuple: (error_zone, warning_zone) 只读布尔数组，形状为 (height, width)
+    """
+    xs = np.arange(width)
+    ys = np.arange(height)
+    left, right, top, bottom = safe_area_key(safe_area)
+
+    outside_safe_x = (xs < left) | (xs > right)
+    outside_safe_y = (ys < top) | (ys > bottom)
+    outside_tol_x = (xs < left - tolerance) | (xs > right + tolerance)
+    outside_tol_y = (ys < top - tolerance) | (ys > bottom + tolerance)
+
+    outside_safe = outside_safe_y[:, None] | outside_safe_x[None, :]
+    error_zone = outside_tol_y[:, None] | outside_tol_x[None, :]
+    warning_zone = outside_safe & ~error_zone
+
+    error_zone.setflags(write=False)
+    warning_zone.setflags(write=False)
+    return error_zone, warning_zone
+
+
+def error_strips(width, height, safe_area, tolerance):
+    """
+    容差外区域拆分为四条边框带（与 zone_masks 的 error_zone 覆盖相同像素，互不重叠）
+
+    Returns:
+        tuple: ((行切片, 列切片), ...)，只包含非空的边框带
+    """
+    left, right, top, bottom = safe_area_key(safe_area)
+    top_end = min(max(top - tolerance, 0), height)
+    bottom_start = max(min(bottom + tolerance + 1, height), top_end)
+    left_end = min(max(left - tolerance, 0), width)
+    right_start = max(min(right + tolerance + 1, width), left_end)
+
+    strips = (
+        (slice(0, top_end), slice(0, width)),
+        (slice(bottom_start, height), slice(0, width)),
+        # 左右两条不含上下两角（已在上下边框带中）
+        (slice(top_end, bottom_start), slice(0, left_end)),
+        (slice(top_end, bottom_start), slice(right_start, width)),
+    )
+    return tuple((rows, cols) for rows, cols in strips if rows.start < rows.stop and cols.start < cols.stop)
+
+
+class RuleProfile:
+    """
+    一套检测规则（创建时即编译几何信息）
+
+    属性:
+        name / description: 模板名和说明
+        canvas: 检测画布尺寸 (width, height)，图片先缩放到该尺寸再检测
+        safe_area: 安全区域（画布坐标）
+        error_zone / warning_zone: 画布尺寸的越界区域掩码（容差外 / 容差内）
+        error_strips: 容差外区域的四条边框带（快速判定只扫描这些像素）
+        watermark_origin: 画布上水印检测区域的起点 (y, x)
+        car_watermark_region: 画布尺寸的车图水印排除区域掩码
+        fingerprint: 规则指纹（检测结果缓存键的一部分）
+    """
+
+    def __init__(self, name, canvas=DEFAULT_CANVAS, safe_area=None, description='',
+                 visible_alpha=VISIBLE_ALPHA, opaque_alpha=OPAQUE_ALPHA,
+                 outward_tolerance=OUTWARD_TOLERANCE, inward_tolerance=INWARD_TOLERANCE,
+                 sample_limit=SAMPLE_LIMIT, fit_inset=FIT_INSET,
+                 watermark_x_fraction=WATERMARK_X_FRACTION, watermark_y_fraction=WATERMARK_Y_FRACTION,
+                 watermark_alpha_max=WATERMARK_ALPHA_MAX, watermark_brightness_min=WATERMARK_BRIGHTNESS_MIN,
+                 watermark_min_pixels=WATERMARK_MIN_PIXELS,
+                 car_watermark_fraction=CAR_WATERMARK_FRACTION, car_watermark_alpha_max=CAR_WATERMARK_ALPHA_MAX):
+        self.name = name
+        self.description = description
+        self.canvas = (int(canvas[0]), int(canvas[1]))
+        safe_area = safe_area or DEFAULT_SAFE_AREA
+        self.safe_area = {key: int(safe_area[key]) for key in ('left', 'right', 'top', 'bottom')}
+
+        self.visible_alpha = visible_alpha
+        self.opaque_alpha = opaque_alpha
+        self.outward_tolerance = outward_tolerance
+        self.inward_tolerance = inward_tolerance
+        self.sample_limit = sample_limit
+        self.fit_inset = fit_inset
+        self.watermark_x_fraction = watermark_x_fraction
+        self.watermark_y_fraction = watermark_y_fraction
+        self.watermark_alpha_max = watermark_alpha_max
+        self.watermark_brightness_min = watermark_brightness_min
+        self.watermark_min_pixels = watermark_min_pixels
+        self.car_watermark_fraction = car_watermark_fraction
+        self.car_watermark_alpha_max = car_watermark_alpha_max
+
+        self._validate()
+        self._compile()
+
+    def _validate(self):
+        width, height = self.canvas
+        left, right, top, bottom = safe_area_key(self.safe_area)
+        if width <= 0 or height <= 0:
+            raise ValueError(f'规则模板 {self.name}: 画布尺寸无效 {width}x{height}')
+        if not (0 <= left < right < width and 0 <= top < bottom < height):
+            raise ValueError(f'规则模板 {self.name}: 安全区域超出 {width}x{height} 画布')
+        if min(right - left, bottom - top) <= self.fit_inset:
+            raise ValueError(f'规则模板 {self.name}: 安全区域小于智能适配边距 {self.fit_inset}')
+
+    def _compile(self):
+        width, height = self.canvas
+        left, right, top, bottom = safe_area_key(self.safe_area)
+
+        self.error_zone, self.warning_zone = zone_masks(width, height, self.safe_area, self.outward_tolerance)
+        self.error_strips = error_strips(width, height, self.safe_area, self.outward_tolerance)
+        self.watermark_origin = (int(height * self.watermark_y_fraction), int(width * self.watermark_x_fraction))
+        self.car_watermark_region = watermark_region(width, height, self.car_watermark_fraction)
+
+        self.safe_size = (right - left, bottom - top)
+        self.safe_center = ((left + right) // 2, (top + bottom) // 2)
+        self.fit_target = (self.safe_size[0] - self.fit_inset, self.safe_size[1] - self.fit_inset)
+
+        self.fingerprint = rules_fingerprint(self.config(), ANALYSIS_REDUCE_MARGIN, ANALYSIS_RECHECK_TOLERANCE)
+
+    def config(self):
+        """
+        模板的全部规则参数（可 JSON 序列化，/profiles 返回的内容）
+        """
+        return {
+            'canvas': list(self.canvas),
+            'safe_area': dict(self.safe_area),
+            'visible_alpha': self.visible_alpha,
+            'opaque_alpha': self.opaque_alpha,
+            'outward_tolerance': self.outward_tolerance,
+            'inward_tolerance': self.inward_tolerance,
+            'sample_limit': self.sample_limit,
+            'fit_inset': self.fit_inset,
+            'watermark': [self.watermark_x_fraction, self.watermark_y_fraction, self.watermark_alpha_max,
+                          self.watermark_brightness_min, self.watermark_min_pixels],
+            'car_watermark': [self.car_watermark_fraction, self.car_watermark_alpha_max],
+        }
+
+    def car_watermark_mask(self, alpha):
+        """画布尺寸 alpha 数组上的车图水印掩码（计算车图边界框时排除）"""
+        return watermark_mask(alpha, self.car_watermark_region, self.car_watermark_alpha_max)
+
+
+_profiles = {}
+
+
+def register_profile(profile):
+    """
+    注册规则模板（同名模板会被替换）
+
+    Returns:
+        RuleProfile
+    """
+    _profiles[profile.name] = profile
+    return profile
+
+
+def get_profile(name=None):
+    """
+    按名称取得规则模板
+
+    Args:
+        name: 模板名，为空时返回 default
+
+    Raises:
+        UnknownProfile: 模板不存在
+    """
+    name = name or DEFAULT_PROFILE
+    try:
+        return _profiles[name]
+    except KeyError:
+        raise UnknownProfile(f'不支持的规则模板: {name}（可用: {", ".join(_profiles)}）') from None
+
+
+def list_profiles():
+    """所有已注册的模板（按注册顺序）"""
+    return list(_profiles.values())
+
+
+def load_profiles(path):
+    """
+    从 JSON 文件加载规则模板：{模板名: {canvas, safe_area, 其他阈值...}}
+
+    Returns:
+        list: 加载的模板
+    """
+    with open(path, encoding='utf-8') as f:
+        definitions = json.load(f)
+    return [register_profile(RuleProfile(name, **options)) for name, options in definitions.items()]
+
+
+register_profile(RuleProfile(DEFAULT_PROFILE, description='默认模板（300x200）'))
+
+if RULE_PROFILES_FILE:
+    load_profiles(RULE_PROFILES_FILE)
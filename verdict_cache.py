@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+检测结果缓存模块
+按图片内容哈希 + 检测规则配置缓存检测结果：内存 LRU 层 + 本地磁盘层（可选）
+
+磁盘层默认关闭，设置 VERDICT_CACHE_DIR 后启用；最多保存 VERDICT_CACHE_DISK_ENTRIES 个文件，
+超出时按最近使用时间删除最旧的文件。
+"""
+
+import os
+import copy
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+DEFAULT_MEMORY_ENTRIES = int(os.environ.get('VERDICT_CACHE_SIZE', '512'))
+DEFAULT_DISK_DIR = os.environ.get('VERDICT_CACHE_DIR', '')
+DEFAULT_DISK_ENTRIES = int(os.environ.get('VERDICT_CACHE_DISK_ENTRIES', '10000'))
+# 超出上限时删除到上限的该比例，避免每次写入都扫描目录
+DISK_EVICT_RATIO = 0.9
+
+
+def rules_fingerprint(*configs):
+    """
+    计算检测规则配置的指纹（安全区、容差、水印阈值等）
+
+    Args:
+        configs: 任意可 JSON 序列化的配置对象
+
+    Returns:
+        str: 配置指纹（sha256 前 16 位）
+    """
+    raw = json.dumps(configs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def content_key(image_data, fingerprint):
+    """
+    计算缓存键：图片字节哈希 + 规则指纹
+
+    Returns:
+        str: 缓存键（十六进制）
+    """
+    digest = hashlib.sha256(image_data)
+    digest.update(fingerprint.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class VerdictCache:
+    """
+    两层检测结果缓存
+
+    - 内存层：OrderedDict 实现的 LRU，最多 max_entries 条
+    - 磁盘层：disk_dir 下按键前两位分目录存放 JSON 文件，最多 max_disk_entries 个，
+      按文件修改时间（命中时更新）淘汰；disk_dir 为空时禁用
+    - compact: 可选，写入磁盘前精简结果（如去掉预览图），磁盘层命中时返回精简后的结果
+    """
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES, disk_dir=DEFAULT_DISK_DIR,
+                 max_disk_entries=DEFAULT_DISK_ENTRIES, compact=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self.max_disk_entries = max_disk_entries
+        self.compact = compact
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # 磁盘文件数（首次写入时扫描目录得到，之后按写入累加；多进程共用目录时为近似值）
+        self._disk_entries = None
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'disk_evictions': 0,
+        }
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+    def _disk_files(self):
+        """磁盘层的所有缓存文件 [(修改时间, 路径)]"""
+        files = []
+        try:
+            shards = list(os.scandir(self.disk_dir))
+        except OSError:
+            return files
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            try:
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.json'):
+                        try:
+                            files.append((entry.stat().st_mtime, entry.path))
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+        return files
+
+    def _evict_disk(self):
+        """磁盘文件数超过上限时，删除最久未使用的文件（调用方需持有锁）"""
+        if self._disk_entries is None:
+            self._disk_entries = len(self._disk_files())
+        if not self.max_disk_entries or self._disk_entries <= self.max_disk_entries:
+            return
+
+        files = sorted(self._disk_files())
+        keep = int(self.max_disk_entries * DISK_EVICT_RATIO)
+        for _mtime, path in files[:max(0, len(files) - keep)]:
+            try:
+                os.remove(path)
+                self.stats['disk_evictions'] += 1
+            except OSError:
+                pass
+        self._disk_entries = min(len(files), keep)
+
+    def _remember(self, key, value):
+        # 调用方需持有锁
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        查询缓存，命中时返回结果副本，未命中返回 None
+        """
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return copy.deepcopy(value)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+                # 记录最近使用时间（淘汰顺序）
+                os.utime(path)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value)
+                    self.stats['disk_hits'] += 1
+                return copy.deepcopy(value)
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """
+        写入缓存（内存层 + 磁盘层），磁盘写入失败时只保留内存层
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._remember(key, value)
+            self.stats['stores'] += 1
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            stored = self.compact(value) if self.compact is not None else value
+            try:
+                existed = os.path.exists(path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(stored, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError:
+                return
+            with self._lock:
+                if self._disk_entries is not None and not existed:
+                    self._disk_entries += 1
+                self._evict_disk()
+
+    def clear(self):
+        """清空内存层（磁盘层保留）"""
+        with self._lock:
+            self._memory.clear()
+
+    def snapshot(self):
+        """
+        返回缓存统计信息
+
+        Returns:
+            dict: 命中/未命中计数、内存条目数、磁盘目录
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['disk_dir'] = self.disk_dir
+        stats['max_disk_entries'] = self.max_disk_entries if self.disk_dir else None
+        return stats
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+流式 ZIP 打包模块
+逐个条目写入 ZIP 并立即输出数据块，不在内存中保留整个压缩包
+"""
+
+import zipfile
+
+
+class _ChunkSink:
+    """
+    只写、不可 seek 的输出对象：zipfile 会改用数据描述符（data descriptor）写入条目
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def unique_name(filename, used_names):
+    """
+    处理重名：相同文件名追加序号（image.png → image_2.png）
+
+    Args:
+        filename: 原文件名
+        used_names: 已使用文件名的计数字典（会被修改）
+
+    Returns:
+        str: 不重复的文件名
+    """
+    if filename not in used_names:
+        used_names[filename] = 1
+        return filename
+
+    used_names[filename] += 1
+    name, dot, ext = filename.rpartition('.')
+    if not dot:
+        name, ext = filename, ''
+    candidate = f"{name}_{used_names[filename]}{dot}{ext}"
+    return unique_name(candidate, used_names)
+
+
+def iter_zip(entries, compresslevel=1):
+    """
+    流式生成 ZIP 文件
+
+    Args:
+        entries: (文件名, 字节) 的可迭代对象，逐个生成
+        compresslevel: deflate 压缩级别（PNG 已压缩，默认使用最快级别）
+
+    Yields:
+        bytes: ZIP 数据块
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+        for filename, data in entries:
+            zf.writestr(filename, data)
+            yield from sink.drain()
+    yield from sink.drain()